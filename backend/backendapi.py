@@ -1,5 +1,6 @@
 import zipfile
 import io
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Path, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
@@ -7,23 +8,49 @@ from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from pathlib import Path
 import os
+import anyio
 from routers.generate_schema import generate_router
 from routers.customize_schema import customize_router
 from routers.generate_music import generate_music_router
 from routers.generate_album_cover import generate_album_cover_router
 from routers.portfolio import portfolio_router
 from mp3_to_midi import router as mp3_to_midi_router
-from supabase import create_client, Client
+from services.supabase_client import init_supabase, close_supabase, close_async_http_client
+from services.chatCompletion import close_openai_clients, prompt_cache_stats
+from services.audio_cache import audio_cache
+from services.cover_cache import cover_cache
+from services.gemini_models import gemini_models
+from services.image_generation import warm_image_backend
+from services.music_generation import music_jobs
+from services.resilience import provider_stats
 
 env_path = Path(".") / ".env.local"
 load_dotenv(dotenv_path=env_path)
 
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_SECRET_KEY")
-supabase: Client = create_client(url, key)
 elevenlabs_api_key: str = os.environ.get("ELEVENLABS_API_KEY")
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled Supabase client per worker, shared by every router
+    app.state.supabase = init_supabase()
+    # Pick up audio cached before the restart (and enforce the byte budget on it)
+    await anyio.to_thread.run_sync(audio_cache.reindex)
+    # Resolve the Gemini model once, not on every album cover
+    await gemini_models.start()
+    # Authenticate the image generation provider and load its model once, ahead of the first cover
+    await warm_image_backend()
+    # Background workers for final-composition jobs
+    await music_jobs.start()
+    yield
+    await music_jobs.stop()
+    await gemini_models.stop()
+    close_supabase()
+    await close_async_http_client()
+    await close_openai_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(generate_router)
 app.include_router(customize_router)
@@ -53,7 +80,8 @@ class LyricsPrompt(BaseModel):
     prompt: str
 
 
-from services.auth import get_current_user
+from services.auth import get_current_user, token_cache
+from services.llm_cache import llm_cache
 
 MUSIC_DIR = Path(__file__).parent / "music"
 
@@ -66,3 +94,23 @@ async def read_root(user: dict = Depends(get_current_user)):
     }
 
 
+@app.get("/metrics/cache")
+async def cache_metrics(user: dict = Depends(get_current_user)):
+    """Hit/miss counters for the in-process caches and provider prompt-cache token counts."""
+    return {
+        "token_cache": token_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "prompt_cache": prompt_cache_stats(),
+        "audio_cache": audio_cache.stats(),
+        "cover_cache": cover_cache.stats(),
+    }
+
+
+@app.get("/metrics/providers")
+async def provider_metrics(user: dict = Depends(get_current_user)):
+    """Retry, rate-limit and circuit-breaker counters per paid provider, plus the music job queue."""
+    return {
+        "providers": provider_stats(),
+        "music_jobs": music_jobs.stats(),
+        "gemini_models": gemini_models.stats(),
+    }
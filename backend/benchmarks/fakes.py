@@ -0,0 +1,521 @@
+"""
+Local stand-ins for the upstream services the API talks to, used by the benchmark harness.
+
+One FastAPI app serves all of them on a single port:
+- Supabase PostgREST (/rest/v1) backed by in-memory tables, and Storage (/storage/v1)
+  backed by a dict, including resumable (TUS) uploads
+- OpenAI chat completions (/v1/chat/completions), plain JSON and streamed
+- ElevenLabs composition plans (/v1/music/plan) and music.compose (/v1/music), streaming synthetic MP3 frames
+- Gemini model listing and generateContent (/v1beta/models)
+
+Each service has its own latency (seconds, with optional jitter) and error rate, set from the command line:
+
+    python -m benchmarks.fakes --port 9100 --latency openai=0.8 --latency elevenlabs=2 --error-rate elevenlabs=0.05
+"""
+
+import argparse
+import base64
+import hashlib
+import asyncio
+import itertools
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from email.utils import formatdate
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+SERVICES = ("postgrest", "storage", "openai", "elevenlabs", "gemini")
+
+# Path prefix -> service name, checked in order
+SERVICE_PREFIXES = (
+    ("/rest/v1", "postgrest"),
+    ("/storage/v1", "storage"),
+    ("/v1/chat", "openai"),
+    ("/v1/music", "elevenlabs"),
+    ("/v1beta", "gemini"),
+)
+
+# A silent MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, no padding -> 417 bytes, ~26.12 ms of audio
+MP3_FRAME = b"\xff\xfb\x90\x64" + bytes(413)
+MP3_FRAME_MS = 1152 / 44.1
+MP3_CHUNK_FRAMES = 64
+
+DEFAULT_LATENCY = {
+    "postgrest": 0.005,
+    "storage": 0.01,
+    "openai": 0.5,
+    "elevenlabs": 1.0,
+    "gemini": 0.3,
+}
+
+
+class FakeConfig:
+    """Per-service latency and error-rate settings."""
+
+    def __init__(self, latency: dict = None, error_rate: dict = None, jitter: float = 0.2, seed: int = None):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.error_rate = {name: 0.0 for name in SERVICES}
+        self.error_rate.update(error_rate or {})
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def delay(self, service: str) -> float:
+        base = self.latency.get(service, 0.0)
+        if base <= 0:
+            return 0.0
+        return max(0.0, base * (1 + self.random.uniform(-self.jitter, self.jitter)))
+
+    def should_fail(self, service: str) -> bool:
+        return self.random.random() < self.error_rate.get(service, 0.0)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _service_for(path: str):
+    for prefix, service in SERVICE_PREFIXES:
+        if path.startswith(prefix):
+            return service
+    return None
+
+
+def _error_response(service: str) -> Response:
+    if service == "elevenlabs":
+        # Same shape as a real prompt rejection, so the API's prompt_suggestion retry path is exercised
+        return JSONResponse(status_code=422, content={
+            "detail": {"status": "bad_prompt", "message": "Injected fake error", "data": {"prompt_suggestion": "instrumental track"}},
+        })
+    if service == "openai":
+        return JSONResponse(status_code=500, content={"error": {"message": "Injected fake error", "type": "server_error"}})
+    return JSONResponse(status_code=503, content={"message": "Injected fake error"})
+
+
+# --- PostgREST -------------------------------------------------------------------------------------
+
+class Tables:
+    """In-memory rows per table, queried with the subset of PostgREST syntax the repositories use."""
+
+    def __init__(self):
+        self.rows: dict[str, list[dict]] = {}
+        self.ids = itertools.count(1)
+
+    @staticmethod
+    def _filters(params) -> list[tuple[str, str]]:
+        filters = []
+        for key, value in params.multi_items():
+            if key in ("select", "order", "limit", "offset", "columns", "on_conflict"):
+                continue
+            if value.startswith("eq."):
+                filters.append((key, value[3:]))
+        return filters
+
+    @staticmethod
+    def _matches(row: dict, filters) -> bool:
+        return all(str(row.get(key)) == value for key, value in filters)
+
+    def query(self, table: str, params) -> list[dict]:
+        filters = self._filters(params)
+        rows = [row for row in self.rows.get(table, []) if self._matches(row, filters)]
+        order = params.get("order")
+        if order:
+            column, _, direction = order.partition(".")
+            rows.sort(key=lambda r: str(r.get(column)), reverse=direction.startswith("desc"))
+        if params.get("limit"):
+            rows = rows[: int(params["limit"])]
+        return rows
+
+    def insert(self, table: str, body, on_conflict: str = None) -> list[dict]:
+        """Plain insert, or an upsert that ignores duplicates of the `on_conflict` column."""
+        inserted = []
+        for row in body if isinstance(body, list) else [body]:
+            row = dict(row)
+            if on_conflict and any(r.get(on_conflict) == row.get(on_conflict) for r in self.rows.get(table, [])):
+                continue
+            row.setdefault("id", next(self.ids))
+            row.setdefault("created_at", _now())
+            row.setdefault("updated_at", row["created_at"])
+            self.rows.setdefault(table, []).append(row)
+            inserted.append(row)
+        return inserted
+
+    def update(self, table: str, params, fields: dict) -> list[dict]:
+        rows = self.query(table, params)
+        for row in rows:
+            row.update(fields)
+            row["updated_at"] = _now()
+        return rows
+
+    def delete(self, table: str, params) -> list[dict]:
+        rows = self.query(table, params)
+        self.rows[table] = [row for row in self.rows.get(table, []) if row not in rows]
+        return rows
+
+
+def _project(rows: list[dict], select: str) -> list[dict]:
+    if not select or select.strip() == "*":
+        return rows
+    columns = [c.strip() for c in select.split(",") if c.strip()]
+    return [{c: row.get(c) for c in columns} for row in rows]
+
+
+def _postgrest_response(request: Request, rows: list[dict]) -> Response:
+    rows = _project(rows, request.query_params.get("select", "*"))
+    if "vnd.pgrst.object" in request.headers.get("accept", ""):
+        # .single(): exactly one row or a PGRST116 error
+        if len(rows) != 1:
+            return JSONResponse(status_code=406, content={
+                "code": "PGRST116",
+                "message": "JSON object requested, multiple (or no) rows returned",
+                "details": f"The result contains {len(rows)} rows",
+                "hint": None,
+            })
+        return JSONResponse(rows[0])
+    return JSONResponse(rows)
+
+
+# --- Storage ---------------------------------------------------------------------------------------
+
+def _parse_range(header: str, size: int):
+    """(start, end) of a single `bytes=` range, "unsatisfiable", or None to send the whole object."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].partition("-")
+    try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = max(0, size - int(last)), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return "unsatisfiable"
+    return start, min(end, size - 1)
+
+
+# --- OpenAI ----------------------------------------------------------------------------------------
+
+def _fake_plan(seed: str) -> dict:
+    return {
+        "title": f"Benchmark Song {seed[:6]}",
+        "description": "A mid-tempo synthetic track used for load testing.",
+        "positiveGlobalStyles": ["pop", "warm synths", "steady drums"],
+        "negativeGlobalStyles": ["harsh noise"],
+        "lyrics": {
+            "Verse 1": ["Counting requests in the dark", "Every packet leaves a mark"],
+            "Chorus": ["Faster, faster, p95", "Keep the latency alive"],
+        },
+    }
+
+
+def _fake_elevenlabs_plan(length_ms: int = 60000) -> dict:
+    half = length_ms // 2
+    return {
+        "positive_global_styles": ["pop", "warm synths"],
+        "negative_global_styles": ["harsh noise"],
+        "sections": [
+            {"section_name": "Verse 1", "positive_local_styles": ["soft"], "negative_local_styles": [],
+             "duration_ms": half, "lines": ["Counting requests in the dark", "Every packet leaves a mark"]},
+            {"section_name": "Chorus", "positive_local_styles": ["anthemic"], "negative_local_styles": [],
+             "duration_ms": length_ms - half, "lines": ["Faster, faster, p95", "Keep the latency alive"]},
+        ],
+    }
+
+
+def _completion_content(messages: list[dict]) -> str:
+    prompt = " ".join(str(m.get("content", "")) for m in messages).lower()
+    if "integrate the lyrics" in prompt:
+        return json.dumps(_fake_elevenlabs_plan())
+    return json.dumps(_fake_plan(uuid.uuid4().hex))
+
+
+def _usage(prompt: str, completion: str) -> dict:
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = max(1, len(completion) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def _completion_stream(model: str, content: str, usage: dict, pieces: int = 20):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    step = max(1, len(content) // pieces)
+    chunks = [content[i:i + step] for i in range(0, len(content), step)]
+    base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+
+    async def events():
+        for piece in chunks:
+            chunk = {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(0)
+        done = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(done)}\n\n"
+        yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# --- ElevenLabs ------------------------------------------------------------------------------------
+
+def synthetic_mp3(length_ms: int):
+    """Yield chunks of silent MP3 frames covering `length_ms` of audio."""
+    frames = max(1, int(length_ms / MP3_FRAME_MS))
+    for start in range(0, frames, MP3_CHUNK_FRAMES):
+        yield MP3_FRAME * min(MP3_CHUNK_FRAMES, frames - start)
+
+
+# --- App -------------------------------------------------------------------------------------------
+
+def create_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+    tables = Tables()
+    objects: dict[tuple[str, str], tuple[bytes, str]] = {}
+    started_at = formatdate(usegmt=True)
+    uploads: dict[str, dict] = {}
+    calls = {name: {"requests": 0, "errors": 0} for name in SERVICES}
+
+    @app.middleware("http")
+    async def latency_and_errors(request: Request, call_next):
+        service = _service_for(request.url.path)
+        if service is None:
+            return await call_next(request)
+        calls[service]["requests"] += 1
+        delay = config.delay(service)
+        if delay:
+            await asyncio.sleep(delay)
+        if config.should_fail(service):
+            calls[service]["errors"] += 1
+            return _error_response(service)
+        return await call_next(request)
+
+    @app.get("/_fake/stats")
+    async def stats():
+        return {
+            "calls": calls,
+            "rows": {table: len(rows) for table, rows in tables.rows.items()},
+            "objects": len(objects),
+            "object_bytes": sum(len(data) for data, _ in objects.values()),
+        }
+
+    # PostgREST
+    @app.get("/rest/v1/{table}")
+    async def postgrest_select(table: str, request: Request):
+        return _postgrest_response(request, tables.query(table, request.query_params))
+
+    @app.post("/rest/v1/{table}")
+    async def postgrest_insert(table: str, request: Request):
+        return _postgrest_response(request, tables.insert(table, await request.json(), request.query_params.get("on_conflict")))
+
+    @app.patch("/rest/v1/{table}")
+    async def postgrest_update(table: str, request: Request):
+        return _postgrest_response(request, tables.update(table, request.query_params, await request.json()))
+
+    @app.delete("/rest/v1/{table}")
+    async def postgrest_delete(table: str, request: Request):
+        return _postgrest_response(request, tables.delete(table, request.query_params))
+
+    # Storage
+    @app.post("/storage/v1/object/move")
+    async def storage_move(request: Request):
+        body = await request.json()
+        source = (body["bucketId"], body["sourceKey"])
+        if source not in objects:
+            return JSONResponse(status_code=400, content={"statusCode": "404", "error": "not_found", "message": "Object not found"})
+        objects[(body["bucketId"], body["destinationKey"])] = objects.pop(source)
+        return {"message": "Successfully moved"}
+
+    @app.post("/storage/v1/object/{bucket}/{path:path}")
+    @app.put("/storage/v1/object/{bucket}/{path:path}")
+    async def storage_upload(bucket: str, path: str, request: Request):
+        content_type = request.headers.get("content-type", "application/octet-stream")
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form["file"]
+            data = await upload.read()
+            content_type = upload.content_type or "application/octet-stream"
+        else:
+            data = await request.body()
+        if (bucket, path) in objects and request.headers.get("x-upsert") != "true":
+            return JSONResponse(status_code=400, content={"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"})
+        objects[(bucket, path)] = (data, content_type)
+        return {"Key": f"{bucket}/{path}", "Id": str(uuid.uuid4())}
+
+    # Resumable (TUS) uploads
+    @app.post("/storage/v1/upload/resumable")
+    async def resumable_create(request: Request):
+        metadata = {}
+        for item in request.headers.get("upload-metadata", "").split(","):
+            if " " in item:
+                key, value = item.split(" ", 1)
+                metadata[key] = base64.b64decode(value).decode()
+        upload_id = uuid.uuid4().hex
+        uploads[upload_id] = {
+            "bucket": metadata.get("bucketName"),
+            "path": metadata.get("objectName"),
+            "content_type": metadata.get("contentType", "application/octet-stream"),
+            "length": int(request.headers["upload-length"]) if "upload-length" in request.headers else None,
+            "data": bytearray(),
+        }
+        return Response(status_code=201, headers={"Location": f"/storage/v1/upload/resumable/{upload_id}", "Tus-Resumable": "1.0.0"})
+
+    @app.head("/storage/v1/upload/resumable/{upload_id}")
+    async def resumable_offset(upload_id: str):
+        if upload_id not in uploads:
+            return Response(status_code=404)
+        headers = {"Upload-Offset": str(len(uploads[upload_id]["data"])), "Tus-Resumable": "1.0.0"}
+        if uploads[upload_id]["length"] is not None:
+            headers["Upload-Length"] = str(uploads[upload_id]["length"])
+        return Response(status_code=200, headers=headers)
+
+    @app.patch("/storage/v1/upload/resumable/{upload_id}")
+    async def resumable_append(upload_id: str, request: Request):
+        upload = uploads.get(upload_id)
+        if upload is None:
+            return Response(status_code=404)
+        if int(request.headers.get("upload-offset", -1)) != len(upload["data"]):
+            return Response(status_code=409)
+        upload["data"] += await request.body()
+        if "upload-length" in request.headers:
+            upload["length"] = int(request.headers["upload-length"])
+        if upload["length"] is not None and len(upload["data"]) >= upload["length"]:
+            objects[(upload["bucket"], upload["path"])] = (bytes(upload["data"]), upload["content_type"])
+            del uploads[upload_id]
+            return Response(status_code=204, headers={"Upload-Offset": str(upload["length"]), "Tus-Resumable": "1.0.0"})
+        return Response(status_code=204, headers={"Upload-Offset": str(len(upload["data"])), "Tus-Resumable": "1.0.0"})
+
+    @app.delete("/storage/v1/upload/resumable/{upload_id}")
+    async def resumable_terminate(upload_id: str):
+        uploads.pop(upload_id, None)
+        return Response(status_code=204)
+
+    @app.api_route("/storage/v1/object/{bucket}/{path:path}", methods=["GET", "HEAD"])
+    async def storage_download(bucket: str, path: str, request: Request):
+        if bucket in ("authenticated", "public"):
+            # /object/authenticated/{bucket}/{path} and /object/public/{bucket}/{path}
+            bucket, _, path = path.partition("/")
+        if (bucket, path) not in objects:
+            return JSONResponse(status_code=400, content={"statusCode": "404", "error": "not_found", "message": "Object not found"})
+        data, content_type = objects[(bucket, path)]
+        headers = {"ETag": f'"{hashlib.md5(data).hexdigest()}"', "Last-Modified": started_at, "Accept-Ranges": "bytes"}
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+        byte_range = _parse_range(request.headers.get("range"), len(data))
+        if byte_range == "unsatisfiable":
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+            return Response(content=data[start:end + 1], status_code=206, media_type=content_type, headers=headers)
+        return Response(content=data, media_type=content_type, headers=headers)
+
+    @app.delete("/storage/v1/object/{bucket}")
+    async def storage_remove(bucket: str, request: Request):
+        removed = []
+        for path in (await request.json()).get("prefixes", []):
+            if objects.pop((bucket, path), None) is not None:
+                removed.append({"name": path, "bucket_id": bucket})
+        return removed
+
+    # OpenAI
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-4o")
+        messages = body.get("messages", [])
+        content = _completion_content(messages)
+        usage = _usage("".join(str(m.get("content", "")) for m in messages), content)
+        if body.get("stream"):
+            return _completion_stream(model, content, usage)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    # ElevenLabs
+    @app.post("/v1/music/plan")
+    async def composition_plan_create(request: Request):
+        body = await request.json()
+        return _fake_elevenlabs_plan(int(body.get("music_length_ms") or 60000))
+
+    @app.post("/v1/music")
+    @app.post("/v1/music/stream")
+    async def music_compose(request: Request):
+        body = await request.json()
+        length_ms = int(body.get("music_length_ms") or 60000)
+        return StreamingResponse(synthetic_mp3(length_ms), media_type="audio/mpeg")
+
+    # Gemini
+    @app.get("/v1beta/models")
+    async def gemini_list_models():
+        return {"models": [{
+            "name": "models/gemini-1.5-flash",
+            "displayName": "Gemini 1.5 Flash",
+            "supportedGenerationMethods": ["generateContent", "countTokens"],
+        }]}
+
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini_generate_content(model_action: str):
+        return {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": "A neon skyline over a calm sea at dusk, drawn in bold flat colors."}]},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {"promptTokenCount": 120, "candidatesTokenCount": 20, "totalTokenCount": 140},
+        }
+
+    return app
+
+
+def parse_service_values(items: list[str], option: str) -> dict:
+    """Parse repeated `service=value` options."""
+    values = {}
+    for item in items or []:
+        name, sep, value = item.partition("=")
+        if not sep or name not in SERVICES:
+            raise SystemExit(f"{option} expects service=value with service in {', '.join(SERVICES)}, got {item!r}")
+        values[name] = float(value)
+    return values
+
+
+def add_fake_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", action="append", metavar="SERVICE=SECONDS", help="Mean latency per service")
+    parser.add_argument("--error-rate", action="append", metavar="SERVICE=RATE", help="Fraction of failed calls per service")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Uniform latency jitter as a fraction of the mean")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args) -> FakeConfig:
+    return FakeConfig(
+        latency=parse_service_values(args.latency, "--latency"),
+        error_rate=parse_service_values(args.error_rate, "--error-rate"),
+        jitter=args.jitter,
+        seed=args.seed,
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+"""
+Offline load test for the API.
+
+Starts the upstream fakes (benchmarks/fakes.py) and `uvicorn backendapi:app` pointed at them, then drives
+the main user flows at a fixed concurrency and reports latency percentiles, throughput and server memory
+per flow as JSON. No paid API is contacted.
+
+From the backend/ directory:
+
+    python -m benchmarks.run --requests 50 --concurrency 10 --output bench.json
+    python -m benchmarks.run --latency openai=1.5 --error-rate elevenlabs=0.1 --flows plans,compare
+    python -m benchmarks.run --baseline bench.json --max-regression 0.2   # exit 1 on regressions
+
+Flows run in order, each using what the previous ones created:
+    plans    POST /generate/composition-plan           (two candidates per run)
+    compare  POST /customize/compare-compositions
+    final    POST /generate-music/generate-final-composition, then its job events until it finishes
+    audio    GET  /generate-music/audio/{filename}
+    zip      GET  /generate-music/download-run/{run_id}
+    midi     POST /convert/mp3-to-midi                  (needs basic-pitch; a short generated WAV clip)
+    cover    POST /generate-album-cover/generate        (opt-in; Gemini is faked, image generation is not)
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import wave
+from pathlib import Path
+
+import httpx
+import jwt
+
+from benchmarks.fakes import add_fake_arguments
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+FLOWS = ("plans", "compare", "final", "audio", "zip", "midi", "cover")
+DEFAULT_FLOWS = FLOWS[:-1]
+
+JWT_SECRET = "benchmark-secret-benchmark-secret-benchmark"
+USER_ID = "00000000-0000-4000-8000-000000000001"
+
+MEMORY_SAMPLE_INTERVAL = 0.05
+STARTUP_TIMEOUT = 60
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def mint_token(user_id: str = USER_ID, ttl: int = 3600) -> str:
+    now = int(time.time())
+    claims = {
+        "sub": user_id,
+        "email": "bench@example.com",
+        "aud": "authenticated",
+        "role": "authenticated",
+        "iat": now,
+        "exp": now + ttl,
+    }
+    return jwt.encode(claims, JWT_SECRET, algorithm="HS256")
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _children(pid: int) -> list[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except (FileNotFoundError, PermissionError):
+        return []
+
+
+def rss_mb(pid: int) -> float:
+    """Resident set size of `pid` and its children (uvicorn workers) in MiB, from /proc or ps."""
+    try:
+        total_kb = 0
+        for proc in [pid, *_children(pid)]:
+            with open(f"/proc/{proc}/status") as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        return total_kb / 1024
+    except (FileNotFoundError, StopIteration):
+        pass
+    try:
+        out = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True).stdout
+        return int(out.strip()) / 1024
+    except (ValueError, OSError):
+        return 0.0
+
+
+def tone_wav(seconds: float = 2.0, freq: float = 440.0, rate: int = 22050) -> bytes:
+    """A short mono sine tone; decodable by basic-pitch without an MP3 encoder."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        frames = b"".join(
+            struct.pack("<h", int(12000 * math.sin(2 * math.pi * freq * i / rate)))
+            for i in range(int(seconds * rate))
+        )
+        w.writeframes(frames)
+    return buf.getvalue()
+
+
+class MemorySampler:
+    """Samples the server's RSS in the background and reports start/end/peak for each flow."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, rss_mb(self.pid))
+            await asyncio.sleep(MEMORY_SAMPLE_INTERVAL)
+
+    async def __aenter__(self):
+        self.start = rss_mb(self.pid)
+        self.peak = self.start
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        self.end = rss_mb(self.pid)
+        self.peak = max(self.peak, self.end)
+
+    def report(self) -> dict:
+        return {"start": round(self.start, 1), "end": round(self.end, 1), "peak": round(self.peak, 1)}
+
+
+async def run_flow(name: str, endpoint: str, jobs: list, concurrency: int, pid: int) -> tuple[dict, list]:
+    """
+    Run `jobs` (zero-argument coroutine functions returning (status, result)) with at most `concurrency`
+    in flight. Returns the flow report and the results of successful jobs.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, status_codes, results, errors = [], {}, [], []
+
+    async def one(job):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                status, result = await job()
+            except httpx.HTTPError as e:
+                status, result = type(e).__name__, None
+            latencies.append(time.perf_counter() - started)
+            status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+            if status == 200:
+                results.append(result)
+            elif len(errors) < 5:
+                errors.append(str(result)[:300])
+
+    async with MemorySampler(pid) as memory:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(job) for job in jobs))
+        duration = time.perf_counter() - started
+
+    latencies.sort()
+    report = {
+        "endpoint": endpoint,
+        "requests": len(jobs),
+        "ok": len(results),
+        "errors": len(jobs) - len(results),
+        "status_codes": status_codes,
+        "duration_s": round(duration, 3),
+        "rps": round(len(jobs) / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+        "memory_mb": memory.report(),
+    }
+    if errors:
+        report["sample_errors"] = errors
+    print(f"{name:8s} {report['ok']}/{report['requests']} ok  {report['rps']} rps  "
+          f"p50={report['latency_ms']['p50']}ms p95={report['latency_ms']['p95']}ms  "
+          f"rss={report['memory_mb']['peak']}MB", file=sys.stderr)
+    return report, results
+
+
+def _result(response: httpx.Response):
+    if response.status_code != 200:
+        return response.status_code, response.text
+    if response.headers.get("content-type", "").startswith("application/json"):
+        return 200, response.json()
+    return 200, len(response.content)
+
+
+async def drive(base_url: str, fakes_url: str, pid: int, flows: list[str], requests: int, concurrency: int) -> dict:
+    headers = {"Authorization": f"Bearer {mint_token()}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    reports = {}
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=600) as client:
+        async def post(path, **kwargs):
+            return _result(await client.post(path, **kwargs))
+
+        async def get(path):
+            return _result(await client.get(path))
+
+        async def run_job(path, **kwargs):
+            """Submit a background job and follow its SSE events; succeeds with the job result."""
+            response = await client.post(path, **kwargs)
+            if response.status_code != 202:
+                return response.status_code, response.text
+            async with client.stream("GET", response.json()["events_url"]) as events:
+                event = None
+                async for line in events.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: ") and event in ("complete", "error"):
+                        data = json.loads(line[len("data: "):])
+                        return (200, data["result"]) if event == "complete" else ("job_failed", data["detail"])
+            return "job_lost", None
+
+        run_ids = [f"bench-{uuid.uuid4().hex[:12]}" for _ in range(max(1, requests // 2))]
+        plans, finals = [], []
+
+        if "plans" in flows:
+            def plan_job(run_id, i):
+                body = {"user_prompt": f"A song about load testing #{i}", "styles": ["pop"], "lyrics_exists": True,
+                        "user_id": USER_ID, "run_id": run_id}
+                return lambda: post("/generate/composition-plan", json=body)
+
+            jobs = [plan_job(run_ids[i % len(run_ids)], i) for i in range(requests)]
+            reports["plans"], plans = await run_flow("plans", "POST /generate/composition-plan", jobs, concurrency, pid)
+            plans = [p for p in plans if p.get("id") is not None]
+
+        if "compare" in flows:
+            by_run = {}
+            for plan in plans:
+                by_run.setdefault(plan["run_id"], []).append(plan["id"])
+            pairs = [(run_id, ids[0], ids[1]) for run_id, ids in by_run.items() if len(ids) >= 2]
+
+            def compare_job(run_id, first, second):
+                body = {"composition_plan_1_id": first, "composition_plan_2_id": second, "composition_plan_1_better": True,
+                        "user_id": USER_ID, "run_id": run_id}
+                return lambda: post("/customize/compare-compositions", json=body)
+
+            jobs = [compare_job(*pairs[i % len(pairs)]) for i in range(requests)] if pairs else []
+            reports["compare"], _ = await run_flow("compare", "POST /customize/compare-compositions", jobs, concurrency, pid)
+
+        if "final" in flows:
+            def final_job(plan):
+                body = {"composition_plan_id": plan["id"], "user_id": USER_ID, "run_id": plan["run_id"]}
+                return lambda: run_job("/generate-music/generate-final-composition", json=body)
+
+            jobs = [final_job(plan) for plan in plans[:requests]]
+            reports["final"], finals = await run_flow("final", "POST /generate-music/generate-final-composition", jobs, concurrency, pid)
+
+        if "audio" in flows:
+            filenames = [f["audio_filename"] for f in finals if f.get("audio_filename")]
+            jobs = [(lambda name=filenames[i % len(filenames)]: get(f"/generate-music/audio/{name}")) for i in range(requests)] if filenames else []
+            reports["audio"], _ = await run_flow("audio", "GET /generate-music/audio/{filename}", jobs, concurrency, pid)
+
+        if "zip" in flows:
+            runs = sorted({plan["run_id"] for plan in plans})
+            jobs = [(lambda run_id=runs[i % len(runs)]: get(f"/generate-music/download-run/{run_id}")) for i in range(requests)] if runs else []
+            reports["zip"], _ = await run_flow("zip", "GET /generate-music/download-run/{run_id}", jobs, concurrency, pid)
+
+        if "midi" in flows:
+            clip = tone_wav()
+            jobs = [
+                (lambda: post("/convert/mp3-to-midi", files=[("files", ("bench.wav", clip, "audio/wav"))]))
+                for _ in range(requests)
+            ]
+            reports["midi"], _ = await run_flow("midi", "POST /convert/mp3-to-midi", jobs, concurrency, pid)
+
+        if "cover" in flows:
+            jobs = [
+                (lambda i=i: post("/generate-album-cover/generate", json={"title": f"Benchmark Song {i}", "description": "Synthetic pop"}))
+                for i in range(requests)
+            ]
+            reports["cover"], _ = await run_flow("cover", "POST /generate-album-cover/generate", jobs, concurrency, pid)
+
+    fake_stats = httpx.get(fakes_url + "/_fake/stats").json()
+    return {"flows": reports, "fakes": fake_stats}
+
+
+def wait_until_up(url: str, process: subprocess.Popen, name: str) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{name} exited during startup with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit(f"{name} did not start within {STARTUP_TIMEOUT}s")
+
+
+def app_env(fakes_url: str, workdir: Path, llm_cache: bool) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": fakes_url,
+        "SUPABASE_SECRET_KEY": "benchmark-service-key",
+        "AUTH_VERIFY_MODE": "local",
+        "AUTH_REMOTE_FALLBACK": "false",
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{fakes_url}/v1",
+        "ELEVENLABS_API_KEY": "benchmark",
+        "ELEVENLABS_BASE_URL": fakes_url,
+        "GEMINI_API_KEY": "benchmark",
+        "GEMINI_API_ENDPOINT": fakes_url,
+        "MUSIC_DIR": str(workdir / "music"),
+        "LLM_CACHE_ENABLED": "true" if llm_cache else "false",
+        "LLM_CACHE_PATH": str(workdir / "llm_cache.sqlite3"),
+        "AUDIO_CACHE_DIR": str(workdir / "audio_cache"),
+        "MUSIC_JOB_JOURNAL_PATH": str(workdir / "job_journal.sqlite3"),
+        "PYTHONUNBUFFERED": "1",
+    })
+    # Every request comes from one benchmark user, so lift the per-user cap unless set explicitly
+    env.setdefault("MUSIC_JOB_MAX_PENDING_PER_USER", "1000")
+    # Provider rate limits are sized for real plans; the fakes are not the bottleneck being measured
+    for prefix in ("ELEVENLABS", "OPENAI", "GEMINI"):
+        env.setdefault(f"{prefix}_REQUESTS_PER_MINUTE", "60000")
+        env.setdefault(f"{prefix}_BURST", "1000")
+    # The fakes return the same plan for every song, which would turn every compose after the first into a
+    # reuse of stored audio; measure composing unless asked otherwise
+    env.setdefault("MUSIC_DEDUPE_RENDERS", "false")
+    # Never let the app fall back to real Vertex AI from the developer's environment
+    env.pop("GOOGLE_CLOUD_PROJECT_ID", None)
+    return env
+
+
+def fake_args(args) -> list[str]:
+    out = ["--jitter", str(args.jitter)]
+    for item in args.latency or []:
+        out += ["--latency", item]
+    for item in args.error_rate or []:
+        out += ["--error-rate", item]
+    if args.seed is not None:
+        out += ["--seed", str(args.seed)]
+    return out
+
+
+def regressions(current: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Flows whose p95 latency grew, or whose throughput dropped, by more than `max_regression`."""
+    found = []
+    for name, report in current["flows"].items():
+        before = baseline.get("flows", {}).get(name)
+        if not before or not report["requests"]:
+            continue
+        p95, p95_before = report["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if p95_before and p95 > p95_before * (1 + max_regression):
+            found.append(f"{name}: p95 {p95_before}ms -> {p95}ms")
+        rps, rps_before = report["rps"], before["rps"]
+        if rps_before and rps < rps_before * (1 - max_regression):
+            found.append(f"{name}: rps {rps_before} -> {rps}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per flow")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--flows", default=",".join(DEFAULT_FLOWS), help=f"Comma-separated subset of {','.join(FLOWS)}")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the API under test")
+    parser.add_argument("--llm-cache", action="store_true", help="Enable the LLM response cache in the API")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative p95/RPS regression")
+    parser.add_argument("--show-server-logs", action="store_true")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+
+    flows = [f.strip() for f in args.flows.split(",") if f.strip()]
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        raise SystemExit(f"Unknown flows: {', '.join(sorted(unknown))}")
+
+    fakes_port, app_port = free_port(), free_port()
+    fakes_url = f"http://127.0.0.1:{fakes_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    server_output = None if args.show_server_logs else subprocess.DEVNULL
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        workdir = Path(tmp)
+        (workdir / "music").mkdir()
+        processes = []
+        try:
+            fakes = subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.fakes", "--port", str(fakes_port), *fake_args(args)],
+                cwd=BACKEND_DIR, stdout=server_output, stderr=server_output,
+            )
+            processes.append(fakes)
+            wait_until_up(fakes_url + "/_fake/stats", fakes, "fakes")
+
+            app = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "backendapi:app", "--port", str(app_port),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=app_env(fakes_url, workdir, args.llm_cache), stdout=server_output, stderr=server_output,
+            )
+            processes.append(app)
+            wait_until_up(app_url + "/docs", app, "backendapi")
+
+            report = asyncio.run(drive(app_url, fakes_url, app.pid, flows, args.requests, args.concurrency))
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report["config"] = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "flows": flows,
+        "llm_cache": args.llm_cache,
+        "latency": args.latency or [],
+        "error_rate": args.error_rate or [],
+        "jitter": args.jitter,
+        "python": sys.version.split()[0],
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        found = regressions(report, json.loads(Path(args.baseline).read_text()), args.max_regression)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,28 +4,24 @@ Customize a composition plan by pairwise comparison of compositions.
 
 import os
 import json
+import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
 import pydantic
-from fastapi import APIRouter, HTTPException, Depends
-from supabase import create_client, Client
+from fastapi import APIRouter, HTTPException, Depends, Request
 
-from services.chatCompletion import chat_completion_json
+from services.chatCompletion import achat_completion_json
 from services.auth import get_current_user
+from services.repositories import CompositionPlanRepository, get_composition_plans
 
 
 from services.prompts import (
-    GENERATE_IMPROVED_SCHEMA_WITH_LYRICS_SYSTEM_PROMPT,
-    GENERATE_IMPROVED_SCHEMA_WITH_LYRICS_USER_PROMPT,
-    GENERATE_IMPROVED_SCHEMA_WITHOUT_LYRICS_SYSTEM_PROMPT,
-    GENERATE_IMPROVED_SCHEMA_WITHOUT_LYRICS_USER_PROMPT
+    IMPROVED_SCHEMA_WITH_LYRICS_PROMPT,
+    IMPROVED_SCHEMA_WITHOUT_LYRICS_PROMPT,
 )
 env_path = Path("../.") / ".env.local"
 load_dotenv(dotenv_path=env_path)
 
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_SECRET_KEY")
-supabase: Client = create_client(url, key)
 
 customize_router = APIRouter(prefix="/customize", tags=["customize"])
 
@@ -39,7 +35,7 @@ class ComparingComposition(BaseModel):
     run_id: str
 
 @customize_router.post("/compare-compositions")
-async def compare_compositions(req: ComparingComposition, user: dict = Depends(get_current_user)):
+async def compare_compositions(req: ComparingComposition, request: Request, user: dict = Depends(get_current_user), plans: CompositionPlanRepository = Depends(get_composition_plans)):
     # Verify that the user_id in the request matches the authenticated user
     if req.user_id != user["user_id"]:
         raise HTTPException(status_code=403, detail="User ID in request does not match authenticated user")
@@ -53,15 +49,16 @@ async def compare_compositions(req: ComparingComposition, user: dict = Depends(g
     
     # Fetch both composition plans from Supabase
     try:
-        better_response = supabase.table("composition_plans").select("*").eq("id", better_id).execute()
-        worse_response = supabase.table("composition_plans").select("composition_plan").eq("id", worse_id).execute()
+        better_plan_data, worse_plan_data = await asyncio.gather(
+            plans.get(better_id),
+            plans.get(worse_id, columns="composition_plan"),
+        )
         
-        if not better_response.data or not worse_response.data:
+        if not better_plan_data or not worse_plan_data:
             raise HTTPException(status_code=404, detail="One or both composition plans not found")
         
-        better_plan_data = better_response.data[0]
         composition_plan_better = better_plan_data["composition_plan"]
-        composition_plan_worse = worse_response.data[0]["composition_plan"]
+        composition_plan_worse = worse_plan_data["composition_plan"]
         
         # Copy user_prompt, user_styles, and lyrics_exists from the better plan
         user_prompt = better_plan_data.get("user_prompt")
@@ -71,16 +68,17 @@ async def compare_compositions(req: ComparingComposition, user: dict = Depends(g
         raise HTTPException(status_code=500, detail=f"Error fetching composition plans: {str(e)}")
 
     # Generate a new improved composition plan based on the comparison
-    if lyrics_exists:
-        new_composition_plan = chat_completion_json(
-            system_prompt=GENERATE_IMPROVED_SCHEMA_WITH_LYRICS_SYSTEM_PROMPT,
-            user_prompt=GENERATE_IMPROVED_SCHEMA_WITH_LYRICS_USER_PROMPT.replace("{COMPOSITION_PLAN_BETTER}", json.dumps(composition_plan_better)).replace("{COMPOSITION_PLAN_WORSE}", json.dumps(composition_plan_worse))
-        )
-    else:
-        new_composition_plan = chat_completion_json(
-            system_prompt=GENERATE_IMPROVED_SCHEMA_WITHOUT_LYRICS_SYSTEM_PROMPT,
-            user_prompt=GENERATE_IMPROVED_SCHEMA_WITHOUT_LYRICS_USER_PROMPT.replace("{COMPOSITION_PLAN_BETTER}", json.dumps(composition_plan_better)).replace("{COMPOSITION_PLAN_WORSE}", json.dumps(composition_plan_worse))
-        )
+    prompt = IMPROVED_SCHEMA_WITH_LYRICS_PROMPT if lyrics_exists else IMPROVED_SCHEMA_WITHOUT_LYRICS_PROMPT
+    llm_system_prompt, llm_user_prompt = prompt.render(
+        COMPOSITION_PLAN_BETTER=json.dumps(composition_plan_better),
+        COMPOSITION_PLAN_WORSE=json.dumps(composition_plan_worse),
+    )
+    new_composition_plan = await achat_completion_json(
+        system_prompt=llm_system_prompt,
+        user_prompt=llm_user_prompt,
+        request=request,
+        cache_endpoint="compare-compositions"
+    )
     # Save the new composition plan to Supabase
     # Copy user_prompt, user_styles, lyrics_exists is False, and lyrics_exists from the better plan
     saved_id = None
@@ -100,8 +98,8 @@ async def compare_compositions(req: ComparingComposition, user: dict = Depends(g
         if lyrics_exists is not None:
             insert_data["lyrics_exists"] = lyrics_exists
         
-        response = supabase.table("composition_plans").insert(insert_data).execute()
-        saved_id = response.data[0]["id"] if response.data else None
+        saved = await plans.insert(insert_data)
+        saved_id = saved["id"] if saved else None
     except Exception as e:
         print(f"Error saving to Supabase: {e}")
         raise HTTPException(status_code=500, detail=f"Error saving new composition plan: {str(e)}")
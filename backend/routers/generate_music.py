@@ -2,39 +2,37 @@
 Generate music from a composition plan.
 """
 
+import asyncio
 import os
-import json
-import uuid
-import io
-import zipfile
-from pathlib import Path
-from dotenv import load_dotenv
+from urllib.parse import quote
 import pydantic
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import FileResponse, Response, StreamingResponse
-from supabase import create_client, Client
-from elevenlabs import ElevenLabs
-from services.chatCompletion import chat_completion_json
+from typing import Optional
+import anyio
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from services.audio_cache import audio_cache
+from services.audio_delivery import local_audio_response, storage_audio_response
 from services.auth import get_current_user
-import traceback
-from services.prompts import GENERATE_LYRICS_SYSTEM_PROMPT, GENERATE_LYRICS_USER_PROMPT, GENERATE_PROMPT_FOR_ELEVENLABS_COMPOSITION_PLAN
-env_path = Path("../.") / ".env.local"
-load_dotenv(dotenv_path=env_path)
-
-# Song duration: 1 minute
-length_ms = 1 * 60 * 1000  # 60_000 ms
-
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_SECRET_KEY")
-
-supabase: Client = create_client(url, key)
-elevenlabs_api_key: str = os.environ.get("ELEVENLABS_API_KEY")
-
-if not elevenlabs_api_key:
-    raise ValueError("ELEVENLABS_API_KEY not found in environment variables")
+from services.jobs import IdempotencyConflict, QueueFull
+from services.music_generation import MUSIC_DIR, audio_broadcast, music_jobs
+from services.repositories import (
+    CompositionPlanRepository,
+    FinalCompositionRepository,
+    StorageRepository,
+    get_composition_plans,
+    get_final_compositions,
+    get_music_storage,
+)
+from services.sse import format_sse, sse_response
+from services.zip_stream import prefetch, stream_zip
 
 generate_music_router = APIRouter(prefix="/generate-music", tags=["generate-music"])
-elevenlabs = ElevenLabs(api_key=elevenlabs_api_key)
+
+# How often an SSE stream re-reads the journal for a job owned by another worker process
+JOB_POLL_INTERVAL_SECONDS = float(os.environ.get("MUSIC_JOB_POLL_INTERVAL_SECONDS", "1"))
+# Tracks downloaded ahead of the one being written to a run's zip
+ZIP_PREFETCH_CONCURRENCY = int(os.environ.get("ZIP_PREFETCH_CONCURRENCY", "4"))
+ZIP_READ_SIZE = 256 * 1024
 
 BaseModel = pydantic.BaseModel
 
@@ -42,182 +40,217 @@ class GenerateFinalComposition(BaseModel):
     composition_plan_id: int
     user_id: str
     run_id: str
+    # Render a short clip of the chorus instead of the full track; see /jobs/{job_id}/promote
+    preview: bool = False
 
-# Ensure music directory exists
-MUSIC_DIR = Path(__file__).parent.parent / "music"
-MUSIC_DIR.mkdir(exist_ok=True)
-
-async def lyrics_substitution(composition_plan: dict, composition_plan_from_elevenlabs: dict):        
-        composition_plan_from_elevenlabs_str = str(composition_plan_from_elevenlabs)
-        composition_plan_str = str(composition_plan)
-        lyrics_dictionary_str = str(composition_plan['lyrics'])
-        description_str = str(composition_plan['description'])
-        # Use AI to substitute lyrics
-        system_prompt = GENERATE_LYRICS_SYSTEM_PROMPT.replace("{composition_plan_from_elevenlabs}", composition_plan_from_elevenlabs_str).replace("{lyrics_dictionary}", lyrics_dictionary_str).replace("{description}", description_str)
-        user_prompt = GENERATE_LYRICS_USER_PROMPT
-        print("SYSTEM PROMPT: ", system_prompt)
-        print("USER PROMPT: ", user_prompt)
-
-        updated_plan = chat_completion_json(system_prompt=system_prompt, user_prompt=user_prompt)
-        return updated_plan
-
-@generate_music_router.post("/generate-final-composition")
-async def generate_final_composition_endpoint(req: GenerateFinalComposition, user: dict = Depends(get_current_user)):
+
+async def _require_plan(plans: CompositionPlanRepository, composition_plan_id: int, user_id: str) -> None:
+    # Report other users' plans as missing rather than forbidden, before anything is queued
+    if not await plans.get(composition_plan_id, user_id=user_id, columns="id"):
+        raise HTTPException(status_code=404, detail="Composition plan not found")
+
+
+async def _submit_job(
+    response: Response,
+    user_id: str,
+    payload: dict,
+    idempotency_key: Optional[str],
+    checkpoints: Optional[dict] = None,
+) -> dict:
+    try:
+        if idempotency_key:
+            snapshot, created = await music_jobs.submit_once(user_id, payload, idempotency_key, checkpoints=checkpoints)
+            if not created:
+                response.headers["Idempotent-Replayed"] = "true"
+        else:
+            snapshot = (await music_jobs.submit(user_id, payload, checkpoints=checkpoints)).snapshot()
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    job_id = snapshot["job_id"]
+    return {
+        **snapshot,
+        "status_url": f"/generate-music/jobs/{job_id}",
+        "events_url": f"/generate-music/jobs/{job_id}/events",
+        "audio_url": f"/generate-music/jobs/{job_id}/audio",
+    }
+
+
+@generate_music_router.post("/generate-final-composition", status_code=202)
+async def generate_final_composition_endpoint(
+    req: GenerateFinalComposition,
+    response: Response,
+    user: dict = Depends(get_current_user),
+    plans: CompositionPlanRepository = Depends(get_composition_plans),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+):
+    """
+    Queue generation of the final music composition for a composition plan and return the job id right away.
+    Follow progress with GET /generate-music/jobs/{job_id} or its /events stream; the finished job's result
+    holds the saved composition id and audio filename.
+    With an Idempotency-Key header, repeating the request (e.g. after a timeout) returns the job the first
+    request created, marked with an Idempotent-Replayed header, instead of generating the song again.
+    With `preview`, only a short clip of the chorus is composed (no cover, nothing saved to the run), which
+    plays from the job's audio_url; promote it with POST /generate-music/jobs/{job_id}/promote.
+    """
     # Verify that the user_id in the request matches the authenticated user
     if req.user_id != user["user_id"]:
         raise HTTPException(status_code=403, detail="User ID in request does not match authenticated user")
-    """Generate final music composition from a composition plan and save to Supabase and local storage."""
-    try:
-        # Fetch composition plan from Supabase
-        response = supabase.table("composition_plans").select("composition_plan").eq("id", req.composition_plan_id).execute()
-        
-        if not response.data:
-            raise HTTPException(status_code=404, detail="Composition plan not found")
-        
-        composition_plan = response.data[0]["composition_plan"]
+    await _require_plan(plans, req.composition_plan_id, user["user_id"])
 
-        title = str(composition_plan['title'])
-        description = str(composition_plan['description'])
-        positiveGlobalStyles = str(composition_plan['positiveGlobalStyles'])
-        negativeGlobalStyles = str(composition_plan['negativeGlobalStyles'])
+    payload = {"composition_plan_id": req.composition_plan_id, "run_id": req.run_id}
+    if req.preview:
+        payload["preview"] = True
+    return await _submit_job(response, user["user_id"], payload, idempotency_key)
 
-        prompt_for_elevenlabs = GENERATE_PROMPT_FOR_ELEVENLABS_COMPOSITION_PLAN.replace("{title}", title).replace("{description}", description).replace("{positiveGlobalStyles}", positiveGlobalStyles).replace("{negativeGlobalStyles}", negativeGlobalStyles)
-        
-        while True:
-            try:
-                composition_plan_elevenlabs = elevenlabs.music.composition_plan.create(
-                    prompt=prompt_for_elevenlabs,
-                    music_length_ms=length_ms,
-                )
-                break
-            except Exception as e:
-                error_msg = str(e)
-                print("ERROR: ", error_msg)
-                try:
-                    prompt_for_elevenlabs = e.body.get("detail", {}).get("data", {}).get("prompt_suggestion", prompt_for_elevenlabs)
-                except Exception:
-                    raise
-        # Convert composition_plan_elevenlabs to dict if it's a MusicPrompt object
-        if not isinstance(composition_plan_elevenlabs, dict):
-            composition_plan_elevenlabs = composition_plan_elevenlabs.model_dump()
-        
-        if 'lyrics' in composition_plan:
-            updated_plan = await lyrics_substitution(composition_plan, composition_plan_elevenlabs)
-        else:
-            updated_plan = composition_plan_elevenlabs
-        # Generate music using ElevenLabs
-        i = 0
-        while True:
-            try:
-                if i == 0:
-                    track = elevenlabs.music.compose(
-                        prompt=json.dumps(updated_plan),
-                        music_length_ms=length_ms)
-                else:
-                    track = elevenlabs.music.compose(
-                        prompt=prompt_for_elevenlabs,
-                        music_length_ms=length_ms)
-                print("TRACK: ", track)
-                break
-            except Exception as e:
-                i += 1
-                error_msg = str(e)
-                print("ERROR: ", error_msg)
-                try:
-                    prompt_for_elevenlabs = e.body.get("detail", {}).get("data", {}).get("prompt_suggestion", prompt_for_elevenlabs)
-                except Exception:
-                    raise
-        
-        # Save audio file locally (temporary, for backward compatibility)
-        audio_filename = f"{composition_plan['title']}__{req.run_id}_{req.composition_plan_id}.mp3"
-        audio_path = MUSIC_DIR / audio_filename
-        print("AUDIO PATH: ", audio_path)       
-        with open(audio_path, "wb") as f:
-            print("WRITING TO AUDIO FILE: ", audio_path)
-            for chunk in track:
-                f.write(chunk)
-        print("AUDIO FILE: \n\n", audio_filename)
-        
-        # Upload to Supabase storage
-        storage_path = None
-        try:
-            # Read the file content
-            with open(audio_path, "rb") as f:
-                file_content = f.read()
-            
-            # Upload to Supabase storage bucket 'music' under user_id folder
-            storage_file_path = f"{req.user_id}/{audio_filename}"
-            print(f"Uploading to Supabase storage: {storage_file_path}")
-            
-            # Upload the file (pass bytes directly, not BytesIO)
-            upload_response = supabase.storage.from_("music").upload(
-                path=storage_file_path,
-                file=file_content,
-                file_options={"content-type": "audio/mpeg", "upsert": "false"}
-            )
-            
-            if upload_response:
-                storage_path = storage_file_path
-                print(f"Successfully uploaded to Supabase storage: {storage_path}")
-            else:
-                print("Warning: Upload to Supabase storage returned None")
-        except Exception as e:
-            print(f"Error uploading to Supabase storage: {e}")
-            # Continue even if storage upload fails (for backward compatibility)
-        
-        # Use placeholder image from picsum.photos
-        # Use a seed based on title to get a consistent image for the same song
-        import hashlib
-        seed = int(hashlib.md5(title.encode()).hexdigest()[:8], 16) % 1000
-        cover_image_url = f"https://picsum.photos/id/{seed}/200"
-        print(f"Using placeholder album cover: {cover_image_url}")
-        
-        # Convert track metadata to dict if it's a model
-        # Save to Supabase in a new table
-        saved_id = None
-        cover_image_path = f"{req.run_id}_{req.composition_plan_id}.png"
-        print("SAVED ID: ", saved_id)
-        try:
-            db_response = supabase.table("final_compositions").insert({
-                "uuid": str(uuid.uuid4()),
-                "user_id": req.user_id,
-                "run_id": req.run_id,
-                "composition_plan_id": req.composition_plan_id,
-                "title": composition_plan['title'],
-                "composition_plan": updated_plan,
-                "audio_path": str(audio_path),
-                "audio_filename": audio_filename,
-                "storage_path": storage_path,
-                "cover_image_path": cover_image_path,
-                "cover_image_url": cover_image_url,
-            }).execute()
-            saved_id = db_response.data[0]["id"] if db_response.data else None
-        except Exception as e:
-            print(f"Error saving to Supabase: {e}")
-            # Continue even if Supabase save fails
-        
-        return {
-            "id": saved_id,
-            "composition_plan_id": req.composition_plan_id,
-            "audio_path": str(audio_path),
-            "audio_filename": audio_filename,
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating final composition: {str(e)}")
+
+@generate_music_router.post("/jobs/{job_id}/promote", status_code=202)
+async def promote_preview_job(
+    job_id: str,
+    response: Response,
+    user: dict = Depends(get_current_user),
+    plans: CompositionPlanRepository = Depends(get_composition_plans),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+):
+    """
+    Queue the full track for a preview job. The ElevenLabs plan and lyrics substitution of the preview are
+    reused, so only composing, the cover and saving remain. Returns the new job like generate-final-composition.
+    """
+    found = await music_jobs.get_checkpoints(job_id)
+    if found is None or found[0] != user["user_id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    _, preview_payload, checkpoints = found
+    if not preview_payload.get("preview"):
+        raise HTTPException(status_code=400, detail="Only preview jobs can be promoted")
+    if "elevenlabs_plan" not in checkpoints:
+        raise HTTPException(status_code=409, detail="The preview's plan is not ready yet")
+    await _require_plan(plans, preview_payload["composition_plan_id"], user["user_id"])
+
+    payload = {
+        "composition_plan_id": preview_payload["composition_plan_id"],
+        "run_id": preview_payload["run_id"],
+        "promoted_from": job_id,
+    }
+    reused = {stage: checkpoints[stage] for stage in ("elevenlabs_plan", "lyrics_substitution") if stage in checkpoints}
+    return await _submit_job(response, user["user_id"], payload, idempotency_key, checkpoints=reused)
+
+
+def _get_user_job(job_id: str, user: dict):
+    job = music_jobs.get(job_id)
+    # Report other users' jobs as missing rather than forbidden
+    if job is None or job.user_id != user["user_id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+async def _get_user_job_snapshot(job_id: str, user: dict) -> dict:
+    # Falls back to the journal for jobs run by another worker process
+    found = await music_jobs.get_snapshot(job_id)
+    if found is None or found[0] != user["user_id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return found[1]
+
+
+@generate_music_router.get("/jobs/{job_id}")
+async def get_generation_job(job_id: str, user: dict = Depends(get_current_user)):
+    """Current status and stage of a final-composition job; `result` is set once it succeeds."""
+    return await _get_user_job_snapshot(job_id, user)
+
+
+@generate_music_router.get("/jobs/{job_id}/events")
+async def stream_generation_job(job_id: str, user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events for a final-composition job: `status` and `stage` events as it progresses,
+    `task` events for the album cover generated alongside, then `complete` (with the result) or `error`. Events that already happened are replayed first.
+    A job running in another worker process is followed by polling the journal instead.
+    """
+    job = music_jobs.get(job_id)
+    if job is None:
+        await _get_user_job_snapshot(job_id, user)
+        return sse_response(_poll_journal_events(job_id))
+    job = _get_user_job(job_id, user)
+
+    async def events():
+        async for event in job.follow():
+            yield format_sse(event["event"], event["data"])
+
+    return sse_response(events())
+
+
+@generate_music_router.get("/jobs/{job_id}/audio")
+async def stream_generation_job_audio(
+    job_id: str,
+    request: Request,
+    download: bool = Query(False),
+    user: dict = Depends(get_current_user),
+    music_storage: StorageRepository = Depends(get_music_storage),
+):
+    """
+    The job's audio as it is being composed (audio/mpeg). Can be opened as soon as the job is queued;
+    the response starts once composing does. Once the job has succeeded this redirects to the stored file,
+    or serves it directly for a preview (previews have no final_compositions row).
+    Only available from the worker process running the job. `download=true` saves the finished file
+    instead of playing it.
+    """
+    job = _get_user_job(job_id, user)
+    disposition = "attachment" if download else "inline"
+    if job.finished:
+        if job.result and job.result.get("preview") and job.result.get("storage_path"):
+            storage_path, filename = job.result["storage_path"], job.result["audio_filename"]
+            cached = await audio_cache.alookup(music_storage.bucket, storage_path)
+            if cached is not None:
+                return await local_audio_response(request, cached, filename, disposition)
+            response = await storage_audio_response(request, music_storage, storage_path, filename, disposition)
+            if response is None:
+                raise HTTPException(status_code=404, detail="Audio file not found on server")
+            audio_cache.fill_in_background(music_storage, storage_path)
+            return response
+        if job.result and job.result.get("audio_filename"):
+            query = "?download=true" if download else ""
+            return RedirectResponse(f"/generate-music/audio/{quote(job.result['audio_filename'])}{query}")
+        raise HTTPException(status_code=409, detail="Job failed, no audio was generated")
+
+    broadcast = audio_broadcast(job.id)
+    return StreamingResponse(
+        broadcast.subscribe(),
+        media_type=broadcast.media_type,
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+async def _poll_journal_events(job_id: str):
+    last = None
+    while True:
+        found = await music_jobs.get_snapshot(job_id)
+        if found is None:
+            yield format_sse("error", {"job_id": job_id, "detail": "Job not found"})
+            return
+        snapshot = found[1]
+        if snapshot["status"] == "succeeded":
+            yield format_sse("complete", {"job_id": job_id, "status": "succeeded", "result": snapshot["result"]})
+            return
+        if snapshot["status"] == "failed":
+            yield format_sse("error", {"job_id": job_id, "status": "failed", "detail": snapshot["error"]})
+            return
+        current = (snapshot["status"], snapshot["stage"])
+        if current != last:
+            yield format_sse("stage" if snapshot["stage"] else "status", {"job_id": job_id, "status": snapshot["status"], "stage": snapshot["stage"]})
+            last = current
+        await asyncio.sleep(JOB_POLL_INTERVAL_SECONDS)
 
 
 @generate_music_router.get("/final-composition/{composition_plan_id}")
-async def get_final_composition(composition_plan_id: int, user: dict = Depends(get_current_user)):
+async def get_final_composition(composition_plan_id: int, user: dict = Depends(get_current_user), final_compositions: FinalCompositionRepository = Depends(get_final_compositions)):
     """Get final composition by composition_plan_id. Only returns if it belongs to the authenticated user."""
     try:
-        response = supabase.table("final_compositions").select("*").eq("composition_plan_id", composition_plan_id).eq("user_id", user["user_id"]).execute()
+        composition = await final_compositions.get_by_plan(composition_plan_id, user["user_id"])
         
-        if not response.data:
+        if not composition:
             raise HTTPException(status_code=404, detail="Final composition not found")
         
-        return response.data[0]
+        return composition
     except HTTPException:
         raise
     except Exception as e:
@@ -225,65 +258,62 @@ async def get_final_composition(composition_plan_id: int, user: dict = Depends(g
 
 
 @generate_music_router.get("/final-compositions/run/{run_id}")
-async def get_final_compositions_by_run(run_id: str, user: dict = Depends(get_current_user)):
+async def get_final_compositions_by_run(run_id: str, user: dict = Depends(get_current_user), final_compositions: FinalCompositionRepository = Depends(get_final_compositions)):
     """Get all final compositions for a specific run_id. Only returns compositions belonging to the authenticated user."""
     try:
-        response = supabase.table("final_compositions").select("*").eq("run_id", run_id).eq("user_id", user["user_id"]).order("created_at").execute()
-        
-        if not response.data:
-            return []
-        
-        return response.data
+        return await final_compositions.list_by_run(run_id, user["user_id"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching final compositions: {str(e)}")
 
 
 @generate_music_router.get("/audio/{filename}")
-async def get_audio_file(filename: str, user: dict = Depends(get_current_user)):
-    """Serve audio file. Only allows access if the file belongs to the authenticated user."""
+async def get_audio_file(
+    filename: str,
+    request: Request,
+    download: bool = Query(False),
+    user: dict = Depends(get_current_user),
+    final_compositions: FinalCompositionRepository = Depends(get_final_compositions),
+    music_storage: StorageRepository = Depends(get_music_storage),
+):
+    """
+    Serve audio file. Only allows access if the file belongs to the authenticated user.
+    Supports Range requests (206) for seeking and progressive playback, and ETag/Last-Modified
+    revalidation (304). Serves the local cache when it holds the file, otherwise streams the object from
+    storage and fills the cache in the background for the next request.
+    Sent inline for playback; `download=true` asks the browser to save it instead.
+    """
+    disposition = "attachment" if download else "inline"
     try:
         # Verify the file belongs to the user by checking final_compositions table
         if not filename.endswith(".mp3"):
             raise HTTPException(status_code=400, detail="Invalid file format")
         
         # Check if this file is associated with the user and get storage_path
-        response = supabase.table("final_compositions").select("user_id, storage_path").eq("audio_filename", filename).execute()
+        composition = await final_compositions.get_by_audio_filename(filename, columns="user_id, storage_path")
         
-        if not response.data:
+        if not composition:
             raise HTTPException(status_code=404, detail="Audio file not found")
         
-        if response.data[0]["user_id"] != user["user_id"]:
+        if composition["user_id"] != user["user_id"]:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        storage_path = response.data[0].get("storage_path")
-        
-        # Try to serve from Supabase storage first
+        # A local copy avoids a round trip to storage
+        storage_path = composition.get("storage_path")
         if storage_path:
-            try:
-                # Download file from Supabase storage
-                file_data = supabase.storage.from_("music").download(storage_path)
-                
-                if file_data:
-                    # Create a temporary file response
-                    return Response(
-                        content=file_data,
-                        media_type="audio/mpeg",
-                        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
-                    )
-            except Exception as e:
-                print(f"Error downloading from Supabase storage: {e}")
-                # Fall back to local file if storage download fails
-        
-        # Fall back to local file if storage_path is not available
+            cached = await audio_cache.alookup(music_storage.bucket, storage_path)
+            if cached is not None:
+                return await local_audio_response(request, cached, filename, disposition)
         audio_path = MUSIC_DIR / filename
-        if not audio_path.exists():
-            raise HTTPException(status_code=404, detail="Audio file not found on server")
-        
-        return FileResponse(
-            path=str(audio_path),
-            media_type="audio/mpeg",
-            filename=filename
-        )
+        if await anyio.Path(audio_path).is_file():
+            return await local_audio_response(request, audio_path, filename, disposition)
+
+        if storage_path:
+            response = await storage_audio_response(request, music_storage, storage_path, filename, disposition)
+            if response is not None:
+                audio_cache.fill_in_background(music_storage, storage_path)
+                return response
+
+        raise HTTPException(status_code=404, detail="Audio file not found on server")
     except HTTPException:
         raise
     except Exception as e:
@@ -291,35 +321,57 @@ async def get_audio_file(filename: str, user: dict = Depends(get_current_user)):
 
 
 @generate_music_router.get("/download-run/{run_id}")
-async def download_run_music_zip(run_id: str, user: dict = Depends(get_current_user)):
-    """Download all final compositions for a run as a zip. Only returns compositions belonging to the authenticated user."""
-    response = supabase.table("final_compositions").select("*").eq("run_id", run_id).eq("user_id", user["user_id"]).order("created_at").execute()
-    if not response.data:
+async def download_run_music_zip(
+    run_id: str,
+    user: dict = Depends(get_current_user),
+    final_compositions: FinalCompositionRepository = Depends(get_final_compositions),
+    music_storage: StorageRepository = Depends(get_music_storage),
+):
+    """
+    Download all final compositions for a run as a zip. Only returns compositions belonging to the authenticated user.
+    The archive is streamed as it is built: tracks are fetched a few at a time, ahead of the one being written,
+    and stored uncompressed, so the download starts right away and memory use does not grow with the run.
+    """
+    rows = await final_compositions.list_by_run(run_id, user["user_id"])
+    if not rows:
         raise HTTPException(status_code=404, detail="No compositions found for this run")
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        for row in response.data:
-            audio_filename = row.get("audio_filename")
-            if not audio_filename:
+
+    async def fetch(row: dict):
+        """A local file holding the track, or its bytes when the cache cannot hold it; None if unavailable."""
+        storage_path = row.get("storage_path")
+        # Try to get from Supabase storage (through the local cache) first
+        if storage_path:
+            try:
+                cached = await audio_cache.fetch(music_storage, storage_path)
+                if cached is not None:
+                    return cached
+                return await music_storage.download(storage_path)
+            except Exception as e:
+                print(f"Error downloading {row['audio_filename']} from storage: {e}")
+        # Fall back to local file
+        audio_path = MUSIC_DIR / row["audio_filename"]
+        return audio_path if await anyio.Path(audio_path).is_file() else None
+
+    async def read_chunks(source):
+        if isinstance(source, bytes):
+            yield source
+            return
+        async with source:
+            while chunk := await source.read(ZIP_READ_SIZE):
+                yield chunk
+
+    async def entries():
+        rows_with_audio = [row for row in rows if row.get("audio_filename")]
+        async for row, source in prefetch(rows_with_audio, fetch, ZIP_PREFETCH_CONCURRENCY):
+            if source is None:
                 continue
-            
-            storage_path = row.get("storage_path")
-            
-            # Try to get from Supabase storage first
-            if storage_path:
+            if not isinstance(source, bytes):
                 try:
-                    file_data = supabase.storage.from_("music").download(storage_path)
-                    if file_data:
-                        zf.writestr(audio_filename, file_data)
-                        continue
-                except Exception as e:
-                    print(f"Error downloading {audio_filename} from storage: {e}")
-                    # Fall back to local file
-            
-            # Fall back to local file
-            audio_path = MUSIC_DIR / audio_filename
-            if audio_path.exists():
-                zf.write(audio_path, audio_filename)
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="application/zip", headers={"Content-Disposition": f"attachment; filename=run-{run_id}-music.zip"})
+                    # Opened right away, so an eviction from the cache cannot remove the file mid-entry
+                    source = await anyio.open_file(source, "rb")
+                except FileNotFoundError:
+                    continue
+            yield row["audio_filename"], read_chunks(source)
+
+    return StreamingResponse(stream_zip(entries()), media_type="application/zip", headers={"Content-Disposition": f"attachment; filename=run-{run_id}-music.zip"})
 
@@ -2,7 +2,9 @@
 Generate a composition plan for a user prompt.
 """
 
+import asyncio
 import io
+import json
 import tempfile
 import zipfile
 from pathlib import Path as PathLib
@@ -10,26 +12,23 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 import pydantic
-from fastapi import APIRouter, File, HTTPException, UploadFile, Depends
+from fastapi import APIRouter, File, HTTPException, UploadFile, Depends, Request
 from fastapi.responses import StreamingResponse
-from supabase import create_client, Client
 
-from services.chatCompletion import chat_completion_json
+from services.chatCompletion import achat_completion_json, astream_chat_completion_json
+from services.json_stream import IncrementalJSONParser
+from services.sse import format_sse, sse_response
 from services.auth import get_current_user
+from services.repositories import CompositionPlanRepository, get_composition_plans
 from services.prompts import (
-    GENERATE_INITIAL_SCHEMA_SYSTEM_WITH_LYRICS_SYSTEM_PROMPT,
-    GENERATE_INITIAL_SCHEMA_SYSTEM_WITH_LYRICS_USER_PROMPT,
-    GENERATE_INITIAL_SCHEMA_SYSTEM_WITHOUT_LYRICS_SYSTEM_PROMPT,
-    GENERATE_INITIAL_SCHEMA_SYSTEM_WITHOUT_LYRICS_USER_PROMPT,
+    INITIAL_SCHEMA_WITH_LYRICS_PROMPT,
+    INITIAL_SCHEMA_WITHOUT_LYRICS_PROMPT,
     get_genre_lyrics_example,
 )
      
 env_path = Path("../.") / ".env.local"
 load_dotenv(dotenv_path=env_path)
 
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_SECRET_KEY")
-supabase: Client = create_client(url, key)
 
 generate_router = APIRouter(prefix="/generate", tags=["generate"])
 
@@ -43,41 +42,53 @@ class GenerateInitialSchema(BaseModel):
     run_id: str
     
 
-@generate_router.post("/composition-plan")
-async def generate_initial_schema(req: GenerateInitialSchema, user: dict = Depends(get_current_user)):
-    # Verify that the user_id in the request matches the authenticated user
-    if req.user_id != user["user_id"]:
-        raise HTTPException(status_code=403, detail="User ID in request does not match authenticated user")
-
+def build_initial_schema_prompts(req: GenerateInitialSchema) -> tuple[str, str]:
+    """Return the (system_prompt, user_prompt) pair for an initial composition plan."""
     # Convert styles list to string for replacement
     styles_str = ", ".join(req.styles) if req.styles else "None"
     
     if req.lyrics_exists:
-        genre_example = get_genre_lyrics_example(req.styles)
-        system_prompt = GENERATE_INITIAL_SCHEMA_SYSTEM_WITH_LYRICS_SYSTEM_PROMPT.replace("{GENRE_LYRICS_EXAMPLE}", genre_example)
-        plan = chat_completion_json(
-            system_prompt=system_prompt,
-            user_prompt=GENERATE_INITIAL_SCHEMA_SYSTEM_WITH_LYRICS_USER_PROMPT.replace("{USER_PROMPT}", req.user_prompt).replace("{STYLES}", styles_str).replace("{LYRICS_EXISTS}", str(req.lyrics_exists))
-        )
-    else:
-        plan = chat_completion_json(
-            system_prompt=GENERATE_INITIAL_SCHEMA_SYSTEM_WITHOUT_LYRICS_SYSTEM_PROMPT,
-            user_prompt=GENERATE_INITIAL_SCHEMA_SYSTEM_WITHOUT_LYRICS_USER_PROMPT.replace("{USER_PROMPT}", req.user_prompt).replace("{STYLES}", styles_str)
+        return INITIAL_SCHEMA_WITH_LYRICS_PROMPT.render(
+            USER_PROMPT=req.user_prompt,
+            STYLES=styles_str,
+            LYRICS_EXISTS=req.lyrics_exists,
+            GENRE_LYRICS_EXAMPLE=get_genre_lyrics_example(req.styles),
         )
+    return INITIAL_SCHEMA_WITHOUT_LYRICS_PROMPT.render(USER_PROMPT=req.user_prompt, STYLES=styles_str)
+
+
+def initial_plan_row(req: GenerateInitialSchema, plan: dict) -> dict:
+    """Row inserted into composition_plans for a freshly generated plan."""
+    return {
+        "user_id": req.user_id,
+        "run_id": req.run_id,
+        "user_prompt": req.user_prompt,
+        "user_styles": req.styles,
+        "lyrics_exists": req.lyrics_exists,
+        "composition_plan": plan,
+        "better_than_id": None,  # Initial plans don't improve upon anything
+    }
+
+
+@generate_router.post("/composition-plan")
+async def generate_initial_schema(req: GenerateInitialSchema, request: Request, user: dict = Depends(get_current_user), plans: CompositionPlanRepository = Depends(get_composition_plans)):
+    # Verify that the user_id in the request matches the authenticated user
+    if req.user_id != user["user_id"]:
+        raise HTTPException(status_code=403, detail="User ID in request does not match authenticated user")
+
+    system_prompt, user_prompt = build_initial_schema_prompts(req)
+    plan = await achat_completion_json(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        request=request,
+        cache_endpoint="composition-plan"
+    )
 
     # Save to Supabase
     saved_id = None
     try:
-        response = supabase.table("composition_plans").insert({
-            "user_id": req.user_id,
-            "run_id": req.run_id,
-            "user_prompt": req.user_prompt,
-            "user_styles": req.styles,
-            "lyrics_exists": req.lyrics_exists,
-            "composition_plan": plan,
-            "better_than_id": None,  # Initial plans don't improve upon anything
-        }).execute()
-        saved_id = response.data[0]["id"] if response.data else None
+        saved = await plans.insert(initial_plan_row(req, plan))
+        saved_id = saved["id"] if saved else None
     except Exception as e:
         print(f"Error saving to Supabase: {e}")
         saved_id = None
@@ -85,16 +96,124 @@ async def generate_initial_schema(req: GenerateInitialSchema, user: dict = Depen
     return {"id": saved_id, "composition_plan": plan, "user_id": req.user_id, "run_id": req.run_id}
 
 
+# Upper bound on candidates per batch request
+MAX_BATCH_PLANS = int(os.environ.get("MAX_BATCH_PLANS", "8"))
+
+# Top-level plan fields streamed as their own SSE events
+STREAMED_PLAN_FIELDS = {"title", "description", "positiveGlobalStyles", "negativeGlobalStyles"}
+
+
+@generate_router.post("/composition-plan/stream")
+async def stream_initial_schema(req: GenerateInitialSchema, user: dict = Depends(get_current_user), plans: CompositionPlanRepository = Depends(get_composition_plans)):
+    """
+    Same as POST /composition-plan, but streams the plan as Server-Sent Events.
+    Emits one event per field (title, description, positiveGlobalStyles, negativeGlobalStyles),
+    a lyrics_section event per completed lyrics section, then a complete event once the plan is saved.
+    """
+    if req.user_id != user["user_id"]:
+        raise HTTPException(status_code=403, detail="User ID in request does not match authenticated user")
+
+    system_prompt, user_prompt = build_initial_schema_prompts(req)
+
+    async def events():
+        parser = IncrementalJSONParser(expand=[("lyrics",)])
+        try:
+            async for delta in astream_chat_completion_json(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                cache_endpoint="composition-plan",
+            ):
+                for path, value in parser.feed(delta):
+                    if len(path) == 2 and path[0] == "lyrics":
+                        yield format_sse("lyrics_section", {"section": path[1], "lines": value})
+                    elif len(path) == 1 and path[0] in STREAMED_PLAN_FIELDS:
+                        yield format_sse(path[0], value)
+            plan = json.loads(parser.text)
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Error generating composition plan: {str(e)}"})
+            return
+
+        # Save to Supabase exactly like the non-streaming endpoint
+        saved_id = None
+        try:
+            saved = await plans.insert(initial_plan_row(req, plan))
+            saved_id = saved["id"] if saved else None
+        except Exception as e:
+            print(f"Error saving to Supabase: {e}")
+            saved_id = None
+
+        yield format_sse("complete", {"id": saved_id, "composition_plan": plan, "user_id": req.user_id, "run_id": req.run_id})
+
+    return sse_response(events())
+
+
+class GenerateInitialSchemaBatch(GenerateInitialSchema):
+    count: int = pydantic.Field(default=3, ge=1, le=MAX_BATCH_PLANS)
+
+
+@generate_router.post("/composition-plans/batch")
+async def generate_initial_schema_batch(req: GenerateInitialSchemaBatch, user: dict = Depends(get_current_user), plans: CompositionPlanRepository = Depends(get_composition_plans)):
+    """
+    Generate `count` candidate plans for one run in a single request.
+    Completions run concurrently and each plan is streamed as a `plan` SSE event as soon as it finishes;
+    all plans are then saved with one bulk insert and a final `complete` event carries their ids.
+    """
+    if req.user_id != user["user_id"]:
+        raise HTTPException(status_code=403, detail="User ID in request does not match authenticated user")
+
+    system_prompt, user_prompt = build_initial_schema_prompts(req)
+
+    async def generate(index: int):
+        # No response cache here: identical prompts must still yield distinct candidates
+        plan = await achat_completion_json(system_prompt=system_prompt, user_prompt=user_prompt)
+        return index, plan
+
+    async def events():
+        tasks = [asyncio.ensure_future(generate(i)) for i in range(req.count)]
+        finished = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    index, plan = await next_done
+                except Exception as e:
+                    yield format_sse("error", {"detail": f"Error generating composition plan: {str(e)}"})
+                    continue
+                finished.append((index, plan))
+                yield format_sse("plan", {"index": index, "composition_plan": plan})
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        saved_ids = [None] * len(finished)
+        if finished:
+            try:
+                saved = await plans.insert_many([initial_plan_row(req, plan) for _, plan in finished])
+                saved_ids = [row["id"] for row in saved] if len(saved) == len(finished) else saved_ids
+            except Exception as e:
+                print(f"Error saving to Supabase: {e}")
+
+        yield format_sse("complete", {
+            "plans": [
+                {"index": index, "id": saved_id, "composition_plan": plan}
+                for (index, plan), saved_id in zip(finished, saved_ids)
+            ],
+            "user_id": req.user_id,
+            "run_id": req.run_id,
+        })
+
+    return sse_response(events())
+
+
 @generate_router.get("/composition-plan/{composition_id}")
-async def get_composition_plan(composition_id: int, user: dict = Depends(get_current_user)):
+async def get_composition_plan(composition_id: int, user: dict = Depends(get_current_user), plans: CompositionPlanRepository = Depends(get_composition_plans)):
     """Get a composition plan by ID. Only returns if it belongs to the authenticated user."""
     try:
-        response = supabase.table("composition_plans").select("*").eq("id", composition_id).eq("user_id", user["user_id"]).execute()
+        plan = await plans.get(composition_id, user_id=user["user_id"])
         
-        if not response.data:
+        if not plan:
             raise HTTPException(status_code=404, detail="Composition plan not found")
         
-        return response.data[0]
+        return plan
     except HTTPException:
         raise
     except Exception as e:
@@ -102,15 +221,10 @@ async def get_composition_plan(composition_id: int, user: dict = Depends(get_cur
 
 
 @generate_router.get("/composition-plans/run/{run_id}")
-async def get_composition_plans_by_run(run_id: str, user: dict = Depends(get_current_user)):
+async def get_composition_plans_by_run(run_id: str, user: dict = Depends(get_current_user), plans: CompositionPlanRepository = Depends(get_composition_plans)):
     """Get all composition plans for a specific run_id. Only returns plans belonging to the authenticated user."""
     try:
-        response = supabase.table("composition_plans").select("*").eq("run_id", run_id).eq("user_id", user["user_id"]).order("created_at").execute()
-        
-        if not response.data:
-            return []
-        
-        return response.data
+        return await plans.list_by_run(run_id, user["user_id"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching composition plans: {str(e)}")
 
@@ -121,7 +235,7 @@ class UpdateCompositionPlan(BaseModel):
 
 
 @generate_router.put("/composition-plan/{composition_id}")
-async def update_composition_plan(composition_id: int, req: UpdateCompositionPlan, user: dict = Depends(get_current_user)):
+async def update_composition_plan(composition_id: int, req: UpdateCompositionPlan, user: dict = Depends(get_current_user), plans: CompositionPlanRepository = Depends(get_composition_plans)):
     """Update a composition plan by ID. Only allows updates if it belongs to the authenticated user."""
     # Verify that the user_id in the request matches the authenticated user
     if req.user_id != user["user_id"]:
@@ -129,20 +243,20 @@ async def update_composition_plan(composition_id: int, req: UpdateCompositionPla
     
     try:
         # First verify the composition plan exists and belongs to the user
-        check_response = supabase.table("composition_plans").select("id").eq("id", composition_id).eq("user_id", user["user_id"]).execute()
+        existing = await plans.get(composition_id, user_id=user["user_id"], columns="id")
         
-        if not check_response.data:
+        if not existing:
             raise HTTPException(status_code=404, detail="Composition plan not found or access denied")
         
         # Update the composition plan
-        response = supabase.table("composition_plans").update({
+        updated = await plans.update(composition_id, user["user_id"], {
             "composition_plan": req.composition_plan
-        }).eq("id", composition_id).eq("user_id", user["user_id"]).execute()
+        })
         
-        if not response.data:
+        if not updated:
             raise HTTPException(status_code=404, detail="Composition plan not found")
         
-        return response.data[0]
+        return updated
     except HTTPException:
         raise
     except Exception as e:
@@ -11,20 +11,22 @@ from typing import Optional
 from dotenv import load_dotenv
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
 from pydantic import BaseModel
-from supabase import create_client, Client
+from services.audio_cache import audio_cache
 from services.auth import get_current_user
+from services.repositories import (
+    FinalCompositionRepository,
+    PortfolioItemRepository,
+    StorageRepository,
+    get_final_compositions,
+    get_portfolio_audio_storage,
+    get_portfolio_items as get_portfolio_item_repository,
+)
 
 env_path = Path("../.") / ".env.local"
 load_dotenv(dotenv_path=env_path)
 
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_SECRET_KEY")
-supabase: Client = create_client(url, key)
-
 portfolio_router = APIRouter(prefix="/portfolio", tags=["portfolio"])
 
-PORTFOLIO_AUDIO_BUCKET = "portfolio-audio"
-
 
 class PortfolioItemCreate(BaseModel):
     id: str
@@ -68,36 +70,22 @@ class PortfolioItemResponse(BaseModel):
 
 
 @portfolio_router.get("/items", response_model=list[PortfolioItemResponse])
-async def get_portfolio_items(user: dict = Depends(get_current_user)):
+async def get_portfolio_items(user: dict = Depends(get_current_user), items: PortfolioItemRepository = Depends(get_portfolio_item_repository)):
     """Get all portfolio items for the current user."""
     try:
-        response = (
-            supabase.table("portfolio_items")
-            .select("*")
-            .eq("user_id", user["user_id"])
-            .order("created_at", desc=True)
-            .execute()
-        )
-        return response.data
+        return await items.list_for_user(user["user_id"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch portfolio items: {str(e)}")
 
 
 @portfolio_router.get("/items/{item_id}", response_model=PortfolioItemResponse)
-async def get_portfolio_item(item_id: str, user: dict = Depends(get_current_user)):
+async def get_portfolio_item(item_id: str, user: dict = Depends(get_current_user), items: PortfolioItemRepository = Depends(get_portfolio_item_repository)):
     """Get a specific portfolio item by ID."""
     try:
-        response = (
-            supabase.table("portfolio_items")
-            .select("*")
-            .eq("id", item_id)
-            .eq("user_id", user["user_id"])
-            .single()
-            .execute()
-        )
-        if not response.data:
+        item = await items.get(item_id, user["user_id"])
+        if not item:
             raise HTTPException(status_code=404, detail="Portfolio item not found")
-        return response.data
+        return item
     except HTTPException:
         raise
     except Exception as e:
@@ -109,6 +97,8 @@ async def create_portfolio_item(
     audio_file: UploadFile = File(..., alias="audio_file"),
     item_json: str = Form(...),
     user: dict = Depends(get_current_user),
+    items: PortfolioItemRepository = Depends(get_portfolio_item_repository),
+    audio_storage: StorageRepository = Depends(get_portfolio_audio_storage),
 ):
     """Create a new portfolio item with an uploaded file."""
     try:
@@ -124,14 +114,16 @@ async def create_portfolio_item(
         file_content = await audio_file.read()
         
         # Upload to Supabase Storage
-        supabase.storage.from_(PORTFOLIO_AUDIO_BUCKET).upload(
+        await audio_storage.upload(
             path=storage_path,
-            file=file_content,
-            file_options={
-                "content-type": audio_file.content_type or "application/octet-stream",
-                "upsert": "false"
-            }
+            data=file_content,
+            content_type=audio_file.content_type or "application/octet-stream",
         )
+        # Write-through, so the first playback is served locally
+        try:
+            await audio_cache.astore_bytes(audio_storage.bucket, storage_path, file_content)
+        except OSError as e:
+            print(f"Warning: Failed to cache audio file {storage_path}: {e}")
         
         # Create database record
         db_item = {
@@ -150,12 +142,12 @@ async def create_portfolio_item(
             "cover_image_url": item_data.get("cover_image_url"),
         }
         
-        response = supabase.table("portfolio_items").insert(db_item).execute()
+        created = await items.insert(db_item)
         
-        if not response.data:
+        if not created:
             raise HTTPException(status_code=500, detail="Failed to create portfolio item")
         
-        return response.data[0]
+        return created
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON in item_json")
     except HTTPException:
@@ -169,31 +161,24 @@ async def update_portfolio_item(
     item_id: str,
     item_update: PortfolioItemUpdate,
     user: dict = Depends(get_current_user),
+    items: PortfolioItemRepository = Depends(get_portfolio_item_repository),
+    final_compositions: FinalCompositionRepository = Depends(get_final_compositions),
 ):
     """Update a portfolio item."""
     try:
         # First, get the current portfolio item to find the filename
-        current_item_response = (
-            supabase.table("portfolio_items")
-            .select("file_name")
-            .eq("id", item_id)
-            .eq("user_id", user["user_id"])
-            .single()
-            .execute()
-        )
+        current_item = await items.get(item_id, user["user_id"], columns="file_name")
         
-        if not current_item_response.data:
+        if not current_item:
             raise HTTPException(status_code=404, detail="Portfolio item not found")
         
-        file_name = current_item_response.data.get("file_name")
+        file_name = current_item.get("file_name")
         
         # Try to find matching final_composition by filename
         final_composition = None
         if file_name:
             try:
-                comp_response = supabase.table("final_compositions").select("*").eq("audio_filename", file_name).eq("user_id", user["user_id"]).execute()
-                if comp_response.data:
-                    final_composition = comp_response.data[0]
+                final_composition = await final_compositions.get_by_audio_filename(file_name, user_id=user["user_id"])
             except Exception as e:
                 print(f"Warning: Could not fetch final_composition: {e}")
         
@@ -230,18 +215,12 @@ async def update_portfolio_item(
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields to update")
         
-        response = (
-            supabase.table("portfolio_items")
-            .update(update_data)
-            .eq("id", item_id)
-            .eq("user_id", user["user_id"])
-            .execute()
-        )
+        updated = await items.update(item_id, user["user_id"], update_data)
         
-        if not response.data:
+        if not updated:
             raise HTTPException(status_code=404, detail="Portfolio item not found")
         
-        return response.data[0]
+        return updated
     except HTTPException:
         raise
     except Exception as e:
@@ -249,40 +228,33 @@ async def update_portfolio_item(
 
 
 @portfolio_router.delete("/items/{item_id}")
-async def delete_portfolio_item(item_id: str, user: dict = Depends(get_current_user)):
+async def delete_portfolio_item(
+    item_id: str,
+    user: dict = Depends(get_current_user),
+    items: PortfolioItemRepository = Depends(get_portfolio_item_repository),
+    audio_storage: StorageRepository = Depends(get_portfolio_audio_storage),
+):
     """Delete a portfolio item and its audio file from storage."""
     try:
         # First, get the item to find the storage path
-        item_response = (
-            supabase.table("portfolio_items")
-            .select("storage_path")
-            .eq("id", item_id)
-            .eq("user_id", user["user_id"])
-            .single()
-            .execute()
-        )
+        item = await items.get(item_id, user["user_id"], columns="storage_path")
         
-        if not item_response.data:
+        if not item:
             raise HTTPException(status_code=404, detail="Portfolio item not found")
         
-        storage_path = item_response.data.get("storage_path")
+        storage_path = item.get("storage_path")
         
         # Delete from storage if path exists
         if storage_path:
             try:
-                supabase.storage.from_(PORTFOLIO_AUDIO_BUCKET).remove([storage_path])
+                await audio_cache.ainvalidate(audio_storage.bucket, storage_path)
+                await audio_storage.remove([storage_path])
             except Exception as e:
                 # Log but don't fail if storage deletion fails
                 print(f"Warning: Failed to delete storage file {storage_path}: {e}")
         
         # Delete from database
-        response = (
-            supabase.table("portfolio_items")
-            .delete()
-            .eq("id", item_id)
-            .eq("user_id", user["user_id"])
-            .execute()
-        )
+        await items.delete(item_id, user["user_id"])
         
         return {"message": "Portfolio item deleted successfully"}
     except HTTPException:
@@ -292,29 +264,27 @@ async def delete_portfolio_item(item_id: str, user: dict = Depends(get_current_u
 
 
 @portfolio_router.get("/items/{item_id}/audio")
-async def get_portfolio_audio(item_id: str, user: dict = Depends(get_current_user)):
+async def get_portfolio_audio(
+    item_id: str,
+    user: dict = Depends(get_current_user),
+    items: PortfolioItemRepository = Depends(get_portfolio_item_repository),
+    audio_storage: StorageRepository = Depends(get_portfolio_audio_storage),
+):
     """Get the audio file for a portfolio item."""
     try:
         # Get the item to find the storage path
-        item_response = (
-            supabase.table("portfolio_items")
-            .select("storage_path")
-            .eq("id", item_id)
-            .eq("user_id", user["user_id"])
-            .single()
-            .execute()
-        )
+        item = await items.get(item_id, user["user_id"], columns="storage_path")
         
-        if not item_response.data:
+        if not item:
             raise HTTPException(status_code=404, detail="Portfolio item not found")
         
-        storage_path = item_response.data.get("storage_path")
+        storage_path = item.get("storage_path")
         
         if not storage_path:
             raise HTTPException(status_code=404, detail="Audio file not found")
         
-        # Download from storage
-        file_data = supabase.storage.from_(PORTFOLIO_AUDIO_BUCKET).download(storage_path)
+        # From the local cache, or downloaded from storage and cached
+        file_data = await audio_cache.get_or_download(audio_storage, storage_path)
         
         # Get file name from path
         file_name = storage_path.split("/")[-1]
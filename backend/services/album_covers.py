@@ -0,0 +1,131 @@
+"""
+Album cover generation shared by the cover endpoints and the final-composition pipeline.
+Gemini turns the title and description into a detailed visual description, the configured image backend
+renders it, and each image is stored with its derivatives. Repeat prompts are served from the prompt cache.
+"""
+import asyncio
+import os
+
+from supabase import Client
+
+from services.cover_cache import cover_cache, description_key, image_key
+from services.cover_images import ingest_cover
+from services.gemini_models import GEMINI_AVAILABLE, gemini_models
+from services.image_generation import image_backend
+from services.repositories import ALBUM_COVERS_BUCKET, StorageRepository
+from services.supabase_client import get_supabase_client
+
+
+async def generate_album_cover_internal(
+    title: str,
+    description: str = "",
+    supabase: Client = None,
+    number_of_images: int = 1,
+    force_regenerate: bool = False,
+) -> dict:
+    """
+    Internal function to generate album cover without FastAPI dependencies.
+    Can be called from other modules; uses the shared Supabase client unless one is passed in.
+    With number_of_images > 1, one generation call returns several candidate covers under "candidates".
+    Repeat requests are served from the prompt cache (services/cover_cache) unless force_regenerate is set.
+    """
+    if supabase is None:
+        supabase = get_supabase_client()
+    try:
+        # Check if Gemini is available
+        if not GEMINI_AVAILABLE:
+            raise ValueError("Google Generative AI package not installed")
+        
+        gemini_api_key = os.environ.get("GEMINI_API_KEY")
+        if not gemini_api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        
+        print(f"Generating album cover with Gemini. Title: {title}, Description: {description}")
+        
+        # Build prompt parts to avoid backslashes in f-string expressions
+        description_part = f"Description: {description}\n" if description else ""
+        
+        prompt = (
+            f"Create a detailed, vivid visual description for an album cover art based on this music track:\n\n"
+            f"Title: {title}\n"
+            f"{description_part}"
+            f"Generate a detailed visual description (3-4 sentences) for an album cover that:\n"
+            f"- Captures the mood, style, and essence of this music\n"
+            f"- Is visually striking and artistic\n"
+            f"- Uses appropriate colors, composition, and visual elements\n"
+            f"- Would work well as a square-format album cover for streaming platforms\n"
+            f"- Is modern and professional\n\n"
+            f"Focus on specific visual details: colors, imagery, style, mood, composition. "
+            f"Be creative and detailed. Return only the visual description, nothing else."
+        )
+        
+        # Same title and description for the same model: reuse the enhanced description
+        description_cache_key = description_key(title, description, await gemini_models.preferred())
+        enhanced_description = None if force_regenerate else cover_cache.get_description(description_cache_key)
+        if enhanced_description is not None:
+            print(f"Enhanced description from cache: {enhanced_description}")
+        else:
+            # Use Gemini to create an enhanced, detailed visual description, with the model resolved at startup
+            enhanced_response = await gemini_models.generate_content(prompt)
+            enhanced_description = enhanced_response.text.strip()
+            cover_cache.put_description(description_cache_key, enhanced_description)
+
+            print(f"Enhanced description from Gemini: {enhanced_description}")
+        
+        # Create final image generation prompt using the enhanced description
+        final_image_prompt = (
+            f"Professional album cover art: {enhanced_description}. "
+            f"Square format (1:1 aspect ratio), modern design, high quality, "
+            f"suitable for music streaming platforms, vibrant colors, artistic composition."
+        )
+        
+        # Generate image using the enhanced prompt
+        # Check if an image provider is configured first
+        if image_backend is None:
+            # No image provider configured (e.g. GOOGLE_CLOUD_PROJECT_ID unset), skip image generation
+            print("Image generation not configured - skipping image generation")
+            return None
+
+        covers_storage = StorageRepository(supabase, ALBUM_COVERS_BUCKET)
+
+        # Same prompt for the same backend: reuse the stored covers, as long as they are still in the bucket
+        image_cache_key = image_key(final_image_prompt, image_backend.name, number_of_images)
+        cached = None if force_regenerate else cover_cache.get_images(image_cache_key)
+        if cached is not None:
+            if await covers_storage.exists(cached[0]["storage_path"]):
+                print(f"Album cover from cache: {cached[0]['storage_path']}")
+                return {**cached[0], "candidates": cached}
+            cover_cache.invalidate_images(image_cache_key)
+
+        try:
+            images = await image_backend.agenerate(final_image_prompt, number_of_images=number_of_images, aspect_ratio="1:1")
+            print(f"Successfully generated {len(images)} image(s) using {image_backend.name}")
+        except Exception as image_error:
+            print(f"Image generation not available: {image_error}")
+            # Return None to indicate cover generation was skipped
+            print("Skipping image generation. Music generation will continue without cover.")
+            return None
+        
+        if not images:
+            print("Failed to generate image data - skipping cover generation")
+            return None
+        
+        # Store each image with its thumbnails and WebP/JPEG derivatives (content-addressed, so duplicates are stored once)
+        async def store(image_data: bytes) -> dict:
+            stored = await ingest_cover(covers_storage, image_data)
+            return {**stored, "filename": stored["storage_path"].rsplit("/", 1)[-1]}
+
+        try:
+            candidates = await asyncio.gather(*(store(image_data) for image_data in images))
+        except Exception as storage_error:
+            print(f"Error uploading to Supabase Storage: {storage_error}")
+            raise ValueError(f"Failed to upload cover image to storage: {str(storage_error)}")
+        cover_cache.put_images(image_cache_key, candidates)
+        # The first image is the cover; with number_of_images > 1 the others are alternatives to pick from
+        return {**candidates[0], "candidates": candidates}
+            
+    except Exception as e:
+        print(f"Error generating album cover: {e}")
+        import traceback
+        traceback.print_exc()
+        raise
@@ -0,0 +1,298 @@
+"""
+Size-capped local cache of audio objects from Supabase storage (music and portfolio-audio buckets).
+Files are named by a SHA-256 of their bucket and object path, written atomically (temp file + rename)
+and evicted least-recently-used once the byte budget is exceeded. Recency is kept in file mtimes,
+so the LRU order survives restarts: the directory is re-indexed on startup.
+Reads go through the cache (misses are filled in the background), and uploads write through it.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import anyio
+
+AUDIO_CACHE_ENABLED = os.environ.get("AUDIO_CACHE_ENABLED", "true").lower() == "true"
+AUDIO_CACHE_DIR = Path(os.environ.get("AUDIO_CACHE_DIR", Path(__file__).parent.parent / "cache" / "audio"))
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Background downloads filling the cache after a miss
+AUDIO_CACHE_FILL_CONCURRENCY = int(os.environ.get("AUDIO_CACHE_FILL_CONCURRENCY", "4"))
+# Temp files untouched for this long were left by a crash; younger ones may be another worker's write in progress
+AUDIO_CACHE_TEMP_MAX_AGE_SECONDS = float(os.environ.get("AUDIO_CACHE_TEMP_MAX_AGE_SECONDS", "3600"))
+
+CACHE_SUFFIX = ".audio"
+
+
+def cache_name(bucket: str, path: str) -> str:
+    return hashlib.sha256(f"{bucket}/{path}".encode()).hexdigest() + CACHE_SUFFIX
+
+
+class AudioCache:
+    """LRU of whole objects on local disk, bounded by total bytes. Safe to use from worker threads."""
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int,
+        enabled: bool = True,
+        fill_concurrency: int = 4,
+        temp_max_age_seconds: float = 3600,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.fill_concurrency = fill_concurrency
+        self.temp_max_age_seconds = temp_max_age_seconds
+        # file name -> size, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._filling: set[str] = set()
+        # The event loop only keeps weak references to tasks; fills are referenced here until done
+        self._fill_tasks: set[asyncio.Task] = set()
+        self._fill_limiter: Optional[asyncio.Semaphore] = None
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "fill_errors": 0}
+
+    # --- index ---
+
+    def reindex(self) -> None:
+        """Rebuild the index from the directory (at startup), dropping stale temp files left by a crash."""
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        found = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if not entry.name.endswith(CACHE_SUFFIX):
+                    # Other workers sharing the directory may still be writing into recent temp files
+                    if now - stat.st_mtime > self.temp_max_age_seconds:
+                        os.unlink(entry.path)
+                    continue
+            except FileNotFoundError:
+                # Renamed or removed by another worker meanwhile
+                continue
+            found.append((stat.st_mtime, entry.name, stat.st_size))
+        with self._lock:
+            self._entries = OrderedDict((name, size) for _, name, size in sorted(found))
+            self._bytes = sum(self._entries.values())
+        self._evict()
+        print(f"Audio cache: {len(self._entries)} files, {self._bytes / 1024 ** 2:.1f} MB in {self.directory}")
+
+    def _evict(self) -> None:
+        while True:
+            with self._lock:
+                if self._bytes <= self.max_bytes or not self._entries:
+                    return
+                name, size = self._entries.popitem(last=False)
+                self._bytes -= size
+                self._stats["evictions"] += 1
+            try:
+                os.unlink(self.directory / name)
+            except FileNotFoundError:
+                pass
+
+    def _add(self, name: str, size: int) -> None:
+        with self._lock:
+            self._bytes -= self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._bytes += size
+            self._stats["stores"] += 1
+        self._evict()
+
+    # --- reads ---
+
+    def path_for(self, bucket: str, path: str) -> Path:
+        """Where the object is (or would be) cached; use `lookup` to read it."""
+        return self.directory / cache_name(bucket, path)
+
+    def lookup(self, bucket: str, path: str) -> Optional[Path]:
+        """Path of the cached copy, marking it recently used; None on a miss."""
+        if not self.enabled:
+            return None
+        name = cache_name(bucket, path)
+        with self._lock:
+            if name not in self._entries:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(name)
+            self._stats["hits"] += 1
+        file_path = self.directory / name
+        try:
+            # Recency for the LRU order after a restart
+            os.utime(file_path)
+        except FileNotFoundError:
+            with self._lock:
+                self._bytes -= self._entries.pop(name, 0)
+            return None
+        return file_path
+
+    async def alookup(self, bucket: str, path: str) -> Optional[Path]:
+        return await anyio.to_thread.run_sync(self.lookup, bucket, path)
+
+    # --- writes ---
+
+    def _temp_file(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False)
+
+    def store_bytes(self, bucket: str, path: str, data: bytes) -> None:
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        name = cache_name(bucket, path)
+        with self._temp_file() as f:
+            f.write(data)
+        os.replace(f.name, self.directory / name)
+        self._add(name, len(data))
+
+    def store_file(self, bucket: str, path: str, source: Path, move: bool = False) -> Optional[Path]:
+        """Cache a local file; with `move`, take it over instead of copying. Returns the cached path."""
+        if not self.enabled:
+            return None
+        size = source.stat().st_size
+        if size > self.max_bytes:
+            return None
+        name = cache_name(bucket, path)
+        target = self.directory / name
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if move:
+            try:
+                # Atomic when both are on the same filesystem
+                os.replace(source, target)
+                os.utime(target)
+                self._add(name, size)
+                return target
+            except OSError:
+                pass
+        with self._temp_file() as f, open(source, "rb") as src:
+            while chunk := src.read(1024 * 1024):
+                f.write(chunk)
+        os.replace(f.name, target)
+        if move:
+            source.unlink(missing_ok=True)
+        self._add(name, size)
+        return target
+
+    def invalidate(self, bucket: str, path: str) -> None:
+        name = cache_name(bucket, path)
+        with self._lock:
+            self._bytes -= self._entries.pop(name, 0)
+        (self.directory / name).unlink(missing_ok=True)
+
+    async def astore_bytes(self, bucket: str, path: str, data: bytes) -> None:
+        await anyio.to_thread.run_sync(self.store_bytes, bucket, path, data)
+
+    async def astore_file(self, bucket: str, path: str, source: Path, move: bool = False) -> Optional[Path]:
+        return await anyio.to_thread.run_sync(self.store_file, bucket, path, source, move)
+
+    async def ainvalidate(self, bucket: str, path: str) -> None:
+        await anyio.to_thread.run_sync(self.invalidate, bucket, path)
+
+    # --- read-through ---
+
+    async def get_or_download(self, storage, path: str) -> bytes:
+        """Object bytes from the cache, or from storage (`StorageRepository`) and then cached."""
+        cached = await self.alookup(storage.bucket, path)
+        if cached is not None:
+            try:
+                return await anyio.Path(cached).read_bytes()
+            except FileNotFoundError:
+                pass
+        data = await storage.download(path)
+        if data:
+            try:
+                await self.astore_bytes(storage.bucket, path, data)
+            except OSError as e:
+                print(f"Error caching {storage.bucket}/{path}: {e}")
+        return data
+
+    async def fetch(self, storage, path: str) -> Optional[Path]:
+        """
+        Path of the cached copy, streaming the object from storage to disk on a miss (never held in memory).
+        None if the cache is disabled or the object is larger than the whole budget.
+        """
+        if not self.enabled:
+            return None
+        cached = await self.alookup(storage.bucket, path)
+        if cached is not None:
+            return cached
+        name = cache_name(storage.bucket, path)
+        upstream = await storage.open_download(path)
+        try:
+            upstream.raise_for_status()
+            temp = await anyio.to_thread.run_sync(self._temp_file)
+            size = 0
+            try:
+                async with anyio.wrap_file(temp) as f:
+                    async for chunk in upstream.aiter_bytes():
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise ValueError(f"{storage.bucket}/{path} does not fit in the audio cache")
+                        await f.write(chunk)
+                await anyio.to_thread.run_sync(os.replace, temp.name, self.directory / name)
+            except BaseException:
+                await anyio.Path(temp.name).unlink(missing_ok=True)
+                raise
+        except ValueError as e:
+            print(e)
+            return None
+        finally:
+            await upstream.aclose()
+        await anyio.to_thread.run_sync(self._add, name, size)
+        return self.directory / name
+
+    def fill_in_background(self, storage, path: str) -> None:
+        """After a miss served straight from storage, download the object so the next read is local."""
+        if not self.enabled:
+            return
+        name = cache_name(storage.bucket, path)
+        if name in self._filling:
+            return
+        if self._fill_limiter is None:
+            self._fill_limiter = asyncio.Semaphore(self.fill_concurrency)
+        self._filling.add(name)
+
+        async def fill():
+            try:
+                async with self._fill_limiter:
+                    # Streamed to disk, so a background fill never holds a whole song in memory
+                    await self.fetch(storage, path)
+            except Exception as e:
+                self._stats["fill_errors"] += 1
+                print(f"Error filling audio cache for {storage.bucket}/{path}: {e}")
+            finally:
+                self._filling.discard(name)
+
+        task = asyncio.get_running_loop().create_task(fill())
+        self._fill_tasks.add(task)
+        task.add_done_callback(self._fill_tasks.discard)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "filling": len(self._filling),
+                "enabled": self.enabled,
+            }
+
+
+audio_cache = AudioCache(
+    AUDIO_CACHE_DIR,
+    AUDIO_CACHE_MAX_BYTES,
+    enabled=AUDIO_CACHE_ENABLED,
+    fill_concurrency=AUDIO_CACHE_FILL_CONCURRENCY,
+    temp_max_age_seconds=AUDIO_CACHE_TEMP_MAX_AGE_SECONDS,
+)
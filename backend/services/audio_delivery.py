@@ -0,0 +1,114 @@
+"""
+HTTP delivery of audio files with range and conditional request support.
+Objects in Supabase storage are streamed through chunk by chunk, with the client's Range and validator
+headers passed upstream, so playback starts as soon as the first bytes arrive and seeking only fetches
+the requested range. Local copies are served by FileResponse, which handles ranges itself.
+"""
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from services.repositories import StorageRepository
+
+# Browsers may reuse audio for this long and revalidate with If-None-Match afterwards
+AUDIO_CACHE_CONTROL = os.environ.get("AUDIO_CACHE_CONTROL", "private, max-age=3600")
+
+FORWARDED_REQUEST_HEADERS = ("range", "if-range", "if-none-match", "if-modified-since")
+FORWARDED_RESPONSE_HEADERS = (
+    "content-length", "content-range", "content-encoding", "etag", "last-modified", "accept-ranges",
+)
+
+
+def content_disposition(filename: str, disposition: str = "inline") -> str:
+    """`inline` for playback in the browser, `attachment` for an explicit download."""
+    if filename.isascii():
+        return f'{disposition}; filename="{filename}"'
+    return f"{disposition}; filename*=utf-8''{quote(filename)}"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+
+def is_not_modified(request: Request, etag: Optional[str], last_modified: Optional[str]) -> bool:
+    """Whether the client's cached copy is current. If-None-Match takes precedence over If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag is not None and _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _not_modified(headers: dict) -> Response:
+    return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "content-length"})
+
+
+async def local_audio_response(request: Request, path: Path, filename: str, disposition: str = "inline") -> Response:
+    stat = await anyio.Path(path).stat()
+    # Same validators FileResponse sends, so revalidation works across both
+    etag = f'"{hashlib.md5(f"{stat.st_mtime}-{stat.st_size}".encode(), usedforsecurity=False).hexdigest()}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {"etag": etag, "last-modified": last_modified, "cache-control": AUDIO_CACHE_CONTROL}
+    if is_not_modified(request, etag, last_modified):
+        return _not_modified(headers)
+    return FileResponse(
+        path=str(path),
+        media_type="audio/mpeg",
+        headers={**headers, "content-disposition": content_disposition(filename, disposition)},
+        stat_result=stat,
+    )
+
+
+async def storage_audio_response(
+    request: Request, storage: StorageRepository, storage_path: str, filename: str, disposition: str = "inline"
+) -> Optional[Response]:
+    """Stream an object from storage; None if storage could not serve it (the caller may fall back)."""
+    forwarded = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+    try:
+        upstream = await storage.open_download(storage_path, forwarded)
+    except Exception as e:
+        print(f"Error downloading from Supabase storage: {e}")
+        return None
+    if upstream.status_code not in (200, 206, 304, 416):
+        print(f"Error downloading from Supabase storage: HTTP {upstream.status_code}")
+        await upstream.aclose()
+        return None
+
+    headers = {name: upstream.headers[name] for name in FORWARDED_RESPONSE_HEADERS if name in upstream.headers}
+    headers.setdefault("accept-ranges", "bytes")
+    headers["cache-control"] = AUDIO_CACHE_CONTROL
+    if upstream.status_code == 304 or (
+        upstream.status_code == 200 and is_not_modified(request, headers.get("etag"), headers.get("last-modified"))
+    ):
+        # Storage may ignore validators; answer 304 ourselves instead of sending the body again
+        await upstream.aclose()
+        return _not_modified(headers)
+    if upstream.status_code == 416:
+        await upstream.aclose()
+        return Response(status_code=416, headers=headers)
+
+    headers["content-disposition"] = content_disposition(filename, disposition)
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        media_type="audio/mpeg",
+        headers=headers,
+        background=BackgroundTask(upstream.aclose),
+    )
@@ -0,0 +1,131 @@
+"""
+Fan-out of audio chunks produced by a worker thread (the ElevenLabs compose iterator) to any number of
+HTTP listeners on the event loop.
+Each listener has a bounded queue, so the producer never buffers the whole track for a slow listener.
+Listeners that join late, or fall too far behind, replay what has already been written to the local
+.part file and then continue with live chunks; without a local file they are ended instead.
+"""
+import asyncio
+import os
+from pathlib import Path
+from typing import Optional
+
+import anyio
+
+# Chunks buffered per listener before it is considered too slow and dropped
+AUDIO_STREAM_LISTENER_BUFFER = int(os.environ.get("AUDIO_STREAM_LISTENER_BUFFER", "256"))
+BACKLOG_READ_SIZE = 64 * 1024
+
+
+class _Listener:
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+
+class AudioBroadcast:
+    """Live audio of one generation. `publish_threadsafe` is called from the producing thread."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, media_type: str = "audio/mpeg"):
+        self.loop = loop
+        self.media_type = media_type
+        # Where the producer writes the same bytes, for replaying to late listeners (optional)
+        self.backlog_paths: list[Path] = []
+        self.published = 0
+        self.closed = False
+        self.error: Optional[str] = None
+        self._listeners: set[_Listener] = set()
+        self._restarts = 0
+
+    def publish_threadsafe(self, chunk: bytes) -> None:
+        # Never blocks the producer; callbacks run in order on the loop
+        self.loop.call_soon_threadsafe(self._publish, chunk)
+
+    def reset_threadsafe(self) -> None:
+        """The producer restarted from the beginning: end current listeners, start over."""
+        self.loop.call_soon_threadsafe(self._reset)
+
+    def _publish(self, chunk: bytes) -> None:
+        self.published += len(chunk)
+        for listener in list(self._listeners):
+            try:
+                listener.queue.put_nowait(chunk)
+            except asyncio.QueueFull:
+                print("Dropping a slow audio stream listener")
+                self._drop(listener)
+
+    def _drop(self, listener: _Listener) -> None:
+        listener.dropped = True
+        self._listeners.discard(listener)
+        try:
+            listener.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            # The listener still has chunks to read and checks `dropped` once they run out
+            pass
+
+    def _reset(self) -> None:
+        self._restarts += 1
+        for listener in list(self._listeners):
+            self._drop(listener)
+        self.published = 0
+
+    def close(self, error: Optional[str] = None) -> None:
+        """Called on the loop once the producer is done (or failed); ends every listener."""
+        self.closed = True
+        self.error = error
+        for listener in list(self._listeners):
+            self._drop(listener)
+
+    async def _backlog(self, start: int, end: int):
+        for path in self.backlog_paths:
+            try:
+                f = await anyio.open_file(path, "rb")
+            except FileNotFoundError:
+                # The .part file was renamed to its final name in the meantime
+                continue
+            async with f:
+                await f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    data = await f.read(min(BACKLOG_READ_SIZE, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+            return
+
+    async def subscribe(self):
+        """
+        Yield the audio from the start (if a backlog file is available), then live chunks until the end.
+        A listener that falls behind is caught up from the backlog file; without one it is ended instead.
+        """
+        position = 0
+        restarts = self._restarts
+        while True:
+            if self._restarts != restarts:
+                # The producer started over; what was sent so far no longer matches
+                return
+            listener = _Listener(AUDIO_STREAM_LISTENER_BUFFER)
+            if not self.closed:
+                # Register before reading the backlog so no chunk falls between the two
+                self._listeners.add(listener)
+            target = self.published
+            try:
+                if target > position and self.backlog_paths:
+                    async for data in self._backlog(position, target):
+                        position += len(data)
+                        yield data
+                # Without a backlog a late listener starts from the live edge
+                position = target
+                while True:
+                    if listener.queue.empty() and (listener.dropped or self.closed):
+                        break
+                    chunk = await listener.queue.get()
+                    if chunk is None:
+                        break
+                    position += len(chunk)
+                    yield chunk
+            finally:
+                self._listeners.discard(listener)
+            if (self.closed and position >= self.published) or not self.backlog_paths:
+                return
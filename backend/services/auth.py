@@ -3,10 +3,17 @@ Authentication service for verifying Supabase JWT tokens
 """
 from fastapi import HTTPException, Security, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import create_client, Client
+from supabase import Client
+from cachetools import TLRUCache
+import hashlib
+import threading
+import time
+import jwt
 import os
 from dotenv import load_dotenv
 from pathlib import Path
+from services.supabase_client import get_supabase_client
+from services.repositories import run_blocking
 
 env_path = Path(".") / ".env.local"
 load_dotenv(dotenv_path=env_path)
@@ -14,8 +21,220 @@ load_dotenv(dotenv_path=env_path)
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_SECRET_KEY = os.environ.get("SUPABASE_SECRET_KEY")
 
+# "local" verifies the JWT in-process; "remote" calls supabase.auth.get_user on every request
+AUTH_VERIFY_MODE = os.environ.get("AUTH_VERIFY_MODE", "local").lower()
+
+# Legacy projects sign with a shared HS256 secret; the previous secret is accepted during rotation
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_PREVIOUS_SECRET = os.environ.get("SUPABASE_JWT_PREVIOUS_SECRET")
+# Projects with asymmetric signing keys publish them as a JWKS set
+SUPABASE_JWKS_URL = os.environ.get("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+# When local verification cannot resolve a signing key, fall back to the remote check. On by default when no
+# SUPABASE_JWT_SECRET is set, so projects still signing with the legacy secret keep working (over the network)
+# until it is configured; set it to false to answer 500 instead.
+AUTH_REMOTE_FALLBACK = (os.environ.get("AUTH_REMOTE_FALLBACK") or ("false" if SUPABASE_JWT_SECRET else "true")).lower() == "true"
+SUPABASE_JWT_AUDIENCE = os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_CACHE_TTL_SECONDS = int(os.environ.get("JWKS_CACHE_TTL_SECONDS", "600"))
+JWT_LEEWAY_SECONDS = int(os.environ.get("JWT_LEEWAY_SECONDS", "30"))
+
+# Verified tokens are remembered until the earlier of their exp and this TTL
+TOKEN_CACHE_TTL_SECONDS = int(os.environ.get("TOKEN_CACHE_TTL_SECONDS", "300"))
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get("TOKEN_CACHE_MAX_SIZE", "10000"))
+
+ASYMMETRIC_ALGORITHMS = {"RS256", "ES256"}
+
 security = HTTPBearer()
 
+# Created lazily so the JWKS set is only fetched by projects that use asymmetric keys
+_jwks_client = None
+
+
+class SigningKeyUnavailable(Exception):
+    """Raised when no key is available to verify a token locally."""
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified tokens. Entries are keyed by the SHA-256 of the token,
+    so raw tokens are never stored, and expire at the earlier of the token's exp and the TTL.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._entries = TLRUCache(
+            maxsize=max_size,
+            ttu=lambda _key, value, _now: value[1],
+            timer=time.time,
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revocations = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(self._key(token))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            user, _ = entry
+        return {**user, "token": token}
+
+    def put(self, token: str, user: dict, token_exp: float = None) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        if self.ttl_seconds <= 0 or expires_at <= time.time():
+            return
+        cached_user = {k: v for k, v in user.items() if k != "token"}
+        with self._lock:
+            self._entries[self._key(token)] = (cached_user, expires_at)
+
+    def revoke(self, token: str) -> bool:
+        """Drop a single token, e.g. on logout. Returns True if it was cached."""
+        with self._lock:
+            removed = self._entries.pop(self._key(token), None) is not None
+            if removed:
+                self.revocations += 1
+        return removed
+
+    def revoke_user(self, user_id: str) -> int:
+        """Drop every cached token that belongs to a user. Returns the number removed."""
+        with self._lock:
+            keys = [k for k, (user, _) in self._entries.items() if user.get("user_id") == user_id]
+            for k in keys:
+                del self._entries[k]
+            self.revocations += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._entries.expire()
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self._entries.maxsize,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revocations": self.revocations,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+token_cache = VerifiedTokenCache(max_size=TOKEN_CACHE_MAX_SIZE, ttl_seconds=TOKEN_CACHE_TTL_SECONDS)
+
+
+def revoke_token(token: str) -> bool:
+    """Forget a verified token so the next request with it is verified again."""
+    return token_cache.revoke(token)
+
+
+def _token_exp(token: str):
+    """Read exp from an already-verified token without checking the signature again."""
+    try:
+        return jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.InvalidTokenError:
+        return None
+
+
+def get_jwks_client() -> jwt.PyJWKClient:
+    """Return the process-wide JWKS client. The key set is cached for JWKS_CACHE_TTL_SECONDS
+    and re-fetched immediately when a token carries an unknown key id (key rotation)."""
+    global _jwks_client
+    if _jwks_client is None:
+        if not SUPABASE_JWKS_URL:
+            raise SigningKeyUnavailable("SUPABASE_JWKS_URL is not configured")
+        _jwks_client = jwt.PyJWKClient(
+            SUPABASE_JWKS_URL,
+            cache_jwk_set=True,
+            lifespan=JWKS_CACHE_TTL_SECONDS,
+            headers={"apikey": SUPABASE_SECRET_KEY} if SUPABASE_SECRET_KEY else None,
+            timeout=10,
+        )
+    return _jwks_client
+
+
+def _decode(token: str, key, algorithm: str) -> dict:
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=SUPABASE_JWT_AUDIENCE,
+        leeway=JWT_LEEWAY_SECONDS,
+        options={"require": ["exp", "sub", "aud"]},
+    )
+
+
+def verify_token_locally(token: str) -> dict:
+    """
+    Verify a Supabase JWT without a network round trip (signature, exp, aud, sub, email).
+    Raises jwt.InvalidTokenError for bad tokens and SigningKeyUnavailable when no key can be resolved.
+    """
+    algorithm = jwt.get_unverified_header(token).get("alg")
+
+    if algorithm == "HS256":
+        secrets = [s for s in (SUPABASE_JWT_SECRET, SUPABASE_JWT_PREVIOUS_SECRET) if s]
+        if not secrets:
+            raise SigningKeyUnavailable("SUPABASE_JWT_SECRET is not configured")
+        claims = None
+        for i, secret in enumerate(secrets):
+            try:
+                claims = _decode(token, secret, algorithm)
+                break
+            except jwt.InvalidSignatureError:
+                if i == len(secrets) - 1:
+                    raise
+    elif algorithm in ASYMMETRIC_ALGORITHMS:
+        try:
+            signing_key = get_jwks_client().get_signing_key_from_jwt(token)
+        except jwt.PyJWKClientError as e:
+            raise SigningKeyUnavailable(str(e))
+        claims = _decode(token, signing_key.key, algorithm)
+    else:
+        raise jwt.InvalidAlgorithmError(f"Unsupported token algorithm: {algorithm}")
+
+    if "email" not in claims:
+        raise jwt.MissingRequiredClaimError("email")
+
+    return {
+        "user_id": claims["sub"],
+        "email": claims["email"],
+        "token": token,
+    }
+
+
+def verify_token_remotely(token: str) -> dict:
+    """Verify the token by asking Supabase for the user it belongs to."""
+    supabase: Client = get_supabase_client()
+
+    # Verify the token by getting the user
+    response = supabase.auth.get_user(token)
+
+    if not response.user:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid or expired token."
+        )
+
+    return {
+        "user_id": response.user.id,
+        "email": response.user.email,
+        "token": token
+    }
+
 
 async def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)) -> dict:
     """
@@ -27,33 +246,56 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Security(secu
             status_code=401,
             detail="Authentication required. Missing authorization header."
         )
-    
+
     token = credentials.credentials
-    
+
+    cached_user = token_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+
+    user_data = await _verify_uncached(token)
+    token_cache.put(token, user_data, token_exp=_token_exp(token))
+    return user_data
+
+
+def _needs_jwks(token: str) -> bool:
+    try:
+        return jwt.get_unverified_header(token).get("alg") in ASYMMETRIC_ALGORITHMS
+    except jwt.InvalidTokenError:
+        return False
+
+
+async def _verify_uncached(token: str) -> dict:
+    if AUTH_VERIFY_MODE == "local":
+        try:
+            if _needs_jwks(token):
+                # The signing key may have to be fetched (JWKS cache miss or key rotation): keep it off the event loop
+                return await run_blocking(verify_token_locally, token)
+            return verify_token_locally(token)
+        except jwt.InvalidTokenError as e:
+            raise HTTPException(
+                status_code=401,
+                detail=f"Authentication failed: {str(e)}"
+            )
+        except SigningKeyUnavailable as e:
+            if not AUTH_REMOTE_FALLBACK:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Server configuration error. Cannot verify token locally: {str(e)}"
+                )
+            print(f"Local token verification unavailable ({e}), falling back to Supabase")
+
     if not SUPABASE_URL or not SUPABASE_SECRET_KEY:
         raise HTTPException(
             status_code=500,
             detail="Server configuration error. Supabase credentials not set."
         )
-    
+
     try:
-        # Use Supabase client to verify the token
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_SECRET_KEY)
-        
-        # Verify the token by getting the user
-        response = supabase.auth.get_user(token)
-        
-        if not response.user:
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid or expired token."
-            )
-        
-        return {
-            "user_id": response.user.id,
-            "email": response.user.email,
-            "token": token
-        }
+        # Network round trip to Supabase Auth
+        return await run_blocking(verify_token_remotely, token)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=401,
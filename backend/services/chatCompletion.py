@@ -1,8 +1,16 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+import asyncio
+import copy
 import os
 from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
+from fastapi import Request
+import httpx
 import json
+from collections import defaultdict
+from services.llm_cache import llm_cache, cache_key
+from services.resilience import openai_policy
 
 # Get the directory where this file is located, then go up to backend directory
 script_dir = Path(__file__).parent.parent
@@ -12,31 +20,264 @@ load_dotenv(dotenv_path=env_path)
 # Also try loading from current directory as fallback
 load_dotenv()
 
-def chat_completion_json(system_prompt: str, user_prompt: str, model: str = "gpt-4o", temperature: float = 0.7):
+# Connection pool shared by every completion call in this process
+OPENAI_HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "50"))
+OPENAI_HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE", "20"))
+OPENAI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+# Default per-call timeout; callers can override it
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+# How often a waiting call checks whether the HTTP client has gone away
+DISCONNECT_POLL_INTERVAL = float(os.getenv("OPENAI_DISCONNECT_POLL_INTERVAL", "0.5"))
+
+_async_client: Optional[AsyncOpenAI] = None
+_sync_client: Optional[OpenAI] = None
+
+
+# Prompt-token usage per endpoint, to verify the provider's prefix cache hit rate in production
+_usage_stats = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+
+
+class ClientDisconnected(Exception):
+    """Raised when the HTTP client disconnected and the completion was cancelled."""
+
+
+def record_usage(endpoint: Optional[str], usage) -> None:
+    """Accumulate prompt and cached-prompt token counts reported by the provider."""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) or 0
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    stats = _usage_stats[endpoint or "default"]
+    stats["calls"] += 1
+    stats["prompt_tokens"] += prompt_tokens
+    stats["cached_tokens"] += cached_tokens
+    print(f"OpenAI usage [{endpoint or 'default'}]: prompt_tokens={prompt_tokens}, cached_tokens={cached_tokens}")
+
+
+def prompt_cache_stats() -> dict:
+    return {
+        endpoint: {**stats, "cached_ratio": stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0}
+        for endpoint, stats in _usage_stats.items()
+    }
+
+
+def _api_key() -> str:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OPENAI_API_KEY not found in environment variables")
-    
-    client = OpenAI(api_key=api_key)
-    
+    return api_key
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OPENAI_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=OPENAI_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Return the process-wide AsyncOpenAI client."""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=_api_key(),
+            http_client=DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout()),
+            # Retries are handled by openai_policy, with backoff, rate limiting and circuit breaking
+            max_retries=0,
+        )
+    return _async_client
+
+
+def get_openai_client() -> OpenAI:
+    """Return the process-wide synchronous client used by scripts."""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = OpenAI(
+            api_key=_api_key(),
+            http_client=DefaultHttpxClient(limits=_limits(), timeout=_timeout()),
+            max_retries=0,
+        )
+    return _sync_client
+
+
+async def close_openai_clients():
+    """Close pooled connections. Called from the lifespan hook on shutdown."""
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.close()
+    if _sync_client is not None:
+        _sync_client.close()
+    _async_client = None
+    _sync_client = None
+
+
+async def cancel_on_disconnect(awaitable, request: Optional[Request]):
+    """Await `awaitable`, cancelling it if the HTTP client behind `request` disconnects first."""
+    if request is None:
+        return await awaitable
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected("Client disconnected before the completion finished")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _messages(system_prompt: str, user_prompt: str) -> list[dict]:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _parse_json_response(response) -> dict:
+    print("response: ", response.choices[0].message.content)
+    content = response.choices[0].message.content
+    if not content:
+        raise ValueError("Empty response from OpenAI API")
+    return json.loads(content)
+
+
+async def achat_completion_json(
+    system_prompt: str,
+    user_prompt: str,
+    model: str = "gpt-4o",
+    temperature: float = 0.7,
+    timeout: Optional[float] = None,
+    request: Optional[Request] = None,
+    cache_endpoint: Optional[str] = None,
+):
+    """
+    Async JSON chat completion on the shared AsyncOpenAI client.
+    Pass the incoming `request` to cancel the call when its client disconnects, and
+    `cache_endpoint` to serve identical calls from the response cache when it is enabled for that endpoint.
+    """
+    use_cache = llm_cache.enabled_for(cache_endpoint)
+    if use_cache:
+        key = cache_key(model, temperature, system_prompt, user_prompt)
+        cached = await llm_cache.aget(cache_endpoint, key)
+        if cached is not None:
+            print(f"LLM cache hit for {cache_endpoint}")
+            return copy.deepcopy(cached)
+
+    client = get_async_openai_client()
+
     try:
         print("system_prompt: ", system_prompt)
         print("user_prompt: ", user_prompt)
-        response = client.chat.completions.create(
+        response = await cancel_on_disconnect(
+            openai_policy.acall(lambda: client.chat.completions.create(
+                model=model,
+                temperature=temperature,
+                messages=_messages(system_prompt, user_prompt),
+                response_format={"type": "json_object"},
+                timeout=timeout if timeout is not None else OPENAI_TIMEOUT,
+            )),
+            request,
+        )
+        record_usage(cache_endpoint, response.usage)
+        result = _parse_json_response(response)
+    except ClientDisconnected:
+        raise
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Failed to parse JSON response from OpenAI: {e}")
+    except Exception as e:
+        raise RuntimeError(f"Error calling OpenAI API: {e}")
+
+    if use_cache:
+        await llm_cache.aput(cache_endpoint, key, result)
+        return copy.deepcopy(result)
+    return result
+
+
+async def astream_chat_completion_json(
+    system_prompt: str,
+    user_prompt: str,
+    model: str = "gpt-4o",
+    temperature: float = 0.7,
+    timeout: Optional[float] = None,
+    cache_endpoint: Optional[str] = None,
+):
+    """
+    Stream a JSON chat completion (stream=True), yielding text deltas as they arrive.
+    A cached response is replayed as a single chunk; a completed response is stored in the cache.
+    """
+    use_cache = llm_cache.enabled_for(cache_endpoint)
+    if use_cache:
+        key = cache_key(model, temperature, system_prompt, user_prompt)
+        cached = await llm_cache.aget(cache_endpoint, key)
+        if cached is not None:
+            print(f"LLM cache hit for {cache_endpoint}")
+            yield json.dumps(cached)
+            return
+
+    client = get_async_openai_client()
+
+    print("system_prompt: ", system_prompt)
+    print("user_prompt: ", user_prompt)
+    parts = []
+    try:
+        # Only opening the stream is retried; a failure mid-stream would duplicate deltas already yielded
+        stream = await openai_policy.acall(lambda: client.chat.completions.create(
+            model=model,
+            temperature=temperature,
+            messages=_messages(system_prompt, user_prompt),
+            response_format={"type": "json_object"},
+            timeout=timeout if timeout is not None else OPENAI_TIMEOUT,
+            stream=True,
+            stream_options={"include_usage": True},
+        ))
+        async for chunk in stream:
+            if chunk.usage is not None:
+                record_usage(cache_endpoint, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        raise RuntimeError(f"Error calling OpenAI API: {e}")
+
+    content = "".join(parts)
+    print("response: ", content)
+    if not content:
+        raise ValueError("Empty response from OpenAI API")
+    if use_cache:
+        try:
+            await llm_cache.aput(cache_endpoint, key, json.loads(content))
+        except json.JSONDecodeError:
+            pass
+
+
+def chat_completion_json(system_prompt: str, user_prompt: str, model: str = "gpt-4o", temperature: float = 0.7):
+    """Blocking variant kept for scripts; request handlers should use achat_completion_json."""
+    client = get_openai_client()
+
+    try:
+        print("system_prompt: ", system_prompt)
+        print("user_prompt: ", user_prompt)
+        response = openai_policy.call(lambda: client.chat.completions.create(
             model=model,
             temperature=temperature,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
+            messages=_messages(system_prompt, user_prompt),
             response_format={"type": "json_object"}
-        )
-        print("response: ", response.choices[0].message.content)
-        content = response.choices[0].message.content
-        if not content:
-            raise ValueError("Empty response from OpenAI API")
-        
-        return json.loads(content)
+        ))
+        record_usage(None, response.usage)
+        return _parse_json_response(response)
     except json.JSONDecodeError as e:
         raise ValueError(f"Failed to parse JSON response from OpenAI: {e}")
     except Exception as e:
@@ -0,0 +1,115 @@
+"""
+Prompt-keyed cache for album cover generation, in two levels:
+1. (normalized title, description, Gemini model) -> enhanced visual description
+2. (final image prompt, image backend, number of images) -> the stored covers
+A repeat request skips both paid model calls and only checks that the stored cover still exists.
+Each level is bounded (LRU) and entries expire after their TTL.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+from cachetools import TTLCache
+
+COVER_CACHE_ENABLED = os.environ.get("COVER_CACHE_ENABLED", "true").lower() == "true"
+COVER_CACHE_MAX_ENTRIES = int(os.environ.get("COVER_CACHE_MAX_ENTRIES", "1024"))
+COVER_DESCRIPTION_CACHE_TTL_SECONDS = int(os.environ.get("COVER_DESCRIPTION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+COVER_IMAGE_CACHE_TTL_SECONDS = int(os.environ.get("COVER_IMAGE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def _normalize(text: str) -> str:
+    # Case and whitespace differences should not cost another generation
+    return " ".join(text.split()).casefold()
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+
+def description_key(title: str, description: str, model: Optional[str]) -> str:
+    return _hash(_normalize(title), _normalize(description), model)
+
+
+def image_key(image_prompt: str, backend: str, number_of_images: int) -> str:
+    return _hash(image_prompt, backend, number_of_images)
+
+
+class _Level:
+    def __init__(self, name: str, max_entries: int, ttl_seconds: int):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self._entries = TTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+
+class CoverPromptCache:
+    """Both levels, shared by every request in this process."""
+
+    def __init__(self, enabled: bool, max_entries: int, description_ttl_seconds: int, image_ttl_seconds: int):
+        self.enabled = enabled
+        self._descriptions = _Level("descriptions", max_entries, description_ttl_seconds)
+        self._images = _Level("images", max_entries, image_ttl_seconds)
+        self._lock = threading.Lock()
+
+    def _get(self, level: _Level, key: str):
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = level._entries.get(key)
+            if value is None:
+                level.misses += 1
+            else:
+                level.hits += 1
+            return value
+
+    def _put(self, level: _Level, key: str, value) -> None:
+        if self.enabled and level.ttl_seconds > 0:
+            with self._lock:
+                level._entries[key] = value
+
+    def get_description(self, key: str) -> Optional[str]:
+        return self._get(self._descriptions, key)
+
+    def put_description(self, key: str, description: str) -> None:
+        self._put(self._descriptions, key, description)
+
+    def get_images(self, key: str) -> Optional[list[dict]]:
+        return self._get(self._images, key)
+
+    def put_images(self, key: str, candidates: list[dict]) -> None:
+        self._put(self._images, key, candidates)
+
+    def invalidate_images(self, key: str) -> None:
+        """The stored cover is gone (e.g. deleted from the bucket)."""
+        with self._lock:
+            if self._images._entries.pop(key, None) is not None:
+                self._images.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {"enabled": self.enabled}
+            for level in (self._descriptions, self._images):
+                level._entries.expire()
+                lookups = level.hits + level.misses
+                result[level.name] = {
+                    "size": len(level._entries),
+                    "max_size": level._entries.maxsize,
+                    "ttl_seconds": level.ttl_seconds,
+                    "hits": level.hits,
+                    "misses": level.misses,
+                    "invalidations": level.invalidations,
+                    "hit_rate": level.hits / lookups if lookups else 0.0,
+                }
+            return result
+
+
+cover_cache = CoverPromptCache(
+    enabled=COVER_CACHE_ENABLED,
+    max_entries=COVER_CACHE_MAX_ENTRIES,
+    description_ttl_seconds=COVER_DESCRIPTION_CACHE_TTL_SECONDS,
+    image_ttl_seconds=COVER_IMAGE_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,106 @@
+"""
+Ingest of generated album covers: the image is decoded once and resized to a few widths, each encoded as
+WebP and JPEG, so list views can load a small thumbnail instead of the full-size PNG.
+Every file is named by the SHA-256 of its bytes, so identical covers (and their derivatives) are stored once.
+The result is a srcset-style manifest saved on the final_compositions row (cover_images).
+Pillow is optional: without it only the original image is stored, as before.
+"""
+import asyncio
+import hashlib
+import io
+import os
+from typing import Optional
+
+from services.image_generation import run_cover_blocking
+from services.repositories import StorageRepository
+
+# Try to import Pillow, but don't fail if it's not installed
+try:
+    from PIL import Image
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+    Image = None
+
+COVER_SIZES = tuple(int(size) for size in os.environ.get("COVER_SIZES", "64,200,512,1024").split(","))
+COVER_WEBP_QUALITY = int(os.environ.get("COVER_WEBP_QUALITY", "80"))
+COVER_JPEG_QUALITY = int(os.environ.get("COVER_JPEG_QUALITY", "85"))
+# Folder of the album-covers bucket holding content-addressed covers
+COVERS_FOLDER = "covers"
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": COVER_WEBP_QUALITY, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": COVER_JPEG_QUALITY, "optimize": True, "progressive": True}),
+}
+
+
+def _content_path(data: bytes, extension: str) -> str:
+    return f"{COVERS_FOLDER}/{hashlib.sha256(data).hexdigest()}.{extension}"
+
+
+def make_derivatives(image_data: bytes) -> list[dict]:
+    """Blocking (CPU). Every size in every format, largest first; sizes above the original are skipped."""
+    with Image.open(io.BytesIO(image_data)) as original:
+        image = original.convert("RGB")
+    widths = sorted({min(size, image.width) for size in COVER_SIZES}, reverse=True)
+    derivatives = []
+    source = image
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        # Each size is resized from the previous (larger) one, which is cheaper than from the original
+        resized = source if (width, height) == source.size else source.resize((width, height), Image.LANCZOS)
+        for extension, (pil_format, content_type, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            derivatives.append({
+                "width": width,
+                "height": height,
+                "format": extension,
+                "content_type": content_type,
+                "data": buffer.getvalue(),
+            })
+        source = resized
+    return derivatives
+
+
+async def _store(storage: StorageRepository, path: str, data: bytes, content_type: str) -> dict:
+    # Same content, same path: an existing object is reused rather than uploaded again
+    await storage.upload_if_absent(path, data, content_type)
+    return {"path": path, "url": str(storage.get_public_url(path))}
+
+
+async def ingest_cover(storage: StorageRepository, image_data: bytes) -> dict:
+    """
+    Store a generated cover and its derivatives. Returns the original's storage path and URL and the
+    manifest (None without Pillow):
+        {"original": {...}, "images": [{"width", "height", "format", "path", "url"}, ...],
+         "srcset": {"webp": "<url> 64w, <url> 200w, ...", "jpeg": "..."}}
+    """
+    original_path = _content_path(image_data, "png")
+    derivatives = []
+    if PILLOW_AVAILABLE:
+        try:
+            derivatives = await run_cover_blocking(make_derivatives, image_data)
+        except Exception as e:
+            # Still store the original; list views fall back to it
+            print(f"Error creating cover derivatives: {e}")
+
+    uploads = [_store(storage, original_path, image_data, "image/png")]
+    for derivative in derivatives:
+        path = _content_path(derivative["data"], derivative["format"])
+        uploads.append(_store(storage, path, derivative["data"], derivative["content_type"]))
+    # All uploads at once; the Supabase worker pool bounds how many run in parallel
+    original, *stored = await asyncio.gather(*uploads)
+
+    manifest: Optional[dict] = None
+    if derivatives:
+        images = [
+            {"width": d["width"], "height": d["height"], "format": d["format"], **location}
+            for d, location in zip(derivatives, stored)
+        ]
+        srcset = {
+            extension: ", ".join(f"{image['url']} {image['width']}w" for image in reversed(images) if image["format"] == extension)
+            for extension in FORMATS
+        }
+        manifest = {"original": original, "images": images, "srcset": srcset}
+    return {"storage_path": original["path"], "cover_image_url": original["url"], "cover_images": manifest}
@@ -0,0 +1,184 @@
+"""
+Gemini text model used for album cover descriptions, resolved once instead of on every request.
+The available models are listed at startup (lifespan) and re-listed in the background every
+GEMINI_MODEL_TTL_SECONDS. GenerativeModel handles are built once and reused. A model that fails with
+"not found" is marked unhealthy for a while, so the next calls go straight to the next candidate.
+"""
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from services.image_generation import run_cover_blocking
+from services.resilience import gemini_policy
+
+# Try to import google.generativeai, but don't fail if it's not installed
+try:
+    import google.generativeai as genai
+    GEMINI_AVAILABLE = True
+except ImportError:
+    GEMINI_AVAILABLE = False
+    genai = None
+
+env_path = Path("../.") / ".env.local"
+load_dotenv(dotenv_path=env_path)
+
+# Only configure Gemini if it's available
+if GEMINI_AVAILABLE:
+    gemini_api_key: str = os.environ.get("GEMINI_API_KEY")
+    # Optional override of the Gemini API host, e.g. a local stand-in for benchmarks
+    gemini_api_endpoint: str = os.environ.get("GEMINI_API_ENDPOINT")
+    if gemini_api_key and gemini_api_endpoint:
+        genai.configure(api_key=gemini_api_key, transport="rest", client_options={"api_endpoint": gemini_api_endpoint})
+    elif gemini_api_key:
+        genai.configure(api_key=gemini_api_key)
+
+# How long a model listing is used before it is refreshed in the background
+GEMINI_MODEL_TTL_SECONDS = float(os.environ.get("GEMINI_MODEL_TTL_SECONDS", "3600"))
+# How long a model that failed as unavailable is skipped
+GEMINI_MODEL_UNHEALTHY_SECONDS = float(os.environ.get("GEMINI_MODEL_UNHEALTHY_SECONDS", "300"))
+
+# Tried in this order; also the candidates when the models cannot be listed
+PREFERRED_MODELS = ['gemini-1.5-flash', 'gemini-1.5-pro', 'gemini-pro', 'gemini-1.0-pro']
+
+
+def _is_model_unavailable(error: Exception) -> bool:
+    return '404' in str(error) or 'not found' in str(error).lower()
+
+
+class NoGeminiModel(ValueError):
+    pass
+
+
+class GeminiModels:
+    """Ordered model candidates with cached handles and health; shared by every request."""
+
+    def __init__(self, ttl_seconds: float, unhealthy_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.unhealthy_seconds = unhealthy_seconds
+        self._candidates: list[str] = []
+        self._resolved_at: Optional[float] = None
+        self._handles: dict = {}
+        self._unhealthy: dict[str, float] = {}
+        self._refreshing: Optional[asyncio.Task] = None
+        self._refresh_loop: Optional[asyncio.Task] = None
+        self._stats = {"refreshes": 0, "refresh_errors": 0, "marked_unhealthy": 0, "fallbacks": 0}
+
+    async def _list_candidates(self) -> list[str]:
+        available_models = await gemini_policy.acall(lambda: run_cover_blocking(lambda: list(genai.list_models())))
+        found_model_names = []
+        for m in available_models:
+            methods = getattr(m, 'supported_generation_methods', None)
+            if methods and 'generateContent' in methods:
+                model_name = getattr(m, 'name', None) or getattr(m, 'display_name', None)
+                if model_name:
+                    found_model_names.append(model_name.removeprefix('models/'))
+        # Preferred models first (in preference order), then whatever else is available
+        ordered = []
+        for preferred in PREFERRED_MODELS:
+            ordered += [name for name in found_model_names if preferred in name.lower() and name not in ordered]
+        return ordered + [name for name in found_model_names if name not in ordered]
+
+    async def refresh(self) -> None:
+        """List the available models; on failure keep the previous list (or the preferred names)."""
+        try:
+            candidates = await self._list_candidates()
+            self._stats["refreshes"] += 1
+        except Exception as e:
+            self._stats["refresh_errors"] += 1
+            print(f"Could not list Gemini models: {e}")
+            candidates = []
+        previous = self._candidates
+        if candidates:
+            self._candidates = candidates
+        elif not self._candidates:
+            self._candidates = list(PREFERRED_MODELS)
+        self._resolved_at = time.monotonic()
+        if self._candidates != previous:
+            print(f"Gemini models: {', '.join(self._candidates[:4])}{' ...' if len(self._candidates) > 4 else ''}")
+
+    async def _ensure_fresh(self) -> None:
+        if self._resolved_at is None:
+            # Not started through the lifespan (e.g. a script): resolve now
+            await self.refresh()
+        elif time.monotonic() - self._resolved_at > self.ttl_seconds:
+            # Stale: serve with what we have while a fresh listing is fetched
+            self._refresh_in_background()
+
+    def _refresh_in_background(self) -> None:
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.get_running_loop().create_task(self.refresh())
+
+    async def start(self) -> None:
+        """Resolve the models (lifespan startup) and keep them fresh."""
+        if not GEMINI_AVAILABLE or not os.environ.get("GEMINI_API_KEY"):
+            return
+        await self.refresh()
+
+        async def refresh_periodically():
+            while True:
+                await asyncio.sleep(self.ttl_seconds)
+                await self.refresh()
+
+        self._refresh_loop = asyncio.get_running_loop().create_task(refresh_periodically())
+
+    async def stop(self) -> None:
+        for task in (self._refresh_loop, self._refreshing):
+            if task is not None:
+                task.cancel()
+        self._refresh_loop = self._refreshing = None
+
+    def mark_unhealthy(self, name: str) -> None:
+        print(f"Gemini model {name} is unavailable, skipping it for {self.unhealthy_seconds:.0f}s")
+        self._unhealthy[name] = time.monotonic() + self.unhealthy_seconds
+        self._stats["marked_unhealthy"] += 1
+
+    def _healthy(self) -> list[str]:
+        now = time.monotonic()
+        return [name for name in self._candidates if self._unhealthy.get(name, 0) <= now]
+
+    async def preferred(self) -> Optional[str]:
+        """The model the next generate_content call will try first (None if every model is unavailable)."""
+        await self._ensure_fresh()
+        healthy = self._healthy()
+        return healthy[0] if healthy else None
+
+    def _handle(self, name: str):
+        if name not in self._handles:
+            self._handles[name] = genai.GenerativeModel(name)
+        return self._handles[name]
+
+    async def generate_content(self, prompt: str):
+        """Generate with the best healthy model, moving on to the next one if a model is unavailable."""
+        await self._ensure_fresh()
+        errors = []
+        for attempt, name in enumerate(self._healthy()):
+            if attempt:
+                self._stats["fallbacks"] += 1
+            try:
+                model = self._handle(name)
+                return await gemini_policy.acall(lambda: run_cover_blocking(model.generate_content, prompt))
+            except Exception as e:
+                if not _is_model_unavailable(e):
+                    raise
+                errors.append(f"{name}: {e}")
+                self.mark_unhealthy(name)
+        raise NoGeminiModel(
+            "No working Gemini model found. Please check your GEMINI_API_KEY and ensure it has access to Gemini models. "
+            "Try checking the Google AI Studio (https://aistudio.google.com/) to see which models are available for your API key. "
+            f"Errors: {'; '.join(errors) or 'every model is marked unavailable'}"
+        )
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "candidates": self._candidates,
+            "unhealthy": sorted(name for name in self._candidates if name not in self._healthy()),
+            "age_seconds": round(time.monotonic() - self._resolved_at, 1) if self._resolved_at is not None else None,
+        }
+
+
+gemini_models = GeminiModels(GEMINI_MODEL_TTL_SECONDS, GEMINI_MODEL_UNHEALTHY_SECONDS)
@@ -0,0 +1,156 @@
+"""
+Image generation backends for album covers, created once per process and reused by every request.
+IMAGE_GENERATION_BACKEND selects the provider:
+- "vertex": Vertex AI Imagen. aiplatform.init and the model load happen once, on first use or at startup.
+- "stub": deterministic PNGs derived from the prompt, for tests and benchmarks (no credentials needed).
+"""
+import hashlib
+import os
+from abc import ABC, abstractmethod
+import struct
+import threading
+import zlib
+from functools import partial
+from typing import Optional
+
+import anyio
+
+from services.resilience import ProviderPolicy, imagen_policy
+
+IMAGE_GENERATION_BACKEND = os.environ.get("IMAGE_GENERATION_BACKEND", "vertex").lower()
+# Worker threads for the blocking cover SDK calls (Gemini descriptions and image generation), separate from
+# the Supabase pool so slow renders never starve database and storage calls
+COVER_THREAD_LIMIT = int(os.environ.get("COVER_THREAD_LIMIT", "4"))
+IMAGEN_MODEL = os.environ.get("IMAGEN_MODEL", "models/imagen-4.0-fast-generate-001")
+# Edge length of stub images
+STUB_IMAGE_SIZE = int(os.environ.get("STUB_IMAGE_SIZE", "256"))
+
+
+_cover_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def _get_cover_limiter() -> anyio.CapacityLimiter:
+    # Created lazily because a CapacityLimiter must be built inside the running event loop
+    global _cover_limiter
+    if _cover_limiter is None:
+        _cover_limiter = anyio.CapacityLimiter(COVER_THREAD_LIMIT)
+    return _cover_limiter
+
+
+async def run_cover_blocking(func, *args, **kwargs):
+    """Run a blocking cover-generation SDK call in the bounded cover worker pool."""
+    return await anyio.to_thread.run_sync(partial(func, *args, **kwargs), limiter=_get_cover_limiter())
+
+
+class ImageBackend(ABC):
+    """A provider turning a prompt into one or more PNG images."""
+
+    name = "base"
+    # Retry, rate limit and circuit breaker for a paid provider (None: called directly)
+    policy: Optional[ProviderPolicy] = None
+
+    def warm(self) -> None:
+        """Blocking. Set up clients and sessions ahead of the first request."""
+
+    @abstractmethod
+    def generate(self, prompt: str, number_of_images: int = 1, aspect_ratio: str = "1:1") -> list[bytes]:
+        """Blocking. PNG bytes of each generated image (the provider may return fewer than asked for)."""
+
+    async def agenerate(self, prompt: str, number_of_images: int = 1, aspect_ratio: str = "1:1") -> list[bytes]:
+        # Blocking SDK calls: keep them off the event loop, which may be streaming audio meanwhile
+        if self.policy is None:
+            return await run_cover_blocking(self.generate, prompt, number_of_images, aspect_ratio)
+        return await self.policy.acall(
+            lambda: run_cover_blocking(self.generate, prompt, number_of_images, aspect_ratio)
+        )
+
+
+class VertexImagenBackend(ImageBackend):
+    name = "vertex"
+    policy = imagen_policy
+
+    def __init__(self, project_id: str, location: str, model_name: str):
+        self.project_id = project_id
+        self.location = location
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def warm(self) -> None:
+        self._get_model()
+
+    def _get_model(self):
+        # Once per process: init authenticates and from_pretrained resolves the model
+        with self._lock:
+            if self._model is None:
+                from google.cloud import aiplatform
+                from vertexai.preview.vision_models import ImageGenerationModel
+
+                aiplatform.init(project=self.project_id, location=self.location)
+                self._model = ImageGenerationModel.from_pretrained(self.model_name)
+                print(f"Vertex AI Imagen ready: {self.model_name} ({self.location})")
+            return self._model
+
+    def generate(self, prompt: str, number_of_images: int = 1, aspect_ratio: str = "1:1") -> list[bytes]:
+        response = self._get_model().generate_images(
+            prompt=prompt,
+            number_of_images=number_of_images,
+            aspect_ratio=aspect_ratio,
+        )
+        return [image._image_bytes for image in response.images if image._image_bytes]
+
+
+def _png(width: int, height: int, rows: list[bytes]) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    raw = b"".join(b"\x00" + row for row in rows)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+class StubImageBackend(ImageBackend):
+    """Same prompt, same images: a vertical gradient between two colors taken from the prompt's hash."""
+
+    name = "stub"
+
+    def __init__(self, size: int = STUB_IMAGE_SIZE):
+        self.size = size
+
+    def generate(self, prompt: str, number_of_images: int = 1, aspect_ratio: str = "1:1") -> list[bytes]:
+        images = []
+        for index in range(number_of_images):
+            digest = hashlib.sha256(f"{index}:{prompt}".encode()).digest()
+            top, bottom = digest[:3], digest[3:6]
+            rows = []
+            for y in range(self.size):
+                pixel = bytes(top[c] + (bottom[c] - top[c]) * y // max(1, self.size - 1) for c in range(3))
+                rows.append(pixel * self.size)
+            images.append(_png(self.size, self.size, rows))
+        return images
+
+
+def create_image_backend() -> Optional[ImageBackend]:
+    """The configured backend, or None if image generation is not set up."""
+    if IMAGE_GENERATION_BACKEND == "stub":
+        return StubImageBackend()
+    if IMAGE_GENERATION_BACKEND == "vertex":
+        project_id = os.environ.get("GOOGLE_CLOUD_PROJECT_ID")
+        if not project_id:
+            return None
+        return VertexImagenBackend(project_id, os.environ.get("GOOGLE_CLOUD_LOCATION", "us-central1"), IMAGEN_MODEL)
+    print(f"Unknown IMAGE_GENERATION_BACKEND '{IMAGE_GENERATION_BACKEND}', image generation is disabled")
+    return None
+
+
+image_backend: Optional[ImageBackend] = create_image_backend()
+
+
+async def warm_image_backend() -> None:
+    """Initialize the backend at startup; a failure is logged and retried on first use."""
+    if image_backend is None:
+        return
+    try:
+        await run_cover_blocking(image_backend.warm)
+    except Exception as e:
+        print(f"Image generation backend '{image_backend.name}' not ready: {e}")
@@ -0,0 +1,161 @@
+"""
+Durable SQLite journal of background jobs.
+Each job row keeps its payload, status and the checkpoints of the stages it has completed, so a job
+interrupted by a restart can be resumed from its last checkpoint. Rows are leased to the process
+running them; a lease that is not renewed (the process died) lets another process claim the job.
+"""
+import json
+import sqlite3
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+import anyio
+
+UNFINISHED = ("queued", "running")
+
+
+class JournalConflict(Exception):
+    """Raised by `add` when the user already has a job with the same idempotency key."""
+
+
+class LeaseLost(Exception):
+    """Raised by `save` when another process has claimed the job (this process's lease expired)."""
+
+
+class JobJournal:
+    """Job rows with leases, stored in a local SQLite file shared by every worker process on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, user_id TEXT NOT NULL, payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, stage TEXT, checkpoints TEXT NOT NULL DEFAULT '{}', result TEXT, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "lease_owner TEXT, lease_expires_at REAL NOT NULL DEFAULT 0, idempotency_key TEXT)"
+            )
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "idempotency_key" not in columns:
+                # Journals created before idempotency keys
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN idempotency_key TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_kind_status ON jobs(kind, status)")
+            self._conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_idempotency_key ON jobs(kind, user_id, idempotency_key) "
+                "WHERE idempotency_key IS NOT NULL"
+            )
+        return self._conn
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> dict:
+        data = dict(row)
+        data["payload"] = json.loads(data["payload"])
+        data["checkpoints"] = json.loads(data["checkpoints"])
+        data["result"] = json.loads(data["result"]) if data["result"] else None
+        return data
+
+    def add(self, job, owner: str, lease_until: float) -> None:
+        with self._lock:
+            db = self._db()
+            try:
+                db.execute(
+                    "INSERT INTO jobs (id, kind, user_id, payload, status, stage, checkpoints, created_at, updated_at, "
+                    "lease_owner, lease_expires_at, idempotency_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job.id, job.kind, job.user_id, json.dumps(job.payload), job.status, job.stage,
+                     json.dumps(job.checkpoints), job.created_at, job.updated_at, owner, lease_until,
+                     job.idempotency_key),
+                )
+            except sqlite3.IntegrityError as e:
+                db.rollback()
+                raise JournalConflict(str(e))
+            db.commit()
+
+    def save(self, job, owner: str) -> None:
+        """Write the job's progress, as long as `owner` still holds its lease."""
+        with self._lock:
+            db = self._db()
+            updated = db.execute(
+                "UPDATE jobs SET status = ?, stage = ?, checkpoints = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (job.status, job.stage, json.dumps(job.checkpoints, default=str),
+                 json.dumps(job.result, default=str) if job.result is not None else None,
+                 job.error, job.updated_at, job.id, owner),
+            ).rowcount
+            db.commit()
+        if not updated:
+            raise LeaseLost(f"Job {job.id} is now run by another process")
+
+    def renew(self, owner: str, job_ids: list[str], lease_until: float) -> None:
+        if not job_ids:
+            return
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND lease_owner = ?",
+                [(lease_until, job_id, owner) for job_id in job_ids],
+            )
+            db.commit()
+
+    def release(self, owner: str, job_ids: list[str]) -> None:
+        """Give up the leases so another process can resume these jobs immediately."""
+        self.renew(owner, job_ids, 0)
+
+    def claim_expired(self, kind: str, owner: str, lease_until: float) -> list[dict]:
+        """Take over unfinished jobs whose lease has run out, oldest first."""
+        now = time.time()
+        claimed = []
+        with self._lock:
+            db = self._db()
+            rows = db.execute(
+                f"SELECT * FROM jobs WHERE kind = ? AND status IN ({','.join('?' * len(UNFINISHED))}) "
+                "AND lease_expires_at < ? ORDER BY created_at",
+                (kind, *UNFINISHED, now),
+            ).fetchall()
+            for row in rows:
+                # Conditional update, so only one process wins each job
+                updated = db.execute(
+                    "UPDATE jobs SET lease_owner = ?, lease_expires_at = ? WHERE id = ? AND lease_expires_at < ?",
+                    (owner, lease_until, row["id"], now),
+                ).rowcount
+                if updated:
+                    claimed.append(self._row(row))
+            db.commit()
+        return claimed
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def find_by_key(self, kind: str, user_id: str, idempotency_key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT * FROM jobs WHERE kind = ? AND user_id = ? AND idempotency_key = ?",
+                (kind, user_id, idempotency_key),
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def prune(self, finished_before: float) -> int:
+        with self._lock:
+            db = self._db()
+            removed = db.execute(
+                f"DELETE FROM jobs WHERE status NOT IN ({','.join('?' * len(UNFINISHED))}) AND updated_at < ?",
+                (*UNFINISHED, finished_before),
+            ).rowcount
+            db.commit()
+        return removed
+
+    async def arun(self, method, *args):
+        """Run one of the blocking methods above in a worker thread."""
+        return await anyio.to_thread.run_sync(partial(method, *args))
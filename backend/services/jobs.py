@@ -0,0 +1,445 @@
+"""
+Background job queue.
+Jobs are queued per user and a fixed pool of worker tasks takes them round-robin across users,
+so one user submitting many jobs cannot starve the others. Each job records its stage-by-stage
+progress, which callers can poll or follow as a stream of events.
+
+With a journal, jobs and their stage checkpoints are also written to SQLite: jobs left unfinished by a
+restart (or by another worker process that died) are claimed and resumed from their last checkpoint,
+and shutdown drains running jobs before handing the rest back to the journal.
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from services.job_journal import JobJournal, JournalConflict, LeaseLost
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    """Raised when a job cannot be accepted because the queue (or the user's share of it) is full."""
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a request with a different payload."""
+
+
+class Job:
+    """One unit of work and its progress."""
+
+    def __init__(
+        self,
+        kind: str,
+        user_id: str,
+        payload: dict,
+        job_id: Optional[str] = None,
+        checkpoints: Optional[dict] = None,
+        created_at: Optional[float] = None,
+        idempotency_key: Optional[str] = None,
+    ):
+        self.id = job_id or str(uuid.uuid4())
+        self.kind = kind
+        self.user_id = user_id
+        self.payload = payload
+        self.idempotency_key = idempotency_key
+        self.status = QUEUED
+        self.stage: Optional[str] = None
+        # State of side tasks running alongside the stages (e.g. the album cover), by task name
+        self.tasks: dict[str, str] = {}
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        # Output of completed stages, keyed by stage name; a resumed job skips these stages
+        self.checkpoints: dict = checkpoints or {}
+        self.created_at = created_at or time.time()
+        self.updated_at = time.time()
+        self.events: list[dict] = []
+        self._changed = asyncio.Event()
+        self._journal: Optional[JobJournal] = None
+        # The lease this process holds on the journal row
+        self._lease_owner: Optional[str] = None
+        # Set once another process has taken the job over; followers then stop here
+        self.handed_off = False
+        if checkpoints:
+            self._publish("status", {"status": QUEUED, "resumed": True, "completed_stages": list(checkpoints)})
+        else:
+            self._publish("status", {"status": QUEUED})
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def _publish(self, event: str, data: dict) -> None:
+        self.updated_at = time.time()
+        self.events.append({"event": event, "data": {"job_id": self.id, **data}, "at": self.updated_at})
+        # Wake every follower, then arm a fresh event for the next update
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def set_stage(self, stage: str, **detail) -> None:
+        self.stage = stage
+        self._publish("stage", {"stage": stage, **detail})
+
+    def set_task(self, task: str, state: str, **detail) -> None:
+        """Progress of a side task; reported apart from `stage`, which follows the main line of stages."""
+        self.tasks = {**self.tasks, task: state}
+        self._publish("task", {"task": task, "state": state, **detail})
+
+    async def checkpoint(self, stage: str, value) -> None:
+        """Record the output of a completed stage (durably, when the queue has a journal)."""
+        # Replaced rather than updated in place: concurrent stages checkpoint while the journal
+        # serializes the previous dict in a worker thread
+        self.checkpoints = {**self.checkpoints, stage: value}
+        await self._save()
+
+    async def _save(self) -> None:
+        if self._journal is not None:
+            await self._journal.arun(self._journal.save, self, self._lease_owner)
+
+    def _start(self) -> None:
+        self.status = RUNNING
+        self._publish("status", {"status": RUNNING})
+
+    def _interrupt(self) -> None:
+        # Back to queued in memory; the journal still says running, so it is resumed after the restart
+        self.status = QUEUED
+        self._publish("status", {"status": QUEUED, "interrupted": True})
+
+    def _hand_off(self) -> None:
+        self.handed_off = True
+        self._publish("status", {"status": self.status, "handed_off": True})
+
+    def _succeed(self, result: dict) -> None:
+        self.status = SUCCEEDED
+        self.result = result
+        self._publish("complete", {"status": SUCCEEDED, "result": result})
+
+    def _fail(self, error: str) -> None:
+        self.status = FAILED
+        self.error = error
+        self._publish("error", {"status": FAILED, "detail": error})
+
+    async def follow(self):
+        """Yield every event of this job, past and future, until it finishes."""
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.finished or self.handed_off:
+                return
+            await self._changed.wait()
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "tasks": self.tasks,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "stages": [e["data"]["stage"] for e in self.events if e["event"] == "stage"],
+            "completed_stages": list(self.checkpoints),
+        }
+
+
+def journal_snapshot(row: dict) -> dict:
+    """Snapshot of a job known only from the journal (e.g. running in another worker process)."""
+    return {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "stage": row["stage"],
+        "tasks": {},
+        "result": row["result"],
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+        "stages": list(row["checkpoints"]),
+        "completed_stages": list(row["checkpoints"]),
+    }
+
+
+JobHandler = Callable[[Job], Awaitable[dict]]
+
+
+class JobQueue:
+    """Bounded worker pool with per-user fair (round-robin) scheduling and an optional durable journal."""
+
+    def __init__(
+        self,
+        kind: str,
+        handler: JobHandler,
+        workers: int,
+        max_queued: int,
+        max_pending_per_user: int,
+        retention_seconds: int,
+        journal: Optional[JobJournal] = None,
+        lease_seconds: int = 60,
+        drain_seconds: int = 120,
+    ):
+        self.kind = kind
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_pending_per_user = max_pending_per_user
+        self.retention_seconds = retention_seconds
+        self.journal = journal
+        self.lease_seconds = lease_seconds
+        self.drain_seconds = drain_seconds
+        # Identifies this process in job leases
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._jobs: dict[str, Job] = {}
+        # (user_id, idempotency key) -> job id
+        self._keys: dict[tuple[str, str], str] = {}
+        self._pending: dict[str, deque[Job]] = {}
+        # Users with queued jobs, in the order they get their next turn
+        self._turns: deque[str] = deque()
+        self._ready: Optional[asyncio.Semaphore] = None
+        self._tasks: list[asyncio.Task] = []
+        self._maintenance: Optional[asyncio.Task] = None
+        self._running: set[Job] = set()
+        self._draining = False
+        self._resumed = 0
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._draining = False
+        self._ready = asyncio.Semaphore(sum(len(q) for q in self._pending.values()))
+        if self.journal is not None:
+            await self.journal.arun(self.journal.prune, time.time() - self.retention_seconds)
+            await self._claim_expired()
+            self._maintenance = asyncio.create_task(self._maintain())
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"Started {self.workers} {self.kind} workers")
+
+    async def stop(self) -> None:
+        """Stop taking jobs, let running ones finish for up to drain_seconds, then hand the rest back."""
+        self._draining = True
+        deadline = time.monotonic() + self.drain_seconds
+        if self._running:
+            print(f"Draining {len(self._running)} running {self.kind} jobs")
+        while self._running and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+
+        tasks = self._tasks + ([self._maintenance] if self._maintenance else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._maintenance = None
+
+        if self.journal is not None:
+            unfinished = [job.id for job in self._jobs.values() if not job.finished]
+            await self.journal.arun(self.journal.release, self.owner, unfinished)
+            if unfinished:
+                print(f"Released {len(unfinished)} unfinished {self.kind} jobs for resumption")
+
+    async def submit(
+        self, user_id: str, payload: dict, idempotency_key: Optional[str] = None, checkpoints: Optional[dict] = None
+    ) -> Job:
+        """Queue a job. `checkpoints` are stage outputs reused from another job; those stages are skipped."""
+        if self._draining:
+            raise QueueFull("Server is shutting down, try again shortly")
+        self._prune()
+        queued = sum(len(q) for q in self._pending.values())
+        if queued >= self.max_queued:
+            raise QueueFull("Too many jobs are queued, try again later")
+        user_jobs = [j for j in self._jobs.values() if j.user_id == user_id and not j.finished]
+        if len(user_jobs) >= self.max_pending_per_user:
+            raise QueueFull(f"At most {self.max_pending_per_user} jobs per user can be pending at once")
+
+        job = Job(self.kind, user_id, payload, idempotency_key=idempotency_key)
+        if checkpoints:
+            job.checkpoints = dict(checkpoints)
+        if self.journal is not None:
+            job._journal = self.journal
+            job._lease_owner = self.owner
+            await self.journal.arun(self.journal.add, job, self.owner, time.time() + self.lease_seconds)
+        self._jobs[job.id] = job
+        if idempotency_key:
+            self._keys[(user_id, idempotency_key)] = job.id
+        self._enqueue(job)
+        return job
+
+    async def submit_once(
+        self, user_id: str, payload: dict, idempotency_key: str, checkpoints: Optional[dict] = None
+    ) -> tuple[dict, bool]:
+        """
+        Submit a job unless this user already submitted one with the same idempotency key, in which case
+        that job (queued, running or finished) is returned instead. Returns (snapshot, created).
+        Raises IdempotencyConflict if the key was used for a different payload.
+        """
+        def existing(found_payload: dict) -> None:
+            if found_payload != payload:
+                raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+
+        job = self._by_key(user_id, idempotency_key)
+        if job is None and self.journal is not None:
+            row = await self.journal.arun(self.journal.find_by_key, self.kind, user_id, idempotency_key)
+            if row is not None:
+                existing(row["payload"])
+                job = self._jobs.get(row["id"])
+                return (job.snapshot() if job else journal_snapshot(row)), False
+            # Another request with the same key may have been submitted meanwhile
+            job = self._by_key(user_id, idempotency_key)
+        if job is not None:
+            existing(job.payload)
+            return job.snapshot(), False
+
+        try:
+            job = await self.submit(user_id, payload, idempotency_key=idempotency_key, checkpoints=checkpoints)
+        except JournalConflict:
+            # Lost the race to another worker process submitting the same key
+            row = await self.journal.arun(self.journal.find_by_key, self.kind, user_id, idempotency_key)
+            existing(row["payload"])
+            return journal_snapshot(row), False
+        return job.snapshot(), True
+
+    def _by_key(self, user_id: str, idempotency_key: str) -> Optional[Job]:
+        job_id = self._keys.get((user_id, idempotency_key))
+        return self._jobs.get(job_id) if job_id else None
+
+    def _enqueue(self, job: Job) -> None:
+        if job.user_id not in self._pending:
+            self._pending[job.user_id] = deque()
+            self._turns.append(job.user_id)
+        self._pending[job.user_id].append(job)
+        if self._ready is not None:
+            self._ready.release()
+
+    def _next(self) -> Job:
+        user_id = self._turns.popleft()
+        jobs = self._pending[user_id]
+        job = jobs.popleft()
+        if jobs:
+            self._turns.append(user_id)
+        else:
+            del self._pending[user_id]
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def get_snapshot(self, job_id: str) -> Optional[tuple[str, dict]]:
+        """(user_id, snapshot) for a job in this process or, failing that, in the journal."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.user_id, job.snapshot()
+        if self.journal is not None:
+            row = await self.journal.arun(self.journal.get, job_id)
+            if row is not None and row["kind"] == self.kind:
+                return row["user_id"], journal_snapshot(row)
+        return None
+
+    async def get_checkpoints(self, job_id: str) -> Optional[tuple[str, dict, dict]]:
+        """(user_id, payload, checkpoints) of a job in this process or, failing that, in the journal."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.user_id, job.payload, job.checkpoints
+        if self.journal is not None:
+            row = await self.journal.arun(self.journal.get, job_id)
+            if row is not None and row["kind"] == self.kind:
+                return row["user_id"], row["payload"], row["checkpoints"]
+        return None
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        for job in [j for j in self._jobs.values() if j.finished and j.updated_at < cutoff]:
+            self._forget(job)
+
+    def _forget(self, job: Job) -> None:
+        """Stop tracking a job in this process; lookups then go to the journal."""
+        self._jobs.pop(job.id, None)
+        if job.idempotency_key:
+            self._keys.pop((job.user_id, job.idempotency_key), None)
+
+    async def _claim_expired(self) -> None:
+        rows = await self.journal.arun(
+            self.journal.claim_expired, self.kind, self.owner, time.time() + self.lease_seconds
+        )
+        for row in rows:
+            job = Job(
+                self.kind, row["user_id"], row["payload"],
+                job_id=row["id"], checkpoints=row["checkpoints"], created_at=row["created_at"],
+                idempotency_key=row["idempotency_key"],
+            )
+            job._journal = self.journal
+            job._lease_owner = self.owner
+            self._jobs[job.id] = job
+            if job.idempotency_key:
+                self._keys[(job.user_id, job.idempotency_key)] = job.id
+            self._enqueue(job)
+            self._resumed += 1
+            print(f"Resuming {self.kind} job {job.id} after stages: {', '.join(row['checkpoints']) or 'none'}")
+
+    async def _maintain(self) -> None:
+        """Renew the leases of this process's jobs and pick up jobs abandoned by dead processes."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                unfinished = [job.id for job in self._jobs.values() if not job.finished]
+                await self.journal.arun(self.journal.renew, self.owner, unfinished, time.time() + self.lease_seconds)
+                if not self._draining:
+                    await self._claim_expired()
+            except Exception as e:
+                print(f"Error maintaining {self.kind} job journal: {e}")
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            await self._ready.acquire()
+            if self._draining:
+                # Leave queued jobs in the journal for the next process
+                self._ready.release()
+                return
+            job = self._next()
+            self._running.add(job)
+            job._start()
+            try:
+                await job._save()
+                result = await self.handler(job)
+                job._succeed(result)
+            except asyncio.CancelledError:
+                job._interrupt()
+                raise
+            except LeaseLost as e:
+                # Another process resumed the job after our lease expired: stop here and leave it to them
+                print(f"{self.kind} job {job.id} stopped: {e}")
+                job._hand_off()
+                self._forget(job)
+                continue
+            except Exception as e:
+                print(f"{self.kind} job {job.id} failed: {e}")
+                job._fail(str(e))
+            finally:
+                self._running.discard(job)
+            try:
+                await job._save()
+            except LeaseLost as e:
+                print(f"{self.kind} job {job.id} finished here, but {e}")
+                job._hand_off()
+                self._forget(job)
+            except Exception as e:
+                print(f"Error journaling {self.kind} job {job.id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "queued": sum(len(q) for q in self._pending.values()),
+            "users_waiting": len(self._turns),
+            "tracked_jobs": len(self._jobs),
+            "resumed": self._resumed,
+            "draining": self._draining,
+        }
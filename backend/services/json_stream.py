@@ -0,0 +1,108 @@
+"""
+Incremental parser for a JSON object that arrives in chunks (e.g. a streamed LLM response).
+Reports each object member as soon as its value is complete, without waiting for the whole document.
+"""
+import json
+from typing import Any, Iterable
+
+
+class IncrementalJSONParser:
+    """
+    Feed text chunks with feed(); each call returns the (path, value) pairs completed by that chunk.
+    Members of the top-level object are always reported; members of nested containers are reported
+    when their path is listed in `expand`, e.g. expand=[("lyrics",)] reports every lyrics section.
+    """
+
+    def __init__(self, expand: Iterable[tuple] = ()):
+        self.buf = ""
+        self.pos = 0
+        self.stack: list[dict] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.reported_paths = {()} | {tuple(p) for p in expand}
+
+    def feed(self, text: str) -> list[tuple[tuple, Any]]:
+        self.buf += text
+        events = []
+        while self.pos < len(self.buf):
+            i = self.pos
+            ch = self.buf[i]
+            self.pos += 1
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    frame = self.stack[-1] if self.stack else None
+                    if frame and frame["kind"] == "{" and frame["expect_key"]:
+                        frame["key"] = json.loads(self.buf[self.string_start:i + 1])
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+                self._mark_value_start(i)
+            elif ch in "{[":
+                self._mark_value_start(i)
+                self.stack.append({
+                    "kind": ch,
+                    "path": self._child_path(),
+                    "key": None,
+                    "index": 0,
+                    "expect_key": ch == "{",
+                    "value_start": None,
+                })
+            elif ch in "}]":
+                if self.stack:
+                    self._complete_member(self.stack.pop(), i, events)
+            elif ch == ":":
+                if self.stack:
+                    self.stack[-1]["expect_key"] = False
+            elif ch == ",":
+                if self.stack:
+                    frame = self.stack[-1]
+                    self._complete_member(frame, i, events)
+                    if frame["kind"] == "{":
+                        frame["expect_key"] = True
+                        frame["key"] = None
+                    else:
+                        frame["index"] += 1
+            elif not ch.isspace():
+                # Start of a number, true, false or null
+                self._mark_value_start(i)
+        return events
+
+    @property
+    def text(self) -> str:
+        return self.buf
+
+    def _child_path(self) -> tuple:
+        if not self.stack:
+            return ()
+        parent = self.stack[-1]
+        member = parent["key"] if parent["kind"] == "{" else parent["index"]
+        return parent["path"] + (member,)
+
+    def _mark_value_start(self, i: int) -> None:
+        if not self.stack:
+            return
+        frame = self.stack[-1]
+        if frame["value_start"] is None and (frame["kind"] == "[" or not frame["expect_key"]):
+            frame["value_start"] = i
+
+    def _complete_member(self, frame: dict, end: int, events: list) -> None:
+        start = frame["value_start"]
+        frame["value_start"] = None
+        if start is None or frame["path"] not in self.reported_paths:
+            return
+        raw = self.buf[start:end].strip()
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        member = frame["key"] if frame["kind"] == "{" else frame["index"]
+        events.append((frame["path"] + (member,), value))
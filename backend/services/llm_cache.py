@@ -0,0 +1,165 @@
+"""
+Opt-in response cache for JSON chat completions.
+Responses are keyed by a hash of (model, temperature, system_prompt, user_prompt) and kept in an
+in-memory LRU tier in front of a SQLite tier, so replays survive restarts and skip the API entirely.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+import anyio
+from cachetools import LRUCache
+
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "false").lower() == "true"
+# Comma-separated endpoint names allowed to use the cache, or "*" for all
+LLM_CACHE_ENDPOINTS = {e.strip() for e in os.environ.get("LLM_CACHE_ENDPOINTS", "*").split(",") if e.strip()}
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", str(Path(__file__).parent.parent / "cache" / "llm_cache.sqlite3"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_DISK_MAX_ENTRIES", "20000"))
+LLM_CACHE_MAX_AGE_SECONDS = int(os.environ.get("LLM_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+
+def cache_key(model: str, temperature: float, system_prompt: str, user_prompt: str) -> str:
+    payload = json.dumps([model, temperature, system_prompt, user_prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier (memory LRU over SQLite) cache of parsed JSON responses."""
+
+    def __init__(
+        self,
+        path: str,
+        enabled: bool,
+        endpoints: set[str],
+        memory_entries: int,
+        disk_max_entries: int,
+        max_age_seconds: int,
+    ):
+        self.path = path
+        self.enabled = enabled
+        self.endpoints = endpoints
+        self.disk_max_entries = disk_max_entries
+        self.max_age_seconds = max_age_seconds
+        self._memory = LRUCache(maxsize=memory_entries)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stats = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0})
+        self._evictions = 0
+
+    def enabled_for(self, endpoint: Optional[str]) -> bool:
+        if not self.enabled or not endpoint:
+            return False
+        return "*" in self.endpoints or endpoint in self.endpoints
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        return self._conn
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return now - created_at > self.max_age_seconds
+
+    def _get_memory(self, endpoint: str, key: str):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if self._expired(created_at, time.time()):
+                del self._memory[key]
+                return None
+            self._stats[endpoint]["memory_hits"] += 1
+            return value
+
+    def get(self, endpoint: str, key: str):
+        value = self._get_memory(endpoint, key)
+        if value is not None:
+            return value
+        return self._get_disk(endpoint, key)
+
+    def _get_disk(self, endpoint: str, key: str):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and not self._expired(row[1], now):
+                db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                db.commit()
+                value = json.loads(row[0])
+                self._memory[key] = (row[1], value)
+                self._stats[endpoint]["disk_hits"] += 1
+                return value
+
+            self._stats[endpoint]["misses"] += 1
+            return None
+
+    def put(self, endpoint: str, key: str, value) -> None:
+        now = time.time()
+        with self._lock:
+            self._memory[key] = (now, value)
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._evict(db, now)
+            db.commit()
+            self._stats[endpoint]["stores"] += 1
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        removed = db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age_seconds,)).rowcount
+        (count,) = db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.disk_max_entries:
+            removed += db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (count - self.disk_max_entries,),
+            ).rowcount
+        self._evictions += removed
+
+    async def aget(self, endpoint: str, key: str):
+        # Memory hits are served inline; only the SQLite tier goes to a worker thread
+        value = self._get_memory(endpoint, key)
+        if value is not None:
+            return value
+        return await anyio.to_thread.run_sync(self._get_disk, endpoint, key)
+
+    async def aput(self, endpoint: str, key: str, value) -> None:
+        await anyio.to_thread.run_sync(self.put, endpoint, key, value)
+
+    def stats(self) -> dict:
+        endpoints = {}
+        for endpoint, counts in self._stats.items():
+            hits = counts["memory_hits"] + counts["disk_hits"]
+            total = hits + counts["misses"]
+            endpoints[endpoint] = {**counts, "hit_rate": hits / total if total else 0.0}
+        return {
+            "enabled": self.enabled,
+            "endpoints_enabled": sorted(self.endpoints),
+            "memory_entries": len(self._memory),
+            "evictions": self._evictions,
+            "endpoints": endpoints,
+        }
+
+
+llm_cache = LLMResponseCache(
+    path=LLM_CACHE_PATH,
+    enabled=LLM_CACHE_ENABLED,
+    endpoints=LLM_CACHE_ENDPOINTS,
+    memory_entries=LLM_CACHE_MEMORY_ENTRIES,
+    disk_max_entries=LLM_CACHE_DISK_MAX_ENTRIES,
+    max_age_seconds=LLM_CACHE_MAX_AGE_SECONDS,
+)
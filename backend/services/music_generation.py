@@ -0,0 +1,689 @@
+"""
+Final-composition pipeline, run by the background job queue:
+fetch plan -> ElevenLabs composition plan -> lyrics substitution -> compose -> storage upload -> DB row,
+with the album cover generated concurrently from the plan's title and description.
+The ElevenLabs SDK is synchronous, so its calls run in worker threads.
+Composed audio is streamed chunk by chunk, as it arrives, to the storage upload, the local copy and any
+live listeners at once, so a track is never held in memory or read back from disk to be uploaded.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from functools import partial
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import anyio
+from dotenv import load_dotenv
+from elevenlabs import ElevenLabs
+
+from services.album_covers import generate_album_cover_internal
+from services.audio_cache import audio_cache
+from services.audio_stream import AudioBroadcast
+from services.chatCompletion import achat_completion_json
+from services.job_journal import JobJournal
+from services.jobs import Job, JobQueue
+from services.pipeline import Step, run_steps
+from services.prompts import LYRICS_SUBSTITUTION_PROMPT, GENERATE_PROMPT_FOR_ELEVENLABS_COMPOSITION_PLAN
+from services.repositories import (
+    MUSIC_BUCKET,
+    AudioRenderRepository,
+    CompositionPlanRepository,
+    FinalCompositionRepository,
+    StorageRepository,
+    StreamingUpload,
+    run_blocking,
+)
+from services.resilience import elevenlabs_policy
+from services.supabase_client import get_supabase_client
+
+env_path = Path("../.") / ".env.local"
+load_dotenv(dotenv_path=env_path)
+
+# Song duration: 1 minute
+length_ms = 1 * 60 * 1000  # 60_000 ms
+
+elevenlabs_api_key: str = os.environ.get("ELEVENLABS_API_KEY")
+
+if not elevenlabs_api_key:
+    raise ValueError("ELEVENLABS_API_KEY not found in environment variables")
+
+# Point at a compatible stand-in (e.g. the benchmark fakes) instead of api.elevenlabs.io
+elevenlabs_base_url: str = os.environ.get("ELEVENLABS_BASE_URL")
+
+elevenlabs = ElevenLabs(api_key=elevenlabs_api_key, base_url=elevenlabs_base_url)
+
+# Concurrent pipelines, i.e. the most compose calls in flight at once
+MUSIC_JOB_WORKERS = int(os.environ.get("MUSIC_JOB_WORKERS", "4"))
+MUSIC_JOB_MAX_QUEUED = int(os.environ.get("MUSIC_JOB_MAX_QUEUED", "200"))
+MUSIC_JOB_MAX_PENDING_PER_USER = int(os.environ.get("MUSIC_JOB_MAX_PENDING_PER_USER", "4"))
+# How long finished jobs stay queryable
+MUSIC_JOB_RETENTION_SECONDS = int(os.environ.get("MUSIC_JOB_RETENTION_SECONDS", "3600"))
+# Durable journal of jobs and their completed stages, used to resume them after a restart
+MUSIC_JOB_JOURNAL_ENABLED = os.environ.get("MUSIC_JOB_JOURNAL_ENABLED", "true").lower() == "true"
+MUSIC_JOB_JOURNAL_PATH = os.environ.get("MUSIC_JOB_JOURNAL_PATH", str(Path(__file__).parent.parent / "data" / "job_journal.sqlite3"))
+# A job whose process stops renewing its lease for this long is resumed by another process
+MUSIC_JOB_LEASE_SECONDS = int(os.environ.get("MUSIC_JOB_LEASE_SECONDS", "60"))
+# On shutdown, how long to wait for running jobs before handing them back to the journal
+MUSIC_JOB_DRAIN_SECONDS = int(os.environ.get("MUSIC_JOB_DRAIN_SECONDS", "300"))
+
+# Ensure music directory exists
+MUSIC_DIR = Path(os.environ.get("MUSIC_DIR", Path(__file__).parent.parent / "music"))
+MUSIC_DIR.mkdir(exist_ok=True)
+# Keep a copy of each track in MUSIC_DIR: a fallback if storage is unreachable, and lets late live
+# listeners start from the beginning of the track
+MUSIC_KEEP_LOCAL_AUDIO = os.environ.get("MUSIC_KEEP_LOCAL_AUDIO", "true").lower() == "true"
+# Upload to storage while composing instead of after the whole track is on disk
+MUSIC_STREAM_UPLOAD = os.environ.get("MUSIC_STREAM_UPLOAD", "true").lower() == "true"
+# Generate a real album cover alongside each song (placeholder image otherwise)
+MUSIC_GENERATE_COVER = os.environ.get("MUSIC_GENERATE_COVER", "true").lower() == "true"
+MUSIC_COVER_TIMEOUT_SECONDS = float(os.environ.get("MUSIC_COVER_TIMEOUT_SECONDS", "120"))
+# Reuse stored audio for compositions identical to one already rendered (same final prompt and length)
+MUSIC_DEDUPE_RENDERS = os.environ.get("MUSIC_DEDUPE_RENDERS", "true").lower() == "true"
+# Folder of the music bucket holding content-addressed renders
+RENDERS_FOLDER = "renders"
+# Read size when uploading a local copy after the fact
+UPLOAD_READ_SIZE = 1024 * 1024
+# Length of preview clips (one section of the plan, the chorus when there is one)
+MUSIC_PREVIEW_LENGTH_MS = int(os.environ.get("MUSIC_PREVIEW_LENGTH_MS", "12000"))
+# Shortest section ElevenLabs accepts in a composition plan
+MIN_SECTION_MS = 3000
+
+# Pipeline stages, in order, as reported in job progress. The cover is generated alongside them and
+# reported as the "cover" task instead, so the stage does not flip back and forth
+STAGES = (
+    "fetch_plan",
+    "elevenlabs_plan",
+    "lyrics_substitution",
+    "compose",
+    "upload",
+    "save_record",
+)
+
+
+async def lyrics_substitution(composition_plan: dict, composition_plan_from_elevenlabs: dict, request=None):
+    composition_plan_from_elevenlabs_str = str(composition_plan_from_elevenlabs)
+    lyrics_dictionary_str = str(composition_plan['lyrics'])
+    description_str = str(composition_plan['description'])
+    # Use AI to substitute lyrics; the system prompt is static so the provider can cache it
+    system_prompt, user_prompt = LYRICS_SUBSTITUTION_PROMPT.render(
+        description=description_str,
+        composition_plan_from_elevenlabs=composition_plan_from_elevenlabs_str,
+        lyrics_dictionary=lyrics_dictionary_str,
+    )
+    print("SYSTEM PROMPT: ", system_prompt)
+    print("USER PROMPT: ", user_prompt)
+
+    updated_plan = await achat_completion_json(system_prompt=system_prompt, user_prompt=user_prompt, request=request, cache_endpoint="lyrics-substitution")
+    return updated_plan
+
+
+def _prompt_suggestion(error: Exception) -> Optional[str]:
+    """The rewritten prompt ElevenLabs suggests when it rejects one, if any."""
+    body = getattr(error, "body", None)
+    # 422s arrive as a parsed model rather than a dict
+    if hasattr(body, "model_dump"):
+        body = body.model_dump()
+    try:
+        return body.get("detail", {}).get("data", {}).get("prompt_suggestion")
+    except AttributeError:
+        return None
+
+
+def create_elevenlabs_plan(prompt_for_elevenlabs: str) -> tuple[dict, str]:
+    """Blocking. Returns the ElevenLabs plan and the prompt that was finally accepted."""
+    state = {"prompt": prompt_for_elevenlabs}
+
+    def use_suggestion(error: Exception, attempt: int) -> bool:
+        # Retry a rejected prompt with ElevenLabs' own suggestion
+        print("ERROR: ", str(error))
+        suggestion = _prompt_suggestion(error)
+        if suggestion and suggestion != state["prompt"]:
+            state["prompt"] = suggestion
+            return True
+        return False
+
+    composition_plan_elevenlabs = elevenlabs_policy.call(
+        lambda: elevenlabs.music.composition_plan.create(
+            prompt=state["prompt"],
+            music_length_ms=length_ms,
+        ),
+        on_error=use_suggestion,
+    )
+    # Convert composition_plan_elevenlabs to dict if it's a MusicPrompt object
+    if not isinstance(composition_plan_elevenlabs, dict):
+        composition_plan_elevenlabs = composition_plan_elevenlabs.model_dump()
+    return composition_plan_elevenlabs, state["prompt"]
+
+
+def preview_plan(updated_plan: dict, preview_length_ms: int) -> tuple[dict, int]:
+    """
+    The plan cut down to a single section for a preview clip: the first chorus (or hook), else the middle
+    section, trimmed to `preview_length_ms` with its lyric lines trimmed in proportion.
+    Returns the clip's plan and length.
+    """
+    sections = updated_plan.get("sections") or []
+    if not sections:
+        # Not a sectioned plan; compose it at the preview length
+        return updated_plan, preview_length_ms
+    section = next(
+        (s for s in sections if any(word in str(s.get("section_name", "")).lower() for word in ("chorus", "hook"))),
+        sections[len(sections) // 2],
+    )
+    full_ms = int(section.get("duration_ms") or preview_length_ms)
+    clip_ms = max(MIN_SECTION_MS, min(full_ms, preview_length_ms))
+    lines = section.get("lines") or []
+    if lines and clip_ms < full_ms:
+        lines = lines[:max(1, round(len(lines) * clip_ms / full_ms))]
+    return {**updated_plan, "sections": [{**section, "duration_ms": clip_ms, "lines": lines}]}, clip_ms
+
+
+def render_hash(updated_plan: dict, music_length_ms: int) -> str:
+    """Content address of a render: the prompt sent to compose (the plan, canonicalized) and the length."""
+    prompt = json.dumps(updated_plan, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{prompt}\n{music_length_ms}".encode()).hexdigest()
+
+
+async def find_render(renders: AudioRenderRepository, content_hash: str) -> Optional[dict]:
+    try:
+        return await renders.get(content_hash)
+    except Exception as e:
+        # Dedupe is an optimization; compose as usual if the index is unavailable
+        print(f"Error looking up rendered audio: {e}")
+        return None
+
+
+async def record_render(
+    renders: AudioRenderRepository,
+    content_hash: Optional[str],
+    storage_path: Optional[str],
+    local_path: Optional[Path],
+    upload: Optional[StreamingUpload],
+    music_length_ms: int = length_ms,
+) -> None:
+    if not content_hash or not storage_path:
+        return
+    size_bytes = upload.bytes_written if upload is not None else None
+    if local_path is not None and await anyio.Path(local_path).exists():
+        size_bytes = (await anyio.Path(local_path).stat()).st_size
+    try:
+        await renders.insert({
+            "content_hash": content_hash,
+            "storage_path": storage_path,
+            "music_length_ms": music_length_ms,
+            "size_bytes": size_bytes,
+        })
+    except Exception as e:
+        print(f"Error recording rendered audio: {e}")
+
+
+async def move_render(music_storage: StorageRepository, storage_path: str, to_path: str) -> str:
+    """Move a stored track off its content-addressed path; returns where it is now."""
+    try:
+        await music_storage.move(storage_path, to_path)
+        return to_path
+    except Exception as e:
+        # Still usable where it is; it is just not recorded as a render of the plan
+        print(f"Error moving {storage_path} to {to_path}: {e}")
+        return storage_path
+
+
+# Content hashes being rendered in this process, resolved with the storage path (None if the render failed)
+_renders_in_flight: dict[str, asyncio.Future] = {}
+
+
+async def claim_render(
+    content_hash: str,
+    find: Callable[[], Awaitable[Optional[str]]],
+    on_wait: Callable[[], None] = lambda: None,
+) -> tuple[Optional[str], Optional[asyncio.Future]]:
+    """
+    Either the storage path of an existing render of `content_hash` (found with `find`, or produced by an
+    identical job rendering in this process), or the future of a render this caller now owns: it must
+    compose the track and resolve the future with release_render. The future is registered with
+    setdefault, so when a render fails exactly one of the jobs waiting on it composes again.
+    """
+    while True:
+        storage_path = await find()
+        if storage_path:
+            return storage_path, None
+        rendered = asyncio.get_running_loop().create_future()
+        in_flight = _renders_in_flight.setdefault(content_hash, rendered)
+        if in_flight is rendered:
+            return None, rendered
+        on_wait()
+        storage_path = await asyncio.shield(in_flight)
+        if storage_path:
+            return storage_path, None
+
+
+def release_render(content_hash: str, rendered: asyncio.Future, storage_path: Optional[str]) -> None:
+    """Resolve a render claimed with claim_render. Unregistered first, so a waiter that has to compose again can claim it."""
+    if _renders_in_flight.get(content_hash) is rendered:
+        del _renders_in_flight[content_hash]
+    rendered.set_result(storage_path)
+
+# Live audio of jobs in this process, by job id
+live_audio: dict[str, AudioBroadcast] = {}
+
+
+def audio_broadcast(job_id: str) -> AudioBroadcast:
+    """The live audio of a job, created by whichever comes first: the job reaching compose or a listener."""
+    if job_id not in live_audio:
+        live_audio[job_id] = AudioBroadcast(asyncio.get_running_loop())
+    return live_audio[job_id]
+
+
+def compose_streaming(
+    updated_plan: dict,
+    prompt_for_elevenlabs: str,
+    audio_path: Optional[Path],
+    upload: Optional[StreamingUpload],
+    broadcast: Optional[AudioBroadcast],
+    music_length_ms: int = length_ms,
+) -> tuple[Optional[str], bool]:
+    """
+    Blocking. Compose the track, passing each chunk on as it arrives to the local file at `audio_path`,
+    the storage `upload` and the live `broadcast` (each optional). Returns the storage path if the upload
+    completed (a failing upload is abandoned without interrupting the others) and whether the plan itself
+    was composed. The first attempt sends the full plan; once it is rejected, later attempts send the text
+    prompt (or ElevenLabs' suggested rewrite of it). The local copy is written to a .part file and renamed once
+    complete, so a partial file is never mistaken for a finished one.
+    """
+    part_path = audio_path.with_name(audio_path.name + ".part") if audio_path else None
+    plan_prompt = json.dumps(updated_plan)
+    state = {"prompt": plan_prompt, "fallback": prompt_for_elevenlabs, "upload": upload}
+
+    def fall_back_to_text_prompt(error: Exception, attempt: int) -> bool:
+        print("ERROR: ", str(error))
+        suggestion = _prompt_suggestion(error) or state["fallback"]
+        if suggestion != state["prompt"]:
+            state["prompt"] = state["fallback"] = suggestion
+            return True
+        return False
+
+    def send_to_storage(chunk: bytes) -> None:
+        try:
+            state["upload"].write(chunk)
+        except Exception as e:
+            print(f"Error streaming to Supabase storage, continuing without it: {e}")
+            state["upload"].abort()
+            state["upload"] = None
+
+    def compose():
+        track = elevenlabs.music.compose(prompt=state["prompt"], music_length_ms=music_length_ms)
+        received = 0
+        f = open(part_path, "wb") if part_path else None
+        try:
+            print("STREAMING AUDIO: ", audio_path)
+            # compose() streams lazily, so request errors surface while reading the chunks
+            for chunk in track:
+                received += len(chunk)
+                # The file first: late listeners replay it up to what has been broadcast
+                if f is not None:
+                    f.write(chunk)
+                    f.flush()
+                if broadcast is not None:
+                    broadcast.publish_threadsafe(chunk)
+                if state["upload"] is not None:
+                    send_to_storage(chunk)
+        except Exception:
+            if received:
+                # A retry starts the track over
+                if broadcast is not None:
+                    broadcast.reset_threadsafe()
+                if state["upload"] is not None:
+                    state["upload"].abort()
+            raise
+        finally:
+            if f is not None:
+                f.close()
+        if part_path is not None:
+            os.replace(part_path, audio_path)
+
+    elevenlabs_policy.call(compose, on_error=fall_back_to_text_prompt)
+    plan_accepted = state["prompt"] == plan_prompt
+
+    if state["upload"] is None:
+        return None, plan_accepted
+    try:
+        storage_path = state["upload"].finish()
+        print(f"Successfully streamed to Supabase storage: {storage_path}")
+        return storage_path, plan_accepted
+    except Exception as e:
+        print(f"Error finishing Supabase storage upload: {e}")
+        state["upload"].abort()
+        return None, plan_accepted
+
+
+async def upload_audio(music_storage: StorageRepository, audio_path: Path, storage_file_path: str) -> Optional[str]:
+    """Upload the local audio file a chunk at a time; returns its storage path, or None if the upload failed."""
+    def upload_file() -> str:
+        upload = music_storage.open_stream(storage_file_path, "audio/mpeg", upsert=True)
+        with open(audio_path, "rb") as f:
+            while chunk := f.read(UPLOAD_READ_SIZE):
+                upload.write(chunk)
+        return upload.finish()
+
+    try:
+        print(f"Uploading to Supabase storage: {storage_file_path}")
+        storage_path = await run_blocking(upload_file)
+        print(f"Successfully uploaded to Supabase storage: {storage_path}")
+        return storage_path
+    except Exception as e:
+        print(f"Error uploading to Supabase storage: {e}")
+        # Continue even if storage upload fails (for backward compatibility)
+    return None
+
+
+async def kept_audio_path(audio_path: Path) -> Optional[str]:
+    """
+    The composed file's path while it is still in MUSIC_DIR. Once it has been moved into the audio cache
+    there is no lasting local path, and the audio is reached through its storage path.
+    """
+    return str(audio_path) if await anyio.Path(audio_path).is_file() else None
+
+
+async def cache_audio(bucket: str, storage_path: str, audio_path: Path) -> None:
+    try:
+        await audio_cache.astore_file(bucket, storage_path, audio_path, move=True)
+    except OSError as e:
+        # The file stays in MUSIC_DIR and is still served from there
+        print(f"Error caching {audio_path}: {e}")
+
+
+async def generate_final_composition(job: Job) -> dict:
+    """
+    Job handler: generate, store and record the final composition described by job.payload.
+    Each paid or side-effecting stage is checkpointed, and a resumed job skips the stages it already completed.
+    """
+    error = None
+    try:
+        return await _run_pipeline(job)
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        # End the live audio stream, whether or not this run composed anything
+        broadcast = live_audio.pop(job.id, None)
+        if broadcast is not None:
+            broadcast.close(error)
+
+
+async def generate_cover(title: str, description: str, supabase, fallback_path: str) -> dict:
+    """
+    Album cover for the track. Falls back to a placeholder from picsum.photos when cover generation is
+    disabled, unavailable (no Vertex AI setup), fails or takes longer than MUSIC_COVER_TIMEOUT_SECONDS.
+    """
+    cover = None
+    if MUSIC_GENERATE_COVER:
+        try:
+            cover = await asyncio.wait_for(
+                generate_album_cover_internal(title=title, description=description, supabase=supabase),
+                MUSIC_COVER_TIMEOUT_SECONDS,
+            )
+        except Exception as e:
+            print(f"Album cover generation failed, using placeholder: {e!r}")
+    if cover:
+        print(f"Generated album cover: {cover['cover_image_url']}")
+        return {
+            "cover_image_url": cover["cover_image_url"],
+            "cover_image_path": cover["storage_path"],
+            "cover_images": cover.get("cover_images"),
+        }
+
+    # Use a seed based on title to get a consistent image for the same song
+    seed = int(hashlib.md5(title.encode()).hexdigest()[:8], 16) % 1000
+    cover_image_url = f"https://picsum.photos/id/{seed}/200"
+    print(f"Using placeholder album cover: {cover_image_url}")
+    return {"cover_image_url": cover_image_url, "cover_image_path": fallback_path}
+
+
+async def _run_pipeline(job: Job) -> dict:
+    """
+    The pipeline as a dependency graph:
+
+        fetch_plan -> elevenlabs_plan -> lyrics_substitution -> compose (+ upload) -> save_record
+                   \\-> cover ------------------------------------------------------/
+
+    The cover only needs the title and description, so it is generated while the song is composed.
+    A preview (payload `preview`) composes a short clip of one section and stops there: no cover and no
+    final_compositions row. Its plan checkpoints seed the full job when the preview is promoted.
+    """
+    composition_plan_id = job.payload["composition_plan_id"]
+    run_id = job.payload["run_id"]
+    user_id = job.user_id
+    preview = bool(job.payload.get("preview"))
+
+    supabase = get_supabase_client()
+    plans = CompositionPlanRepository(supabase)
+    final_compositions = FinalCompositionRepository(supabase)
+    music_storage = StorageRepository(supabase, MUSIC_BUCKET)
+    renders = AudioRenderRepository(supabase)
+
+    done = job.checkpoints
+
+    def audio_filename_for(composition_plan: dict) -> str:
+        suffix = "_preview" if preview else ""
+        return f"{composition_plan['title']}__{run_id}_{composition_plan_id}{suffix}.mp3"
+
+    async def fetch_plan(results: dict) -> dict:
+        # Fetch composition plan from Supabase
+        job.set_stage("fetch_plan")
+        plan_row = await plans.get(composition_plan_id, user_id=user_id, columns="composition_plan")
+        if not plan_row:
+            raise ValueError("Composition plan not found")
+        return plan_row["composition_plan"]
+
+    async def elevenlabs_plan(results: dict) -> tuple[dict, str]:
+        if "elevenlabs_plan" in done:
+            return done["elevenlabs_plan"]["plan"], done["elevenlabs_plan"]["prompt"]
+        composition_plan = results["fetch_plan"]
+        title = str(composition_plan['title'])
+        description = str(composition_plan['description'])
+        positiveGlobalStyles = str(composition_plan['positiveGlobalStyles'])
+        negativeGlobalStyles = str(composition_plan['negativeGlobalStyles'])
+
+        prompt_for_elevenlabs = GENERATE_PROMPT_FOR_ELEVENLABS_COMPOSITION_PLAN.replace("{title}", title).replace("{description}", description).replace("{positiveGlobalStyles}", positiveGlobalStyles).replace("{negativeGlobalStyles}", negativeGlobalStyles)
+
+        job.set_stage("elevenlabs_plan")
+        composition_plan_elevenlabs, prompt_for_elevenlabs = await anyio.to_thread.run_sync(
+            create_elevenlabs_plan, prompt_for_elevenlabs
+        )
+        await job.checkpoint("elevenlabs_plan", {"plan": composition_plan_elevenlabs, "prompt": prompt_for_elevenlabs})
+        return composition_plan_elevenlabs, prompt_for_elevenlabs
+
+    async def substitute_lyrics(results: dict) -> dict:
+        composition_plan = results["fetch_plan"]
+        composition_plan_elevenlabs, _ = results["elevenlabs_plan"]
+        if 'lyrics' not in composition_plan:
+            return composition_plan_elevenlabs
+        if "lyrics_substitution" in done:
+            return done["lyrics_substitution"]["plan"]
+        job.set_stage("lyrics_substitution")
+        updated_plan = await lyrics_substitution(composition_plan, composition_plan_elevenlabs)
+        await job.checkpoint("lyrics_substitution", {"plan": updated_plan})
+        return updated_plan
+
+    async def compose(results: dict) -> Optional[str]:
+        """Returns the storage path of the track."""
+        if "upload" in done:
+            return done["upload"]["storage_path"]
+
+        updated_plan = results["lyrics_substitution"]
+        music_length_ms = length_ms
+        if preview:
+            updated_plan, music_length_ms = preview_plan(updated_plan, MUSIC_PREVIEW_LENGTH_MS)
+        audio_filename = audio_filename_for(results["fetch_plan"])
+        audio_path = MUSIC_DIR / audio_filename
+        # Previews are content-addressed too, so previewing the same plan again is served from storage
+        content_hash = render_hash(updated_plan, music_length_ms) if MUSIC_DEDUPE_RENDERS else None
+        # Content-addressed renders are shared between users; otherwise under the user_id folder
+        storage_file_path = f"{RENDERS_FOLDER}/{content_hash}.mp3" if content_hash else f"{user_id}/{audio_filename}"
+        print("AUDIO PATH: ", audio_path)
+
+        if "compose" in done and await anyio.Path(audio_path).exists():
+            print(f"Reusing composed audio from before the restart: {audio_path}")
+            if not done["compose"].get("plan_accepted", True):
+                # Composed from the fallback prompt: not a render of this plan
+                content_hash = None
+                storage_file_path = f"{user_id}/{audio_filename}"
+            job.set_stage("upload")
+            storage_path = await upload_audio(music_storage, audio_path, storage_file_path)
+            await record_render(renders, content_hash, storage_path, audio_path, None, music_length_ms)
+            await job.checkpoint("upload", {"storage_path": storage_path})
+            if storage_path:
+                await cache_audio(music_storage.bucket, storage_path, audio_path)
+            return storage_path
+
+        async def reuse(storage_path: str) -> str:
+            print(f"Reusing rendered audio for identical composition: {storage_path}")
+            await job.checkpoint("compose", {"audio_path": None, "content_hash": content_hash})
+            await job.checkpoint("upload", {"storage_path": storage_path})
+            return storage_path
+
+        rendered = None
+        if content_hash:
+            async def find() -> Optional[str]:
+                render = await find_render(renders, content_hash)
+                return render["storage_path"] if render else None
+
+            # Wait for an identical composition already rendering in this process rather than paying twice
+            reused, rendered = await claim_render(
+                content_hash, find, on_wait=lambda: job.set_stage("compose", waiting_for_identical=True)
+            )
+            if reused:
+                return await reuse(reused)
+
+        storage_path = None
+        plan_accepted = False
+        try:
+            # Generate music using ElevenLabs, streaming it to Supabase storage ('music' bucket), the local
+            # copy and live listeners as it is produced
+            _, prompt_for_elevenlabs = results["elevenlabs_plan"]
+            job.set_stage("compose")
+            local_path = audio_path if MUSIC_KEEP_LOCAL_AUDIO else None
+            upload = music_storage.open_stream(storage_file_path, "audio/mpeg", upsert=True) if MUSIC_STREAM_UPLOAD else None
+            broadcast = audio_broadcast(job.id)
+            if local_path is not None:
+                broadcast.backlog_paths = [local_path.with_name(local_path.name + ".part"), local_path]
+            storage_path, plan_accepted = await anyio.to_thread.run_sync(
+                partial(compose_streaming, updated_plan, prompt_for_elevenlabs, local_path, upload, broadcast, music_length_ms)
+            )
+            await job.checkpoint("compose", {"audio_path": str(local_path) if local_path else None, "plan_accepted": plan_accepted})
+            if content_hash and not plan_accepted:
+                # ElevenLabs rejected the plan and the track was composed from the text prompt, so it must not
+                # be found (or overwritten) under the plan's content hash: keep it under the user's folder
+                storage_file_path = f"{user_id}/{audio_filename}"
+                if storage_path is not None:
+                    storage_path = await move_render(music_storage, storage_path, storage_file_path)
+            if storage_path is None and local_path is not None:
+                # Streaming upload disabled or failed: upload the finished local copy instead
+                job.set_stage("upload")
+                storage_path = await upload_audio(music_storage, audio_path, storage_file_path)
+            if storage_path is None and local_path is None:
+                raise RuntimeError("Composed audio could not be stored")
+            await record_render(renders, content_hash if plan_accepted else None, storage_path, local_path, upload, music_length_ms)
+            await job.checkpoint("upload", {"storage_path": storage_path})
+            if local_path is not None:
+                # Write-through: the local copy becomes the cache entry, so MUSIC_DIR does not keep growing.
+                # Live listeners replaying the backlog find it under its new name.
+                broadcast.backlog_paths.append(audio_cache.path_for(music_storage.bucket, storage_path))
+                await cache_audio(music_storage.bucket, storage_path, local_path)
+            return storage_path
+        finally:
+            # Waiting jobs reuse the render, or one of them composes if it failed or is not a render of the plan
+            if rendered is not None:
+                release_render(content_hash, rendered, storage_path if plan_accepted else None)
+
+    async def cover(results: dict) -> dict:
+        if "cover" in done:
+            return done["cover"]
+        composition_plan = results["fetch_plan"]
+        job.set_task("cover", "running")
+        cover_image = await generate_cover(
+            str(composition_plan['title']),
+            str(composition_plan['description']),
+            supabase,
+            fallback_path=f"{run_id}_{composition_plan_id}.png",
+        )
+        await job.checkpoint("cover", cover_image)
+        job.set_task("cover", "done", cover_image_url=cover_image["cover_image_url"])
+        return cover_image
+
+    async def save_record(results: dict) -> Optional[int]:
+        # Save to Supabase in a new table
+        if "save_record" in done:
+            return done["save_record"]["id"]
+        job.set_stage("save_record")
+        audio_filename = audio_filename_for(results["fetch_plan"])
+        saved_id = None
+        try:
+            saved = await final_compositions.insert({
+                "uuid": str(uuid.uuid4()),
+                "user_id": user_id,
+                "run_id": run_id,
+                "composition_plan_id": composition_plan_id,
+                "title": results["fetch_plan"]['title'],
+                "composition_plan": results["lyrics_substitution"],
+                "audio_path": await kept_audio_path(MUSIC_DIR / audio_filename),
+                "audio_filename": audio_filename,
+                "storage_path": results["compose"],
+                "cover_image_path": results["cover"]["cover_image_path"],
+                "cover_image_url": results["cover"]["cover_image_url"],
+                # Thumbnails and WebP/JPEG derivatives of the cover (srcset manifest)
+                "cover_images": results["cover"].get("cover_images"),
+            })
+            saved_id = saved["id"] if saved else None
+        except Exception as e:
+            print(f"Error saving to Supabase: {e}")
+            # Continue even if Supabase save fails
+        await job.checkpoint("save_record", {"id": saved_id})
+        return saved_id
+
+    steps = [
+        Step("fetch_plan", fetch_plan),
+        Step("elevenlabs_plan", elevenlabs_plan, after=["fetch_plan"]),
+        Step("lyrics_substitution", substitute_lyrics, after=["fetch_plan", "elevenlabs_plan"]),
+        Step("compose", compose, after=["lyrics_substitution"]),
+    ]
+    if not preview:
+        steps += [
+            Step("cover", cover, after=["fetch_plan"]),
+            Step("save_record", save_record, after=["compose", "cover"]),
+        ]
+    results = await run_steps(steps)
+    audio_filename = audio_filename_for(results["fetch_plan"])
+    print("AUDIO FILE: \n\n", audio_filename)
+
+    if preview:
+        return {
+            "preview": True,
+            "composition_plan_id": composition_plan_id,
+            "audio_filename": audio_filename,
+            "storage_path": results["compose"],
+            "preview_length_ms": preview_plan(results["lyrics_substitution"], MUSIC_PREVIEW_LENGTH_MS)[1],
+        }
+
+    return {
+        "id": results["save_record"],
+        "composition_plan_id": composition_plan_id,
+        "audio_path": await kept_audio_path(MUSIC_DIR / audio_filename),
+        "audio_filename": audio_filename,
+    }
+
+
+music_jobs = JobQueue(
+    kind="final-composition",
+    handler=generate_final_composition,
+    workers=MUSIC_JOB_WORKERS,
+    max_queued=MUSIC_JOB_MAX_QUEUED,
+    max_pending_per_user=MUSIC_JOB_MAX_PENDING_PER_USER,
+    retention_seconds=MUSIC_JOB_RETENTION_SECONDS,
+    journal=JobJournal(MUSIC_JOB_JOURNAL_PATH) if MUSIC_JOB_JOURNAL_ENABLED else None,
+    lease_seconds=MUSIC_JOB_LEASE_SECONDS,
+    drain_seconds=MUSIC_JOB_DRAIN_SECONDS,
+)
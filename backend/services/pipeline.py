@@ -0,0 +1,64 @@
+"""
+Minimal dependency-graph executor for multi-step pipelines.
+Each step starts as soon as the steps it depends on have finished, so independent branches
+(e.g. album cover generation next to composing) run concurrently on the event loop.
+"""
+import asyncio
+from typing import Awaitable, Callable, Iterable
+
+
+class Step:
+    """One node of the graph: `run(results)` gets the results of every step finished so far."""
+
+    def __init__(self, name: str, run: Callable[[dict], Awaitable], after: Iterable[str] = ()):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+
+
+def _in_dependency_order(steps: list[Step]) -> list[Step]:
+    by_name = {step.name: step for step in steps}
+    ordered: list[Step] = []
+    state: dict[str, str] = {}
+
+    def visit(step: Step) -> None:
+        if state.get(step.name) == "done":
+            return
+        if state.get(step.name) == "visiting":
+            raise ValueError(f"Pipeline has a dependency cycle through '{step.name}'")
+        state[step.name] = "visiting"
+        for name in step.after:
+            if name not in by_name:
+                raise ValueError(f"Step '{step.name}' depends on unknown step '{name}'")
+            visit(by_name[name])
+        state[step.name] = "done"
+        ordered.append(step)
+
+    for step in steps:
+        visit(step)
+    return ordered
+
+
+async def run_steps(steps: list[Step]) -> dict:
+    """
+    Run the graph and return every step's result by name.
+    The first step to fail cancels the steps still running, and its exception is raised.
+    """
+    results: dict = {}
+    tasks: dict[str, asyncio.Task] = {}
+
+    async def run(step: Step):
+        if step.after:
+            await asyncio.gather(*(tasks[name] for name in step.after))
+        results[step.name] = await step.run(results)
+
+    for step in _in_dependency_order(steps):
+        tasks[step.name] = asyncio.create_task(run(step), name=step.name)
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return results
@@ -1,3 +1,5 @@
+import re
+
 GENRE_LYRICS_EXAMPLES = {
     "Pop": '"Verse 1": ["I hopped off the plane at LAX", "With a dream and my cardigan", "Welcome to the land of fame excess (whoa)", "Am I gonna fit in?"], "Chorus": ["So, I put my hands up", "They\'re playing my song, the butterflies fly away", "I\'m nodding my head like, yeah", "Moving my hips like, yeah"]',
     "R&B": '"Verse 1": ["Took me out to the ballet", "You proposed, I went on the road", "You was feelin\' empty, so you left me", "Now I\'m stuck dealin\' with a deadbeat"], "Chorus": ["I don\'t wanna lose what\'s left of you", "How am I supposed to tell ya?", "I don\'t wanna see you with anyone but me", "Nobody gets me like you"]',
@@ -13,6 +15,32 @@ GENRE_LYRICS_EXAMPLES = {
     "Folk": '"Verse 1": ["The river runs down to the mill", "The same old road is running still", "I walked it once when I was young"], "Chorus": ["And the wind will carry on, every verse of every song", "Every verse of every song", "The wind will carry on", "And the wind will carry on"]',
 }
 
+class PromptTemplate:
+    """
+    A chat prompt split into a static system prefix and a variable user payload.
+    Providers cache prompts by prefix, so the system text must be identical on every call:
+    per-request data is only ever substituted into the user template, which is sent last.
+    """
+
+    PLACEHOLDER = re.compile(r"\{[A-Za-z_]+\}")
+
+    def __init__(self, name: str, system: str, user: str):
+        if self.PLACEHOLDER.search(system):
+            raise ValueError(f"Prompt template {name} has a placeholder in its static system prefix")
+        self.name = name
+        self.system = system
+        self.user = user
+
+    def render(self, **payload) -> tuple[str, str]:
+        """Return (system_prompt, user_prompt) with `payload` substituted into the user template."""
+        def substitute(match):
+            key = match.group(0)[1:-1]
+            return str(payload[key]) if key in payload else match.group(0)
+
+        # Single pass, so placeholder-like text inside a payload value is never substituted again
+        return self.system, self.PLACEHOLDER.sub(substitute, self.user)
+
+
 def get_genre_lyrics_example(styles: list[str]) -> str:
     """Return an example lyrics snippet for the first matching genre, or a default."""
     if not styles:
@@ -73,6 +101,7 @@ GENERATE_INITIAL_SCHEMA_SYSTEM_WITH_LYRICS_USER_PROMPT = """
 User prompt: {USER_PROMPT}
 Styles: {STYLES}
 Lyrics exist: {LYRICS_EXISTS}
+Example lyrics in this genre: {GENRE_LYRICS_EXAMPLE}
 """
 
 GENERATE_IMPROVED_SCHEMA_WITH_LYRICS_SYSTEM_PROMPT = """
@@ -115,15 +144,17 @@ GENERATE_LYRICS_SYSTEM_PROMPT = """
         ### RULES:
         1. OUTPUT ONLY VALID JSON. Do not include preamble or explanations.
         2. The output MUST match the keys and structure of the input 'Composition Plan' exactly.
-        3. If lyrics for a section are missing, generate them based on the Description: {description}.
-
-        ### INPUT DATA (HAVE THE OUTPUT IN THE SAME FORMAT AS THE INPUT COMPOSITION PLAN):
-        Composition Plan: {composition_plan_from_elevenlabs}
-        Lyrics Dictionary: {lyrics_dictionary}
+        3. If lyrics for a section are missing, generate them based on the Description.
+        4. HAVE THE OUTPUT IN THE SAME FORMAT AS THE INPUT COMPOSITION PLAN.
 """        
 
 GENERATE_LYRICS_USER_PROMPT = """
 Integrate the lyrics into the plan and expand missing sections (e.g., Verse 2, Bridge) based on the provided story and description.
+
+### INPUT DATA:
+Description: {description}
+Composition Plan: {composition_plan_from_elevenlabs}
+Lyrics Dictionary: {lyrics_dictionary}
 """
 
 GENERATE_PROMPT_FOR_ELEVENLABS_COMPOSITION_PLAN = """
@@ -131,3 +162,31 @@ Create a song titled {title} with a description of {description}
 The song should be a {positiveGlobalStyles} as styles to include and {negativeGlobalStyles} as styles to avoid.
 Vocal style: use smooth, sweet vocals for pop, R&B, EDM, indie, jazz, country, folk, classical; use harsh, powerful vocals for rock, phonk, and metal.
 """
+
+
+# Chat prompts as templates: static instructions first, per-request payload last
+INITIAL_SCHEMA_WITH_LYRICS_PROMPT = PromptTemplate(
+    "initial-schema-with-lyrics",
+    GENERATE_INITIAL_SCHEMA_SYSTEM_WITH_LYRICS_SYSTEM_PROMPT,
+    GENERATE_INITIAL_SCHEMA_SYSTEM_WITH_LYRICS_USER_PROMPT,
+)
+INITIAL_SCHEMA_WITHOUT_LYRICS_PROMPT = PromptTemplate(
+    "initial-schema-without-lyrics",
+    GENERATE_INITIAL_SCHEMA_SYSTEM_WITHOUT_LYRICS_SYSTEM_PROMPT,
+    GENERATE_INITIAL_SCHEMA_SYSTEM_WITHOUT_LYRICS_USER_PROMPT,
+)
+IMPROVED_SCHEMA_WITH_LYRICS_PROMPT = PromptTemplate(
+    "improved-schema-with-lyrics",
+    GENERATE_IMPROVED_SCHEMA_WITH_LYRICS_SYSTEM_PROMPT,
+    GENERATE_IMPROVED_SCHEMA_WITH_LYRICS_USER_PROMPT,
+)
+IMPROVED_SCHEMA_WITHOUT_LYRICS_PROMPT = PromptTemplate(
+    "improved-schema-without-lyrics",
+    GENERATE_IMPROVED_SCHEMA_WITHOUT_LYRICS_SYSTEM_PROMPT,
+    GENERATE_IMPROVED_SCHEMA_WITHOUT_LYRICS_USER_PROMPT,
+)
+LYRICS_SUBSTITUTION_PROMPT = PromptTemplate(
+    "lyrics-substitution",
+    GENERATE_LYRICS_SYSTEM_PROMPT,
+    GENERATE_LYRICS_USER_PROMPT,
+)
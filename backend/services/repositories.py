@@ -0,0 +1,404 @@
+"""
+Async data access for the Supabase tables and storage buckets.
+The Supabase SDK is synchronous, so every call is offloaded to a bounded worker thread
+and routers can await it without stalling the event loop.
+"""
+import base64
+import os
+from functools import partial
+from typing import Optional
+from urllib.parse import quote
+
+import anyio
+import httpx
+from fastapi import Depends
+from storage3.exceptions import StorageException
+from supabase import Client
+
+from services.supabase_client import get_async_http_client, get_http_client, get_supabase
+
+# Keep this at or below SUPABASE_HTTP_MAX_CONNECTIONS so threads never wait on the pool
+SUPABASE_THREAD_LIMIT = int(os.environ.get("SUPABASE_THREAD_LIMIT", "40"))
+
+# Supabase's resumable (TUS) uploads take 6 MB chunks; smaller objects go up in a single request
+STORAGE_UPLOAD_CHUNK_SIZE = int(os.environ.get("STORAGE_UPLOAD_CHUNK_SIZE", str(6 * 1024 * 1024)))
+# Attempts per chunk; after a failure the upload resumes from the offset the server confirms
+STORAGE_UPLOAD_CHUNK_ATTEMPTS = int(os.environ.get("STORAGE_UPLOAD_CHUNK_ATTEMPTS", "3"))
+
+MUSIC_BUCKET = "music"
+PORTFOLIO_AUDIO_BUCKET = "portfolio-audio"
+ALBUM_COVERS_BUCKET = "album-covers"
+
+_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def _get_limiter() -> anyio.CapacityLimiter:
+    # Created lazily because a CapacityLimiter must be built inside the running event loop
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(SUPABASE_THREAD_LIMIT)
+    return _limiter
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking Supabase call in the shared worker pool."""
+    return await anyio.to_thread.run_sync(partial(func, *args, **kwargs), limiter=_get_limiter())
+
+
+class CompositionPlanRepository:
+    """Rows of the composition_plans table."""
+
+    table = "composition_plans"
+
+    def __init__(self, supabase: Client):
+        self.supabase = supabase
+
+    async def insert(self, row: dict) -> Optional[dict]:
+        response = await run_blocking(lambda: self.supabase.table(self.table).insert(row).execute())
+        return response.data[0] if response.data else None
+
+    async def insert_many(self, rows: list[dict]) -> list[dict]:
+        response = await run_blocking(lambda: self.supabase.table(self.table).insert(rows).execute())
+        return response.data or []
+
+    async def get(self, plan_id: int, user_id: str = None, columns: str = "*") -> Optional[dict]:
+        def query():
+            q = self.supabase.table(self.table).select(columns).eq("id", plan_id)
+            if user_id is not None:
+                q = q.eq("user_id", user_id)
+            return q.execute()
+
+        response = await run_blocking(query)
+        return response.data[0] if response.data else None
+
+    async def list_by_run(self, run_id: str, user_id: str) -> list[dict]:
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).select("*").eq("run_id", run_id).eq("user_id", user_id).order("created_at").execute()
+        )
+        return response.data or []
+
+    async def update(self, plan_id: int, user_id: str, fields: dict) -> Optional[dict]:
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).update(fields).eq("id", plan_id).eq("user_id", user_id).execute()
+        )
+        return response.data[0] if response.data else None
+
+
+class FinalCompositionRepository:
+    """Rows of the final_compositions table."""
+
+    table = "final_compositions"
+
+    def __init__(self, supabase: Client):
+        self.supabase = supabase
+
+    async def insert(self, row: dict) -> Optional[dict]:
+        response = await run_blocking(lambda: self.supabase.table(self.table).insert(row).execute())
+        return response.data[0] if response.data else None
+
+    async def get_by_plan(self, composition_plan_id: int, user_id: str) -> Optional[dict]:
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).select("*").eq("composition_plan_id", composition_plan_id).eq("user_id", user_id).execute()
+        )
+        return response.data[0] if response.data else None
+
+    async def get_by_audio_filename(self, audio_filename: str, user_id: str = None, columns: str = "*") -> Optional[dict]:
+        def query():
+            q = self.supabase.table(self.table).select(columns).eq("audio_filename", audio_filename)
+            if user_id is not None:
+                q = q.eq("user_id", user_id)
+            return q.execute()
+
+        response = await run_blocking(query)
+        return response.data[0] if response.data else None
+
+    async def list_by_run(self, run_id: str, user_id: str) -> list[dict]:
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).select("*").eq("run_id", run_id).eq("user_id", user_id).order("created_at").execute()
+        )
+        return response.data or []
+
+    async def update(self, composition_id: int, user_id: str, fields: dict) -> Optional[dict]:
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).update(fields).eq("id", composition_id).eq("user_id", user_id).execute()
+        )
+        return response.data[0] if response.data else None
+
+
+class AudioRenderRepository:
+    """Rows of the audio_renders table: rendered audio in the music bucket, by content hash."""
+
+    table = "audio_renders"
+
+    def __init__(self, supabase: Client):
+        self.supabase = supabase
+
+    async def get(self, content_hash: str) -> Optional[dict]:
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).select("*").eq("content_hash", content_hash).execute()
+        )
+        return response.data[0] if response.data else None
+
+    async def insert(self, row: dict) -> Optional[dict]:
+        # The first render of a hash wins; later identical renders keep pointing at it
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).upsert(row, on_conflict="content_hash", ignore_duplicates=True).execute()
+        )
+        return response.data[0] if response.data else None
+
+
+class PortfolioItemRepository:
+    """Rows of the portfolio_items table."""
+
+    table = "portfolio_items"
+
+    def __init__(self, supabase: Client):
+        self.supabase = supabase
+
+    async def list_for_user(self, user_id: str) -> list[dict]:
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+        )
+        return response.data
+
+    async def get(self, item_id: str, user_id: str, columns: str = "*") -> Optional[dict]:
+        """Fetch exactly one item; like PostgREST's .single(), raises if it does not exist."""
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).select(columns).eq("id", item_id).eq("user_id", user_id).single().execute()
+        )
+        return response.data
+
+    async def insert(self, row: dict) -> Optional[dict]:
+        response = await run_blocking(lambda: self.supabase.table(self.table).insert(row).execute())
+        return response.data[0] if response.data else None
+
+    async def update(self, item_id: str, user_id: str, fields: dict) -> Optional[dict]:
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).update(fields).eq("id", item_id).eq("user_id", user_id).execute()
+        )
+        return response.data[0] if response.data else None
+
+    async def delete(self, item_id: str, user_id: str) -> list[dict]:
+        response = await run_blocking(
+            lambda: self.supabase.table(self.table).delete().eq("id", item_id).eq("user_id", user_id).execute()
+        )
+        return response.data or []
+
+
+def storage_status_of(error: Exception) -> Optional[int]:
+    """Status reported by the storage API for a StorageApiError (its body's statusCode, sent as a string)."""
+    try:
+        return int(getattr(error, "status", None))
+    except (TypeError, ValueError):
+        return None
+
+
+class StorageRepository:
+    """Objects in a single Supabase storage bucket."""
+
+    def __init__(self, supabase: Client, bucket: str):
+        self.supabase = supabase
+        self.bucket = bucket
+
+    async def upload(self, path: str, data: bytes, content_type: str, upsert: bool = False):
+        return await run_blocking(
+            lambda: self.supabase.storage.from_(self.bucket).upload(
+                path=path,
+                file=data,
+                file_options={"content-type": content_type, "upsert": "true" if upsert else "false"},
+            )
+        )
+
+    async def upload_if_absent(self, path: str, data: bytes, content_type: str) -> bool:
+        """Upload unless an object already exists at `path` (for content-addressed paths); True if uploaded."""
+        try:
+            await self.upload(path, data, content_type)
+            return True
+        except StorageException as e:
+            # Storage reports an existing object as a 409 "Duplicate" (in the body of a 400 response)
+            if storage_status_of(e) == 409:
+                return False
+            raise
+
+    async def exists(self, path: str) -> bool:
+        def check() -> bool:
+            try:
+                return self.supabase.storage.from_(self.bucket).exists(path)
+            except StorageException:
+                # A missing object can surface as an error response rather than False
+                return False
+
+        return await run_blocking(check)
+
+    async def download(self, path: str) -> bytes:
+        return await run_blocking(lambda: self.supabase.storage.from_(self.bucket).download(path))
+
+    async def remove(self, paths: list[str]):
+        return await run_blocking(lambda: self.supabase.storage.from_(self.bucket).remove(paths))
+
+    async def move(self, from_path: str, to_path: str):
+        return await run_blocking(lambda: self.supabase.storage.from_(self.bucket).move(from_path, to_path))
+
+    async def open_download(self, path: str, headers: Optional[dict] = None) -> httpx.Response:
+        """
+        Start a streamed GET of an object, passing through request headers such as Range, If-None-Match
+        and If-Modified-Since. The caller reads the body with aiter_bytes() and must aclose() the response.
+        """
+        url = f"{str(self.supabase.supabase_url).rstrip('/')}/storage/v1/object/authenticated/{self.bucket}/{quote(path)}"
+        key = self.supabase.supabase_key
+        request = get_async_http_client().build_request(
+            "GET", url, headers={"Authorization": f"Bearer {key}", "apikey": key, **(headers or {})}
+        )
+        return await get_async_http_client().send(request, stream=True)
+
+    def get_public_url(self, path: str) -> str:
+        # Built locally by the SDK, no network call
+        return self.supabase.storage.from_(self.bucket).get_public_url(path)
+
+    def open_stream(self, path: str, content_type: str, upsert: bool = False) -> "StreamingUpload":
+        """Blocking writer for an object of unknown length; see StreamingUpload."""
+        return StreamingUpload(self.supabase, self.bucket, path, content_type, upsert)
+
+
+class StreamingUpload:
+    """
+    Blocking, file-like upload of a byte stream to one storage object, holding at most one chunk in memory.
+    Objects that end within the first chunk are uploaded in a single request; longer ones switch to a
+    resumable TUS upload (with deferred length), sent chunk by chunk. A failed chunk is retried from the
+    offset the server reports, so a dropped connection does not restart the whole object.
+    Use from worker threads only.
+    """
+
+    def __init__(self, supabase: Client, bucket: str, path: str, content_type: str, upsert: bool = False):
+        self.supabase = supabase
+        self.bucket = bucket
+        self.path = path
+        self.content_type = content_type
+        self.upsert = upsert
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._offset = 0
+        self._upload_url: Optional[str] = None
+        self._endpoint = f"{str(supabase.supabase_url).rstrip('/')}/storage/v1/upload/resumable"
+        self._key = supabase.supabase_key
+
+    def _headers(self, **extra) -> dict:
+        return {
+            "Authorization": f"Bearer {self._key}",
+            "apikey": self._key,
+            "Tus-Resumable": "1.0.0",
+            **extra,
+        }
+
+    def _metadata(self) -> str:
+        fields = {
+            "bucketName": self.bucket,
+            "objectName": self.path,
+            "contentType": self.content_type,
+        }
+        return ",".join(f"{key} {base64.b64encode(value.encode()).decode()}" for key, value in fields.items())
+
+    def _create(self) -> None:
+        response = get_http_client().post(
+            self._endpoint,
+            headers=self._headers(**{
+                "Upload-Defer-Length": "1",
+                "Upload-Metadata": self._metadata(),
+                "x-upsert": "true" if self.upsert else "false",
+            }),
+        )
+        response.raise_for_status()
+        self._upload_url = str(httpx.URL(self._endpoint).join(response.headers["Location"]))
+        self._offset = 0
+
+    def _server_offset(self) -> int:
+        response = get_http_client().head(self._upload_url, headers=self._headers())
+        response.raise_for_status()
+        return int(response.headers["Upload-Offset"])
+
+    def _send(self, data: bytes, final: bool) -> None:
+        """PATCH `data`, which starts at self._offset; resumes from the server's offset after a failure."""
+        start = self._offset
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if attempt > 1:
+                    self._offset = self._server_offset()
+                body = data[self._offset - start:]
+                extra = {"Upload-Length": str(start + len(data))} if final else {}
+                response = get_http_client().patch(
+                    self._upload_url,
+                    content=bytes(body),
+                    headers=self._headers(**{
+                        "Upload-Offset": str(self._offset),
+                        "Content-Type": "application/offset+octet-stream",
+                        **extra,
+                    }),
+                )
+                response.raise_for_status()
+                self._offset = int(response.headers.get("Upload-Offset", start + len(data)))
+                return
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                if attempt >= STORAGE_UPLOAD_CHUNK_ATTEMPTS:
+                    raise
+                print(f"Storage upload chunk failed (attempt {attempt}/{STORAGE_UPLOAD_CHUNK_ATTEMPTS}): {e}; resuming")
+
+    def write(self, chunk: bytes) -> None:
+        self._buffer += chunk
+        self.bytes_written += len(chunk)
+        while len(self._buffer) > STORAGE_UPLOAD_CHUNK_SIZE:
+            # Strictly more than one chunk buffered, so the final PATCH is never empty
+            if self._upload_url is None:
+                self._create()
+            self._send(self._buffer[:STORAGE_UPLOAD_CHUNK_SIZE], final=False)
+            del self._buffer[:STORAGE_UPLOAD_CHUNK_SIZE]
+
+    def finish(self) -> str:
+        """Send what is left and complete the object; returns its path."""
+        if self._upload_url is None:
+            self.supabase.storage.from_(self.bucket).upload(
+                path=self.path,
+                file=bytes(self._buffer),
+                file_options={"content-type": self.content_type, "upsert": "true" if self.upsert else "false"},
+            )
+        else:
+            self._send(self._buffer, final=True)
+        self._buffer = bytearray()
+        return self.path
+
+    def abort(self) -> None:
+        """Discard the upload so far, e.g. before the producer starts over."""
+        if self._upload_url is not None:
+            try:
+                get_http_client().delete(self._upload_url, headers=self._headers())
+            except httpx.HTTPError as e:
+                print(f"Error discarding storage upload: {e}")
+        self._upload_url = None
+        self._buffer = bytearray()
+        self._offset = 0
+        self.bytes_written = 0
+
+
+def get_composition_plans(supabase: Client = Depends(get_supabase)) -> CompositionPlanRepository:
+    return CompositionPlanRepository(supabase)
+
+
+def get_final_compositions(supabase: Client = Depends(get_supabase)) -> FinalCompositionRepository:
+    return FinalCompositionRepository(supabase)
+
+
+def get_portfolio_items(supabase: Client = Depends(get_supabase)) -> PortfolioItemRepository:
+    return PortfolioItemRepository(supabase)
+
+
+def get_music_storage(supabase: Client = Depends(get_supabase)) -> StorageRepository:
+    return StorageRepository(supabase, MUSIC_BUCKET)
+
+
+def get_portfolio_audio_storage(supabase: Client = Depends(get_supabase)) -> StorageRepository:
+    return StorageRepository(supabase, PORTFOLIO_AUDIO_BUCKET)
+
+
+def get_album_cover_storage(supabase: Client = Depends(get_supabase)) -> StorageRepository:
+    return StorageRepository(supabase, ALBUM_COVERS_BUCKET)
@@ -0,0 +1,303 @@
+"""
+Retry, rate limiting and circuit breaking for calls to paid providers (ElevenLabs, OpenAI, Gemini, Imagen).
+
+A ProviderPolicy wraps one provider: every attempt first passes the circuit breaker and takes a token
+from the process-wide token bucket; failures are retried with capped exponential backoff and full jitter.
+Callers can pass an `on_error` strategy that adjusts the request after a rejection (e.g. switching to
+ElevenLabs' prompt_suggestion) and asks for another attempt.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+import httpx
+
+
+class ProviderUnavailable(Exception):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take one token, possibly going into debt; returns how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self) -> None:
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_seconds`;
+    then lets one trial call through (half-open) and closes again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def before_call(self, name: str) -> bool:
+        """Raises ProviderUnavailable while open; returns True if this call is the half-open trial."""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_in_flight):
+                raise ProviderUnavailable(f"{name} is unavailable (circuit open), try again later")
+            if state == "half-open":
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_in_flight:
+                    self.times_opened += 1
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def record_neutral(self) -> None:
+        """The provider answered, but rejected the request itself (4xx): neither healthy nor down."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+def status_code_of(error: Exception) -> Optional[int]:
+    """HTTP status of a provider SDK error (ElevenLabs ApiError, OpenAI APIStatusError, google api_core errors)."""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) if isinstance(getattr(response, "status_code", None), int) else None
+
+
+def retry_after_of(error: Exception) -> Optional[float]:
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(error: Exception) -> bool:
+    """Worth retrying and a sign of provider trouble: timeouts, connection errors, 429, 5xx."""
+    status = status_code_of(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    # SDK wrappers without a status code (openai.APIConnectionError, APITimeoutError, ...)
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+# on_error(error, attempt) -> True when it changed the request and another attempt is worthwhile
+ErrorStrategy = Callable[[Exception, int], bool]
+
+
+class ProviderPolicy:
+    """Retry + token bucket + circuit breaker for one provider."""
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        requests_per_minute: float,
+        burst: float,
+        failure_threshold: int,
+        reset_seconds: float,
+    ):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self._stats = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "rejected_open": 0}
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff for the given (1-based) failed attempt, capped at max_delay."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _before_attempt(self) -> bool:
+        try:
+            trial = self.breaker.before_call(self.name)
+        except ProviderUnavailable:
+            self._stats["rejected_open"] += 1
+            raise
+        self._stats["attempts"] += 1
+        return trial
+
+    def _after_error(self, error: Exception, attempt: int, on_error: Optional[ErrorStrategy]) -> Optional[float]:
+        """Record the failure; returns the delay before the next attempt, or None to give up."""
+        transient = is_transient(error)
+        if transient and status_code_of(error) != 429:
+            self.breaker.record_failure()
+        else:
+            # 429s and request rejections mean the provider is up
+            self.breaker.record_neutral()
+
+        adjusted = False
+        if on_error is not None:
+            try:
+                adjusted = bool(on_error(error, attempt))
+            except Exception:
+                adjusted = False
+
+        if attempt >= self.max_attempts or not (transient or adjusted):
+            self._stats["failures"] += 1
+            return None
+        self._stats["retries"] += 1
+        # A rewritten request can go straight away; provider trouble backs off
+        delay = self.backoff(attempt, retry_after_of(error)) if transient else 0.0
+        print(f"{self.name} call failed (attempt {attempt}/{self.max_attempts}): {error}; retrying in {delay:.1f}s")
+        return delay
+
+    def call(self, func: Callable, on_error: Optional[ErrorStrategy] = None):
+        """Blocking: call `func()` under this policy. Use from worker threads only."""
+        self._stats["calls"] += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            trial = self._before_attempt()
+            try:
+                self.bucket.acquire()
+                result = func()
+            except Exception as e:
+                delay = self._after_error(e, attempt, on_error)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Interrupted: no verdict on the provider, but the next call may be the trial
+                if trial:
+                    self.breaker.record_neutral()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, func: Callable, on_error: Optional[ErrorStrategy] = None):
+        """Await `func()` (a coroutine factory) under this policy."""
+        self._stats["calls"] += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            trial = self._before_attempt()
+            try:
+                await self.bucket.aacquire()
+                result = await func()
+            except Exception as e:
+                delay = self._after_error(e, attempt, on_error)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (client disconnected, timeout, failed sibling task): no verdict on the provider,
+                # but the half-open trial must be released or the breaker would reject every later call
+                if trial:
+                    self.breaker.record_neutral()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> dict:
+        return {**self._stats, "circuit": self.breaker.state, "times_opened": self.breaker.times_opened}
+
+
+def policy_from_env(name: str, prefix: str, **defaults) -> ProviderPolicy:
+    """Build a policy from {prefix}_MAX_ATTEMPTS, _RETRY_BASE_DELAY, _RETRY_MAX_DELAY, _REQUESTS_PER_MINUTE,
+    _BURST, _BREAKER_FAILURES and _BREAKER_RESET_SECONDS, falling back to `defaults`."""
+    def setting(key: str, env: str):
+        return float(os.environ.get(f"{prefix}_{env}", defaults[key]))
+
+    return ProviderPolicy(
+        name=name,
+        max_attempts=int(setting("max_attempts", "MAX_ATTEMPTS")),
+        base_delay=setting("base_delay", "RETRY_BASE_DELAY"),
+        max_delay=setting("max_delay", "RETRY_MAX_DELAY"),
+        requests_per_minute=setting("requests_per_minute", "REQUESTS_PER_MINUTE"),
+        burst=setting("burst", "BURST"),
+        failure_threshold=int(setting("failure_threshold", "BREAKER_FAILURES")),
+        reset_seconds=setting("reset_seconds", "BREAKER_RESET_SECONDS"),
+    )
+
+
+# ElevenLabs limits concurrent music requests per plan; size the bucket to the plan in use
+elevenlabs_policy = policy_from_env(
+    "ElevenLabs", "ELEVENLABS",
+    max_attempts=5, base_delay=2, max_delay=60, requests_per_minute=30, burst=5,
+    failure_threshold=5, reset_seconds=60,
+)
+openai_policy = policy_from_env(
+    "OpenAI", "OPENAI",
+    max_attempts=4, base_delay=1, max_delay=30, requests_per_minute=500, burst=50,
+    failure_threshold=10, reset_seconds=30,
+)
+gemini_policy = policy_from_env(
+    "Gemini", "GEMINI",
+    max_attempts=4, base_delay=1, max_delay=30, requests_per_minute=60, burst=10,
+    failure_threshold=5, reset_seconds=60,
+)
+
+# Vertex AI Imagen has its own quota (images per minute per project), separate from the Gemini text models
+imagen_policy = policy_from_env(
+    "Imagen", "IMAGEN",
+    max_attempts=3, base_delay=2, max_delay=30, requests_per_minute=20, burst=4,
+    failure_threshold=5, reset_seconds=60,
+)
+
+
+def provider_stats() -> dict:
+    return {policy.name: policy.stats() for policy in (elevenlabs_policy, openai_policy, gemini_policy, imagen_policy)}
@@ -0,0 +1,23 @@
+"""
+Helpers for Server-Sent Events responses.
+"""
+import json
+
+from fastapi.responses import StreamingResponse
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Stop nginx-style proxies from buffering the stream
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(event: str, data) -> str:
+    """Encode one SSE message; `data` is sent as JSON."""
+    payload = json.dumps(data, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    """Wrap an async iterator of formatted SSE messages in a streaming response."""
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
@@ -0,0 +1,113 @@
+"""
+Application-scoped Supabase client with a shared, pooled HTTP connection.
+The client is created once in the FastAPI lifespan hook and handed to routers via get_supabase.
+"""
+import os
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import Request
+from supabase import create_client, Client, ClientOptions
+
+env_path = Path(__file__).parent.parent / ".env.local"
+load_dotenv(dotenv_path=env_path)
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_SECRET_KEY = os.environ.get("SUPABASE_SECRET_KEY")
+
+# Size the pool to the number of concurrent requests a worker handles
+SUPABASE_HTTP_MAX_CONNECTIONS = int(os.environ.get("SUPABASE_HTTP_MAX_CONNECTIONS", "100"))
+SUPABASE_HTTP_MAX_KEEPALIVE = int(os.environ.get("SUPABASE_HTTP_MAX_KEEPALIVE", "20"))
+SUPABASE_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("SUPABASE_HTTP_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_HTTP_TIMEOUT = float(os.environ.get("SUPABASE_HTTP_TIMEOUT", "30"))
+SUPABASE_HTTP_CONNECT_TIMEOUT = float(os.environ.get("SUPABASE_HTTP_CONNECT_TIMEOUT", "5"))
+SUPABASE_HTTP2 = os.environ.get("SUPABASE_HTTP2", "false").lower() == "true"
+
+_client: Optional[Client] = None
+_http_client: Optional[httpx.Client] = None
+# Async pool for streaming storage downloads straight through to clients
+_async_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _pool_options() -> dict:
+    return dict(
+        limits=httpx.Limits(
+            max_connections=SUPABASE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=SUPABASE_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(SUPABASE_HTTP_TIMEOUT, connect=SUPABASE_HTTP_CONNECT_TIMEOUT),
+        follow_redirects=True,
+        http2=SUPABASE_HTTP2,
+    )
+
+
+def create_http_client() -> httpx.Client:
+    """Build the keep-alive HTTP client shared by PostgREST, Storage and Auth."""
+    return httpx.Client(**_pool_options())
+
+
+def create_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(**_pool_options())
+
+
+def init_supabase() -> Client:
+    """Create the process-wide Supabase client. Safe to call more than once."""
+    global _client, _http_client
+    if _client is None:
+        if not SUPABASE_URL or not SUPABASE_SECRET_KEY:
+            raise ValueError("SUPABASE_URL and SUPABASE_SECRET_KEY must be set")
+        _http_client = create_http_client()
+        _client = create_client(
+            SUPABASE_URL,
+            SUPABASE_SECRET_KEY,
+            options=ClientOptions(
+                httpx_client=_http_client,
+                auto_refresh_token=False,
+                persist_session=False,
+            ),
+        )
+    return _client
+
+
+def close_supabase() -> None:
+    """Close pooled connections. Called from the lifespan hook on shutdown."""
+    global _client, _http_client
+    if _http_client is not None:
+        _http_client.close()
+    _client = None
+    _http_client = None
+
+
+def get_supabase_client() -> Client:
+    """Return the shared client for code that runs outside a request (scripts, internal helpers)."""
+    return _client if _client is not None else init_supabase()
+
+
+def get_http_client() -> httpx.Client:
+    """The pooled HTTP client behind the shared Supabase client, for Storage APIs the SDK does not wrap."""
+    get_supabase_client()
+    return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Shared async HTTP client for streaming Storage responses; created on first use."""
+    global _async_http_client
+    if _async_http_client is None:
+        _async_http_client = create_async_http_client()
+    return _async_http_client
+
+
+async def close_async_http_client() -> None:
+    global _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+    _async_http_client = None
+
+
+def get_supabase(request: Request) -> Client:
+    """FastAPI dependency returning the client created in the lifespan hook."""
+    client = getattr(request.app.state, "supabase", None)
+    return client if client is not None else get_supabase_client()
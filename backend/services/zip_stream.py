@@ -0,0 +1,80 @@
+"""
+ZIP archives written as a stream, for exports that should start downloading right away.
+Entries are stored uncompressed (MP3 does not compress further) and written chunk by chunk as their data
+arrives, with sizes and CRCs in data descriptors, so memory use does not depend on the archive size.
+"""
+import asyncio
+import time
+import zipfile
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class _Sink:
+    """Unseekable file object for ZipFile; collects what it writes until drained."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(entries: AsyncIterator[tuple[str, AsyncIterator[bytes]]]) -> AsyncIterator[bytes]:
+    """Yield the bytes of a ZIP_STORED archive of `(name, chunks)` entries, in order."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        async for name, chunks in entries:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            # Large enough for any size, since it is not known before the data has been written
+            with zf.open(info, "w", force_zip64=True) as entry:
+                async for chunk in chunks:
+                    entry.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+async def prefetch(
+    items: Iterable[T], fetch: Callable[[T], Awaitable[R]], concurrency: int
+) -> AsyncIterator[tuple[T, Optional[R]]]:
+    """
+    Yield `(item, await fetch(item))` in order while fetching up to `concurrency` items ahead,
+    so only that many results are held at once. Failed fetches yield None.
+    """
+    async def fetch_safely(item: T) -> Optional[R]:
+        try:
+            return await fetch(item)
+        except Exception as e:
+            print(f"Error fetching {item}: {e}")
+            return None
+
+    pending = iter(items)
+    window: deque = deque()
+    try:
+        while True:
+            for item in pending:
+                window.append((item, asyncio.create_task(fetch_safely(item))))
+                if len(window) >= concurrency:
+                    break
+            if not window:
+                return
+            item, task = window.popleft()
+            yield item, await task
+    finally:
+        # Client went away: stop the downloads still in flight
+        for _, task in window:
+            task.cancel()
@@ -0,0 +1,23 @@
+-- Create audio_renders table
+-- Content-addressed index of rendered ElevenLabs audio: identical composition requests
+-- (same final prompt and length) reuse the stored audio instead of composing again
+
+CREATE TABLE IF NOT EXISTS audio_renders (
+    content_hash TEXT PRIMARY KEY,
+    storage_path TEXT NOT NULL,
+    music_length_ms INTEGER NOT NULL,
+    size_bytes BIGINT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_audio_renders_created_at ON audio_renders(created_at DESC);
+
+-- Shared across users and only accessed by the backend (service role), so no user policies
+ALTER TABLE audio_renders ENABLE ROW LEVEL SECURITY;
+
+-- Add comments for documentation
+COMMENT ON TABLE audio_renders IS 'Rendered audio in the music bucket, keyed by a hash of the final ElevenLabs prompt and music_length_ms';
+COMMENT ON COLUMN audio_renders.content_hash IS 'SHA-256 of the prompt sent to ElevenLabs compose and the requested length';
+COMMENT ON COLUMN audio_renders.storage_path IS 'Path of the audio file in the music storage bucket';
+COMMENT ON COLUMN audio_renders.music_length_ms IS 'Requested track length in milliseconds';
+COMMENT ON COLUMN audio_renders.size_bytes IS 'Size of the stored audio file';
@@ -0,0 +1,8 @@
+-- Add cover_images column to final_compositions table
+-- Manifest of the album cover's resized WebP/JPEG derivatives, so list views can load a thumbnail
+-- instead of the full-size image
+
+ALTER TABLE final_compositions
+ADD COLUMN IF NOT EXISTS cover_images JSONB;
+
+COMMENT ON COLUMN final_compositions.cover_images IS 'Album cover derivatives: {"original": {path, url}, "images": [{width, height, format, path, url}], "srcset": {"webp": "...", "jpeg": "..."}}';
@@ -0,0 +1,8 @@
+-- Allow final_compositions.audio_path to be NULL
+-- Composed audio is moved from the music directory into the local audio cache once it is in storage,
+-- so there is often no lasting local path to record; the audio is reached through storage_path
+
+ALTER TABLE final_compositions
+ALTER COLUMN audio_path DROP NOT NULL;
+
+COMMENT ON COLUMN final_compositions.audio_path IS 'Local file path of the audio file in the music directory, if it was kept there (NULL once moved into the audio cache)';
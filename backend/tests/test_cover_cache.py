@@ -0,0 +1,108 @@
+"""
+Album cover prompt cache tests. Run from backend/: python -m unittest discover tests
+"""
+import asyncio
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from services import album_covers
+from services.cover_cache import CoverPromptCache, description_key, image_key
+
+
+def make_cache(**overrides) -> CoverPromptCache:
+    options = dict(enabled=True, max_entries=8, description_ttl_seconds=60, image_ttl_seconds=60)
+    options.update(overrides)
+    return CoverPromptCache(**options)
+
+
+class CoverPromptCacheTest(unittest.TestCase):
+    def test_description_key_ignores_case_and_whitespace(self):
+        self.assertEqual(
+            description_key("Night  Drive", "warm synths\n", "gemini"),
+            description_key("night drive", " Warm   synths", "gemini"),
+        )
+        self.assertNotEqual(description_key("Night Drive", "", "gemini"), description_key("Night Drive", "", "other"))
+        self.assertNotEqual(image_key("prompt", "imagen", 1), image_key("prompt", "imagen", 2))
+
+    def test_invalidate_drops_only_the_image_level(self):
+        cache = make_cache()
+        cache.put_description("d", "a neon skyline")
+        cache.put_images("i", [{"storage_path": "covers/a.png"}])
+        cache.invalidate_images("i")
+        cache.invalidate_images("i")
+        self.assertIsNone(cache.get_images("i"))
+        self.assertEqual(cache.get_description("d"), "a neon skyline")
+        stats = cache.stats()
+        self.assertEqual(stats["images"]["invalidations"], 1)
+        self.assertEqual(stats["images"]["size"], 0)
+
+    def test_disabled_cache_and_zero_ttl_store_nothing(self):
+        for cache in (make_cache(enabled=False), make_cache(image_ttl_seconds=0)):
+            cache.put_images("i", [{"storage_path": "covers/a.png"}])
+            self.assertIsNone(cache.get_images("i"))
+
+
+class CachedCoverInvalidationTest(unittest.TestCase):
+    """generate_album_cover_internal regenerates a cached cover once it is gone from the bucket."""
+
+    def setUp(self):
+        self.cache = make_cache()
+        self.stored = set()
+        self.generated = 0
+
+        async def agenerate(prompt, number_of_images=1, aspect_ratio="1:1"):
+            self.generated += 1
+            return [f"image {self.generated}".encode()]
+
+        async def ingest_cover(storage, image_data):
+            path = f"covers/{image_data.decode().replace(' ', '-')}.png"
+            self.stored.add(path)
+            return {"storage_path": path, "cover_image_url": f"https://covers/{path}", "cover_images": None}
+
+        storage = mock.Mock()
+        storage.exists = mock.AsyncMock(side_effect=lambda path: path in self.stored)
+        gemini = mock.Mock()
+        gemini.preferred = mock.AsyncMock(return_value="gemini")
+        gemini.generate_content = mock.AsyncMock(return_value=SimpleNamespace(text="a neon skyline"))
+
+        for target, value in (
+            ("cover_cache", self.cache),
+            ("GEMINI_AVAILABLE", True),
+            ("gemini_models", gemini),
+            ("image_backend", SimpleNamespace(name="test", agenerate=agenerate)),
+            ("ingest_cover", ingest_cover),
+            ("StorageRepository", mock.Mock(return_value=storage)),
+        ):
+            patcher = mock.patch.object(album_covers, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(os.environ, {"GEMINI_API_KEY": "test"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate(self) -> dict:
+        return asyncio.run(album_covers.generate_album_cover_internal("Night Drive", "warm synths", supabase=object()))
+
+    def test_cached_cover_is_reused_while_it_exists(self):
+        first = self.generate()
+        second = self.generate()
+        self.assertEqual(self.generated, 1)
+        self.assertEqual(second["storage_path"], first["storage_path"])
+
+    def test_deleted_cover_is_invalidated_and_generated_again(self):
+        first = self.generate()
+        self.stored.discard(first["storage_path"])
+        second = self.generate()
+        self.assertEqual(self.generated, 2)
+        self.assertNotEqual(second["storage_path"], first["storage_path"])
+        self.assertEqual(self.cache.stats()["images"]["invalidations"], 1)
+        # The regenerated cover is cached in its place, and the description was never requested again
+        self.assertEqual(self.generate()["storage_path"], second["storage_path"])
+        self.assertEqual(self.generated, 2)
+        self.assertEqual(album_covers.gemini_models.generate_content.await_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Job journal lease tests. Run from backend/: python -m unittest discover tests
+"""
+import os
+import tempfile
+import time
+import unittest
+
+from services.job_journal import JobJournal, LeaseLost
+from services.jobs import Job
+
+
+class JobJournalLeaseTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.journal = JobJournal(os.path.join(self.dir.name, "jobs.sqlite3"))
+
+    def add(self, lease_until: float, owner: str = "first") -> Job:
+        job = Job("test", "alice", {"n": 1})
+        self.journal.add(job, owner, lease_until)
+        return job
+
+    def test_live_lease_is_not_claimed(self):
+        self.add(time.time() + 60)
+        self.assertEqual(self.journal.claim_expired("test", "second", time.time() + 60), [])
+
+    def test_expired_lease_is_claimed_once(self):
+        job = self.add(time.time() - 1)
+        job.checkpoints["fetch_plan"] = {"title": "a"}
+        self.journal.save(job, "first")
+
+        claimed = self.journal.claim_expired("test", "second", time.time() + 60)
+        self.assertEqual([row["id"] for row in claimed], [job.id])
+        self.assertEqual(claimed[0]["checkpoints"], {"fetch_plan": {"title": "a"}})
+        self.assertEqual(self.journal.claim_expired("test", "third", time.time() + 60), [])
+        self.assertEqual(self.journal.get(job.id)["lease_owner"], "second")
+
+    def test_previous_owner_cannot_save_after_a_claim(self):
+        job = self.add(time.time() - 1)
+        self.journal.claim_expired("test", "second", time.time() + 60)
+        job.stage = "compose"
+        with self.assertRaises(LeaseLost):
+            self.journal.save(job, "first")
+        self.journal.save(job, "second")
+        self.assertEqual(self.journal.get(job.id)["stage"], "compose")
+
+    def test_renew_and_release(self):
+        job = self.add(time.time() + 0.01)
+        self.journal.renew("first", [job.id], time.time() + 60)
+        time.sleep(0.02)
+        self.assertEqual(self.journal.claim_expired("test", "second", time.time() + 60), [])
+        # Renewing someone else's lease has no effect
+        self.journal.release("second", [job.id])
+        self.assertEqual(self.journal.claim_expired("test", "second", time.time() + 60), [])
+        self.journal.release("first", [job.id])
+        self.assertEqual(len(self.journal.claim_expired("test", "second", time.time() + 60)), 1)
+
+    def test_finished_jobs_are_not_claimed(self):
+        job = self.add(time.time() - 1)
+        job.status = "succeeded"
+        self.journal.save(job, "first")
+        self.assertEqual(self.journal.claim_expired("test", "second", time.time() + 60), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
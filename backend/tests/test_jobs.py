@@ -0,0 +1,82 @@
+"""
+Job queue scheduling tests. Run from backend/: python -m unittest discover tests
+"""
+import asyncio
+import unittest
+
+from services.jobs import JobQueue, QueueFull
+
+
+def make_queue(handler, workers: int = 1, max_queued: int = 100, max_pending_per_user: int = 10) -> JobQueue:
+    return JobQueue(
+        kind="test", handler=handler, workers=workers, max_queued=max_queued,
+        max_pending_per_user=max_pending_per_user, retention_seconds=60, drain_seconds=1,
+    )
+
+
+class RoundRobinTest(unittest.TestCase):
+    def test_users_take_turns(self):
+        order = []
+
+        async def handler(job):
+            order.append((job.user_id, job.payload["n"]))
+            return {}
+
+        async def main():
+            queue = make_queue(handler)
+            jobs = [await queue.submit("alice", {"n": n}) for n in range(3)]
+            jobs.append(await queue.submit("bob", {"n": 0}))
+            jobs.append(await queue.submit("carol", {"n": 0}))
+            await queue.start()
+            for job in jobs:
+                async for _ in job.follow():
+                    pass
+            await queue.stop()
+
+        asyncio.run(main())
+        self.assertEqual(order, [("alice", 0), ("bob", 0), ("carol", 0), ("alice", 1), ("alice", 2)])
+
+
+class LimitsTest(unittest.TestCase):
+    def test_per_user_pending_limit(self):
+        async def main():
+            done = asyncio.Event()
+
+            async def handler(job):
+                await done.wait()
+                return {}
+
+            queue = make_queue(handler, max_pending_per_user=2)
+            await queue.start()
+            first = await queue.submit("alice", {})
+            await queue.submit("alice", {})
+            with self.assertRaises(QueueFull):
+                await queue.submit("alice", {})
+            # Other users are not affected by alice's share
+            await queue.submit("bob", {})
+
+            done.set()
+            async for _ in first.follow():
+                pass
+            # A finished job frees a slot
+            await queue.submit("alice", {})
+            await queue.stop()
+
+        asyncio.run(main())
+
+    def test_queue_limit(self):
+        async def handler(job):
+            return {}
+
+        async def main():
+            queue = make_queue(handler, max_queued=2)
+            await queue.submit("alice", {})
+            await queue.submit("bob", {})
+            with self.assertRaises(QueueFull):
+                await queue.submit("carol", {})
+
+        asyncio.run(main())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Incremental JSON parser tests. Run from backend/: python -m unittest discover tests
+"""
+import json
+import unittest
+
+from services.json_stream import IncrementalJSONParser
+
+DOCUMENT = {
+    "title": "Split \"quotes\", {braces} and [brackets]",
+    "bpm": 92,
+    "explicit": False,
+    "styles": ["pop", "warm synths"],
+    "lyrics": {
+        "Verse 1": ["Counting requests in the dark", "Every packet leaves a mark"],
+        "Chorus": ["Faster, faster"],
+    },
+    "notes": None,
+}
+
+
+def parse_in_chunks(text: str, size: int, expand=()) -> list:
+    parser = IncrementalJSONParser(expand=expand)
+    events = []
+    for start in range(0, len(text), size):
+        events += parser.feed(text[start:start + size])
+    return events
+
+
+class IncrementalJSONParserTest(unittest.TestCase):
+    def test_top_level_members_whatever_the_chunk_boundaries(self):
+        text = json.dumps(DOCUMENT, indent=2)
+        expected = [((key,), value) for key, value in DOCUMENT.items()]
+        for size in (1, 2, 3, 7, 16, len(text)):
+            with self.subTest(chunk_size=size):
+                self.assertEqual(parse_in_chunks(text, size), expected)
+
+    def test_expanded_members_are_reported_before_their_parent(self):
+        events = parse_in_chunks(json.dumps(DOCUMENT), 5, expand=[("lyrics",)])
+        paths = [path for path, _ in events]
+        self.assertLess(paths.index(("lyrics", "Verse 1")), paths.index(("lyrics", "Chorus")))
+        self.assertLess(paths.index(("lyrics", "Chorus")), paths.index(("lyrics",)))
+        self.assertIn((("lyrics", "Chorus"), ["Faster, faster"]), events)
+        self.assertNotIn(("styles", 0), paths)
+
+    def test_member_is_reported_by_the_chunk_that_completes_it(self):
+        parser = IncrementalJSONParser()
+        self.assertEqual(parser.feed('{"title": "Half a ti'), [])
+        self.assertEqual(parser.feed('tle", "bp'), [(("title",), "Half a title")])
+        self.assertEqual(parser.feed('m": 120'), [])
+        self.assertEqual(parser.feed("}"), [(("bpm",), 120)])
+
+
+if __name__ == "__main__":
+    unittest.main()
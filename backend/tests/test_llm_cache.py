@@ -0,0 +1,84 @@
+"""
+LLM response cache tests. Run from backend/: python -m unittest discover tests
+"""
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from services.llm_cache import LLMResponseCache, cache_key
+
+
+class LLMResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "llm_cache.sqlite3")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def make_cache(self, **overrides) -> LLMResponseCache:
+        options = dict(
+            path=self.path, enabled=True, endpoints={"*"},
+            memory_entries=8, disk_max_entries=100, max_age_seconds=60,
+        )
+        options.update(overrides)
+        return LLMResponseCache(**options)
+
+    def disk_keys(self) -> set:
+        with sqlite3.connect(self.path) as db:
+            return {key for (key,) in db.execute("SELECT key FROM responses")}
+
+    def test_key_covers_every_input(self):
+        base = cache_key("gpt", 0.7, "system", "user")
+        self.assertEqual(base, cache_key("gpt", 0.7, "system", "user"))
+        for other in (("gpt2", 0.7, "system", "user"), ("gpt", 0.2, "system", "user"),
+                      ("gpt", 0.7, "other", "user"), ("gpt", 0.7, "system", "other")):
+            self.assertNotEqual(base, cache_key(*other))
+
+    def test_entries_expire_after_max_age_in_both_tiers(self):
+        cache = self.make_cache()
+        now = time.time()
+        with mock.patch("services.llm_cache.time.time", return_value=now):
+            cache.put("plan", "k", {"title": "a"})
+            self.assertEqual(cache.get("plan", "k"), {"title": "a"})
+        with mock.patch("services.llm_cache.time.time", return_value=now + 61):
+            self.assertIsNone(cache.get("plan", "k"))
+        # A fresh process only has the SQLite tier, which applies the same age limit
+        with mock.patch("services.llm_cache.time.time", return_value=now + 61):
+            self.assertIsNone(self.make_cache().get("plan", "k"))
+        self.assertEqual(cache.stats()["endpoints"]["plan"]["misses"], 1)
+
+    def test_disk_tier_survives_a_restart(self):
+        self.make_cache().put("plan", "k", [1, 2])
+        cache = self.make_cache()
+        self.assertEqual(cache.get("plan", "k"), [1, 2])
+        self.assertEqual(cache.stats()["endpoints"]["plan"]["disk_hits"], 1)
+        self.assertEqual(cache.get("plan", "k"), [1, 2])
+        self.assertEqual(cache.stats()["endpoints"]["plan"]["memory_hits"], 1)
+
+    def test_least_recently_used_rows_are_evicted_past_the_disk_limit(self):
+        cache = self.make_cache(disk_max_entries=2)
+        now = time.time()
+        for offset, key in enumerate(("a", "b")):
+            with mock.patch("services.llm_cache.time.time", return_value=now + offset):
+                cache.put("plan", key, key)
+        # Read "a" through the SQLite tier so it becomes the most recently used row
+        with mock.patch("services.llm_cache.time.time", return_value=now + 2):
+            self.assertEqual(self.make_cache().get("plan", "a"), "a")
+        with mock.patch("services.llm_cache.time.time", return_value=now + 3):
+            cache.put("plan", "c", "c")
+        self.assertEqual(self.disk_keys(), {"a", "c"})
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_endpoint_allow_list(self):
+        cache = self.make_cache(endpoints={"composition-plan"})
+        self.assertTrue(cache.enabled_for("composition-plan"))
+        self.assertFalse(cache.enabled_for("lyrics-substitution"))
+        self.assertFalse(self.make_cache(enabled=False).enabled_for("composition-plan"))
+
+
+if __name__ == "__main__":
+    unittest.main()
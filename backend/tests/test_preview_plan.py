@@ -0,0 +1,63 @@
+"""
+Preview clip tests. Run from backend/: python -m unittest discover tests
+"""
+import os
+import unittest
+
+os.environ.setdefault("ELEVENLABS_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("MUSIC_JOB_JOURNAL_ENABLED", "false")
+
+from services.music_generation import MIN_SECTION_MS, preview_plan
+
+
+def section(name: str, duration_ms: int, lines: int) -> dict:
+    return {"section_name": name, "duration_ms": duration_ms, "lines": [f"{name} {i}" for i in range(lines)]}
+
+
+PLAN = {
+    "positive_global_styles": ["pop"],
+    "sections": [section("Intro", 8000, 0), section("Verse 1", 20000, 4), section("Chorus", 24000, 8),
+                 section("Verse 2", 20000, 4), section("Chorus", 24000, 8)],
+}
+
+
+class PreviewPlanTest(unittest.TestCase):
+    def test_first_chorus_is_trimmed_with_its_lines(self):
+        clip, length_ms = preview_plan(PLAN, 12000)
+        self.assertEqual(length_ms, 12000)
+        self.assertEqual(clip["positive_global_styles"], ["pop"])
+        self.assertEqual(len(clip["sections"]), 1)
+        chosen = clip["sections"][0]
+        self.assertEqual(chosen["section_name"], "Chorus")
+        self.assertEqual(chosen["duration_ms"], 12000)
+        self.assertEqual(chosen["lines"], ["Chorus 0", "Chorus 1", "Chorus 2", "Chorus 3"])
+        # The full plan is left as it was
+        self.assertEqual(len(PLAN["sections"]), 5)
+        self.assertEqual(PLAN["sections"][2]["duration_ms"], 24000)
+
+    def test_hook_counts_as_a_chorus(self):
+        plan = {"sections": [section("Verse", 20000, 4), section("Hook", 10000, 2)]}
+        clip, length_ms = preview_plan(plan, 12000)
+        self.assertEqual(clip["sections"][0]["section_name"], "Hook")
+        # Shorter than the preview length: kept whole
+        self.assertEqual(length_ms, 10000)
+        self.assertEqual(len(clip["sections"][0]["lines"]), 2)
+
+    def test_middle_section_without_a_chorus(self):
+        plan = {"sections": [section("Verse 1", 20000, 4), section("Bridge", 20000, 4), section("Outro", 20000, 4)]}
+        clip, _ = preview_plan(plan, 12000)
+        self.assertEqual(clip["sections"][0]["section_name"], "Bridge")
+
+    def test_clip_is_never_shorter_than_a_section_allows(self):
+        clip, length_ms = preview_plan(PLAN, 1)
+        self.assertEqual(length_ms, MIN_SECTION_MS)
+        self.assertEqual(len(clip["sections"][0]["lines"]), 1)
+
+    def test_plan_without_sections(self):
+        plan = {"prompt": "a warm pop song"}
+        self.assertEqual(preview_plan(plan, 12000), (plan, 12000))
+
+
+if __name__ == "__main__":
+    unittest.main()
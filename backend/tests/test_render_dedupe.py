@@ -0,0 +1,57 @@
+"""
+Render dedupe tests. Run from backend/: python -m unittest discover tests
+"""
+import asyncio
+import os
+import unittest
+
+os.environ.setdefault("ELEVENLABS_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("MUSIC_JOB_JOURNAL_ENABLED", "false")
+
+from services import music_generation
+from services.music_generation import claim_render, release_render
+
+
+class ClaimRenderTest(unittest.TestCase):
+    def test_failed_render_is_retried_by_one_waiter(self):
+        composes = []
+        stored = {}
+
+        async def find():
+            await asyncio.sleep(0)
+            return stored.get("path")
+
+        async def job(index: int):
+            storage_path, rendered = await claim_render("hash", find)
+            if rendered is None:
+                return storage_path
+            composes.append(index)
+            await asyncio.sleep(0.01)
+            # The first render fails; the retry succeeds
+            storage_path = "renders/hash.mp3" if len(composes) > 1 else None
+            stored["path"] = storage_path
+            release_render("hash", rendered, storage_path)
+            return storage_path
+
+        async def main():
+            return await asyncio.gather(*(job(i) for i in range(5)))
+
+        results = asyncio.run(main())
+        self.assertEqual(len(composes), 2)
+        self.assertEqual(results.count(None), 1)
+        self.assertEqual(results.count("renders/hash.mp3"), 4)
+        self.assertEqual(music_generation._renders_in_flight, {})
+
+    def test_existing_render_is_reused_without_claiming(self):
+        async def find():
+            return "renders/hash.mp3"
+
+        storage_path, rendered = asyncio.run(claim_render("hash", find))
+        self.assertEqual(storage_path, "renders/hash.mp3")
+        self.assertIsNone(rendered)
+        self.assertEqual(music_generation._renders_in_flight, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
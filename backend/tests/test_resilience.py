@@ -0,0 +1,87 @@
+"""
+Circuit breaker regression tests. Run from backend/: python -m unittest discover tests
+"""
+import asyncio
+import time
+import unittest
+
+from services.resilience import ProviderPolicy, ProviderUnavailable
+
+
+def make_policy() -> ProviderPolicy:
+    return ProviderPolicy(
+        name="Test", max_attempts=1, base_delay=0, max_delay=0,
+        requests_per_minute=60_000, burst=100, failure_threshold=1, reset_seconds=0.05,
+    )
+
+
+async def fail():
+    raise TimeoutError("provider timed out")
+
+
+async def ok():
+    return "ok"
+
+
+class HalfOpenTrialTest(unittest.TestCase):
+    def open_and_wait(self, policy: ProviderPolicy) -> None:
+        with self.assertRaises(TimeoutError):
+            asyncio.run(policy.acall(fail))
+        self.assertEqual(policy.breaker.state, "open")
+        time.sleep(0.06)
+        self.assertEqual(policy.breaker.state, "half-open")
+
+    def test_cancelled_trial_releases_the_breaker(self):
+        policy = make_policy()
+        self.open_and_wait(policy)
+
+        async def cancel_trial():
+            started = asyncio.Event()
+
+            async def hang():
+                started.set()
+                await asyncio.sleep(10)
+
+            task = asyncio.create_task(policy.acall(hang))
+            await started.wait()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_trial())
+        # The next call is let through as the new trial and closes the breaker
+        self.assertEqual(asyncio.run(policy.acall(ok)), "ok")
+        self.assertEqual(policy.breaker.state, "closed")
+
+    def test_timed_out_trial_releases_the_breaker(self):
+        policy = make_policy()
+        self.open_and_wait(policy)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(policy.acall(lambda: asyncio.sleep(10)), 0.01))
+        self.assertEqual(asyncio.run(policy.acall(ok)), "ok")
+
+    def test_only_one_trial_at_a_time(self):
+        policy = make_policy()
+        self.open_and_wait(policy)
+
+        async def concurrent_trials():
+            release = asyncio.Event()
+
+            async def wait_for_release():
+                await release.wait()
+                return "ok"
+
+            trial = asyncio.create_task(policy.acall(wait_for_release))
+            await asyncio.sleep(0)
+            with self.assertRaises(ProviderUnavailable):
+                await policy.acall(ok)
+            release.set()
+            return await trial
+
+        self.assertEqual(asyncio.run(concurrent_trials()), "ok")
+        self.assertEqual(policy.breaker.state, "closed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Verified token cache tests. Run from backend/: python -m unittest discover tests
+"""
+import unittest
+from unittest import mock
+
+from services.auth import VerifiedTokenCache
+
+ALICE = {"user_id": "alice", "email": "alice@example.com"}
+BOB = {"user_id": "bob", "email": "bob@example.com"}
+
+
+class VerifiedTokenCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1_000_000.0
+        patcher = mock.patch("time.time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_entry_expires_at_the_token_exp(self):
+        cache = VerifiedTokenCache(max_size=10, ttl_seconds=300)
+        cache.put("token-a", {**ALICE, "token": "token-a"}, token_exp=self.now + 60)
+        self.now += 59
+        self.assertEqual(cache.get("token-a"), {**ALICE, "token": "token-a"})
+        self.now += 1
+        self.assertIsNone(cache.get("token-a"))
+
+    def test_entry_expires_at_the_ttl_before_a_later_exp(self):
+        cache = VerifiedTokenCache(max_size=10, ttl_seconds=30)
+        cache.put("token-a", ALICE, token_exp=self.now + 3600)
+        self.now += 31
+        self.assertIsNone(cache.get("token-a"))
+
+    def test_expired_or_disabled_entries_are_not_stored(self):
+        cache = VerifiedTokenCache(max_size=10, ttl_seconds=300)
+        cache.put("token-a", ALICE, token_exp=self.now - 1)
+        self.assertIsNone(cache.get("token-a"))
+        disabled = VerifiedTokenCache(max_size=10, ttl_seconds=0)
+        disabled.put("token-a", ALICE, token_exp=self.now + 60)
+        self.assertIsNone(disabled.get("token-a"))
+
+    def test_raw_tokens_are_not_stored(self):
+        cache = VerifiedTokenCache(max_size=10, ttl_seconds=300)
+        cache.put("token-a", {**ALICE, "token": "token-a"})
+        self.assertNotIn("token-a", repr(list(cache._entries.items())))
+
+    def test_revoke_user_drops_only_that_users_tokens(self):
+        cache = VerifiedTokenCache(max_size=10, ttl_seconds=300)
+        cache.put("token-a1", ALICE)
+        cache.put("token-a2", ALICE)
+        cache.put("token-b", BOB)
+        self.assertEqual(cache.revoke_user("alice"), 2)
+        self.assertIsNone(cache.get("token-a1"))
+        self.assertIsNone(cache.get("token-a2"))
+        self.assertEqual(cache.get("token-b")["user_id"], "bob")
+        self.assertEqual(cache.stats()["revocations"], 2)
+        self.assertTrue(cache.revoke("token-b"))
+        self.assertFalse(cache.revoke("token-b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
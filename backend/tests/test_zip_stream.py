@@ -0,0 +1,72 @@
+"""
+Streamed ZIP tests. Run from backend/: python -m unittest discover tests
+"""
+import asyncio
+import io
+import os
+import unittest
+import zipfile
+
+from services.zip_stream import prefetch, stream_zip
+
+FILES = {
+    "First Song.mp3": os.urandom(300_000),
+    "Second Song.mp3": b"",
+    "covers/Third.png": b"\x89PNG" * 1000,
+}
+
+
+async def chunked(data: bytes, size: int = 64 * 1024):
+    for start in range(0, len(data), size):
+        await asyncio.sleep(0)
+        yield data[start:start + size]
+
+
+async def entries():
+    for name, data in FILES.items():
+        yield name, chunked(data)
+
+
+async def collect(stream) -> list:
+    return [item async for item in stream]
+
+
+class StreamZipTest(unittest.TestCase):
+    def test_archive_reads_back(self):
+        data = b"".join(asyncio.run(collect(stream_zip(entries()))))
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist(), list(FILES))
+            for name, content in FILES.items():
+                self.assertEqual(zf.read(name), content)
+                self.assertEqual(zf.getinfo(name).compress_type, zipfile.ZIP_STORED)
+
+    def test_bytes_are_yielded_while_entries_are_written(self):
+        chunks = [chunk for chunk in asyncio.run(collect(stream_zip(entries()))) if chunk]
+        # The 300 kB entry arrives in 64 kB pieces rather than as one buffered archive
+        self.assertGreater(len(chunks), 5)
+        self.assertLess(max(len(chunk) for chunk in chunks), 100_000)
+
+
+class PrefetchTest(unittest.TestCase):
+    def test_results_in_order_with_bounded_concurrency(self):
+        running = 0
+        peak = 0
+
+        async def fetch(n: int) -> int:
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01 * (5 - n))
+            running -= 1
+            if n == 3:
+                raise RuntimeError("download failed")
+            return n * 10
+
+        results = asyncio.run(collect(prefetch(range(5), fetch, concurrency=2)))
+        self.assertEqual(results, [(0, 0), (1, 10), (2, 20), (3, None), (4, 40)])
+        self.assertLessEqual(peak, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
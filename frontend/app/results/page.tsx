@@ -128,8 +128,8 @@ function ResultsPageContent() {
   const saveTimeoutRefB = useRef<NodeJS.Timeout | null>(null);
   const [isGeneratingMusicA, setIsGeneratingMusicA] = useState(false);
   const [isGeneratingMusicB, setIsGeneratingMusicB] = useState(false);
-  const [generatedMusicA, setGeneratedMusicA] = useState<{ audio_path: string; audio_filename: string } | null>(null);
-  const [generatedMusicB, setGeneratedMusicB] = useState<{ audio_path: string; audio_filename: string } | null>(null);
+  const [generatedMusicA, setGeneratedMusicA] = useState<{ audio_path: string | null; audio_filename: string } | null>(null);
+  const [generatedMusicB, setGeneratedMusicB] = useState<{ audio_path: string | null; audio_filename: string } | null>(null);
 
   useEffect(() => {
     const loadCompositions = async () => {
@@ -312,7 +312,7 @@ function ResultsPageContent() {
       const result = await backendApi.generateFinalComposition({
         composition_plan_id: compositionId,
         run_id: runId,
-      }) as { audio_path: string; audio_filename: string; id: number };
+      }) as { audio_path: string | null; audio_filename: string; id: number };
 
       if (version === "A") {
         setGeneratedMusicA({
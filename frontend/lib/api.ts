@@ -66,6 +66,35 @@ export async function apiRequest<T>(
   return response.json();
 }
 
+/**
+ * Background generation job as returned by /generate-music/jobs/{job_id}
+ */
+interface GenerationJob {
+  job_id: string;
+  status: "queued" | "running" | "succeeded" | "failed";
+  stage: string | null;
+  result: Record<string, any> | null;
+  error: string | null;
+}
+
+const JOB_POLL_INTERVAL_MS = 2000;
+
+/**
+ * Poll a generation job until it finishes; resolves with its result
+ */
+async function waitForGenerationJob(jobId: string): Promise<Record<string, any>> {
+  while (true) {
+    const job = await apiRequest<GenerationJob>(`/generate-music/jobs/${jobId}`);
+    if (job.status === "succeeded") {
+      return job.result ?? {};
+    }
+    if (job.status === "failed") {
+      throw new Error(job.error || "Music generation failed");
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+}
+
 // Example API calls
 export const backendApi = {
   // Test endpoint
@@ -130,10 +159,12 @@ export const backendApi = {
       }
       data.user_id = userId;
     }
-    return apiRequest("/generate-music/generate-final-composition", {
+    // The backend queues the generation as a job; poll it until the track is ready
+    const job = await apiRequest<GenerationJob>("/generate-music/generate-final-composition", {
       method: "POST",
       body: JSON.stringify(data),
     });
+    return waitForGenerationJob(job.job_id);
   },
   
   // Update composition plan